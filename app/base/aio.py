@@ -0,0 +1,114 @@
+"""
+asyncio front end for the blocking DB methods. Reads run on a bounded pool of reader
+threads and writes on a single writer thread, so writes are serialized while reads
+run in parallel (SQLite releases the GIL while it executes, and WAL lets readers
+run during a write). Each worker thread has its own connection from a dedicated pool.
+
+Cancelling the awaiting task, or hitting its timeout, interrupts the statement the
+worker is running; a call that hasn't started yet is dropped.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.base import connection
+from app.base.connection import ConnectionPool, bind_pool, db_connection
+from app.base.logger import logger
+
+
+class AsyncExecutor:
+    def __init__(self, readers: int = 4, timeout: Optional[float] = None):
+        if readers < 1:
+            raise ValueError("readers must be at least 1")
+        self.readers = readers
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._running: dict[object, object] = {}
+        self._pool: Optional[ConnectionPool] = None
+        self._read_executor: Optional[ThreadPoolExecutor] = None
+        self._write_executor: Optional[ThreadPoolExecutor] = None
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                return
+            shared = connection._pool
+            # one connection per reader thread plus the writer's, on the shared pool's database
+            self._pool = ConnectionPool(
+                self.readers + 1,
+                shared.timeout,
+                shared.database,
+                shared.profile,
+                factory=shared.factory,
+            )
+            self._read_executor = ThreadPoolExecutor(
+                self.readers, "db-reader", initializer=bind_pool, initargs=(self._pool,)
+            )
+            self._write_executor = ThreadPoolExecutor(
+                1, "db-writer", initializer=bind_pool, initargs=(self._pool,)
+            )
+            logger.info("async executor started with %d readers", self.readers)
+
+    def _run(self, token: object, fn: Callable, args: tuple, kwargs: dict):
+        # the outer checkout makes the call one unit: committed if it returns, rolled back if it raises
+        with db_connection() as conn:
+            with self._lock:
+                self._running[token] = conn
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    del self._running[token]
+
+    async def _submit(self, executor_name: str, fn: Callable, args, kwargs, timeout):
+        self._start()
+        executor = getattr(self, executor_name)
+        token = object()
+        future = executor.submit(self._run, token, fn, args, kwargs)
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            future.cancel()
+            with self._lock:
+                conn = self._running.get(token)
+                if conn is not None:
+                    logger.info("interrupting %s", getattr(fn, "__qualname__", fn))
+                    conn.interrupt()
+            raise
+
+    async def read(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """Runs fn(*args, **kwargs) on a reader thread. timeout defaults to the executor's."""
+        return await self._submit("_read_executor", fn, args, kwargs, timeout)
+
+    async def write(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """Runs fn(*args, **kwargs) on the writer thread, after the writes queued before it."""
+        return await self._submit("_write_executor", fn, args, kwargs, timeout)
+
+    def close(self) -> None:
+        """Waits for the queued calls, stops the threads and closes their connections."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            executors = self._read_executor, self._write_executor
+            self._read_executor = self._write_executor = None
+        if pool is None:
+            return
+        for executor in executors:
+            executor.shutdown(wait=True)
+        pool.close()
+
+
+async_executor = AsyncExecutor()
+
+
+def configure_async(readers: int = 4, timeout: Optional[float] = None) -> AsyncExecutor:
+    """
+    Replaces the shared executor, closing the old one. The worker connections use the
+    database and storage profile the shared pool has when the first call is made.
+    """
+    global async_executor
+    old, async_executor = async_executor, AsyncExecutor(readers, timeout)
+    old.close()
+    return async_executor
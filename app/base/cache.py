@@ -0,0 +1,114 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Hashable, Iterable, Optional
+
+
+class QueryCache:
+    """
+    LRU cache of query results keyed on (model, normalized SQL, params). Every entry
+    is tagged with the tables it read so writes can drop just the affected entries.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = 60.0, enabled: bool = False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries: OrderedDict[Hashable, tuple[float, frozenset, list]] = OrderedDict()
+        self._by_table: dict[str, set] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def key(model: str, query: str, params: Iterable) -> tuple:
+        return (model, " ".join(query.split()), tuple(params))
+
+    def version(self) -> int:
+        """Changes on every invalidation. Pass it to put() to skip storing results a write raced with."""
+        return self._version
+
+    def get(self, key: Hashable) -> Optional[list]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            expires, _, rows = entry
+            if expires and expires < time.monotonic():
+                self._remove(key)
+                self._stats["misses"] += 1
+                self._stats["evictions"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return rows
+
+    def put(self, key: Hashable, tables: Iterable[str], rows: list, version: int = None) -> None:
+        if not self.enabled or self.max_size < 1:
+            return
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if key in self._entries:
+                self._remove(key)
+
+            tables = frozenset(tables)
+            expires = time.monotonic() + self.ttl if self.ttl else 0
+            self._entries[key] = (expires, tables, rows)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, tables: Iterable[str]) -> None:
+        with self._lock:
+            self._version += 1
+            for table in tables:
+                for key in list(self._by_table.get(table, ())):
+                    self._remove(key)
+                    self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._by_table.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "enabled": self.enabled,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, tables, _ = self._entries.pop(key)
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys:
+                keys.discard(key)
+
+
+query_cache = QueryCache()
+
+
+def configure_cache(enabled: bool = True, max_size: int = 256, ttl: Optional[float] = 60.0) -> QueryCache:
+    """Turns the result cache on or off and sets its bounds. A ttl of None keeps entries until evicted."""
+    query_cache.clear()
+    query_cache.enabled = enabled
+    query_cache.max_size = max_size
+    query_cache.ttl = ttl
+    return query_cache
+
+
+def cache_stats() -> dict:
+    return query_cache.stats()
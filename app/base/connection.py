@@ -1,12 +1,256 @@
 from pathlib import Path
 from contextlib import contextmanager
 import sqlite3
+import threading
+from time import perf_counter
+from typing import Optional
+from app.base.exceptions import PoolTimeoutError
+from app.base.profiler import profiler
 
 DATABASE_FILE = Path(__file__).parent.parent.parent / "database.db"
 
-@contextmanager
-def db_connection():
-    with sqlite3.connect(DATABASE_FILE) as conn:
+# PRAGMA profiles applied to every pooled connection. WAL lets readers keep
+# going while a writer commits; the profiles only differ in how hard they sync.
+PROFILES: dict[str, dict] = {
+    "default": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "bulk-load": {
+        "busy_timeout": 30000,
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256000,
+        "mmap_size": 268435456,
+        # the per row statement journals of the summary triggers get slower with table
+        # size inside insert_many's savepoints when kept in memory, see app.models.summaries
+        "temp_store": "FILE",
+    },
+}
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that remembers which PRAGMA profile it runs with."""
+
+    profile: Optional[str] = None
+
+
+def apply_profile(conn: sqlite3.Connection, profile: str) -> None:
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown storage profile. Valid profiles: {list(PROFILES)}")
+    for pragma, value in PROFILES[profile].items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    conn.profile = profile
+
+
+class ConnectionPool:
+    """
+    Pool of long-lived SQLite connections. A connection is owned by one thread
+    while checked out, and nested db_connection() calls in that thread reuse it.
+    """
+
+    def __init__(
+        self,
+        size: int = 5,
+        timeout: float = 30.0,
+        database=None,
+        profile: str = "default",
+        read_only: bool = False,
+        factory: type = PooledConnection,
+    ):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown storage profile. Valid profiles: {list(PROFILES)}")
+        self.size = size
+        self.profile = profile
+        self.timeout = timeout
+        self.database = database
+        self.read_only = read_only
+        self.factory = factory
+        self._idle: list[sqlite3.Connection] = []
+        self._open = 0
+        self._closed = False
+        self._lock = threading.Condition()
+        self._local = threading.local()
+        self._stats = {"hits": 0, "waits": 0, "opens": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        database = str(self.database or DATABASE_FILE)
+        uri = database.startswith("file:")
+        if self.read_only:
+            # mode=ro makes any write fail with "attempt to write a readonly database"
+            if not uri:
+                database, uri = Path(database).resolve().as_uri(), True
+            database += "&mode=ro" if "?" in database else "?mode=ro"
+        conn = sqlite3.connect(
+            database,
+            check_same_thread=False,
+            factory=self.factory,
+            uri=uri,
+        )
         conn.execute("PRAGMA foreign_keys = ON")
         conn.row_factory = sqlite3.Row
-        yield conn
\ No newline at end of file
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        conn = self._checkout()
+        if conn.profile != self.profile:
+            try:
+                apply_profile(conn, self.profile)
+            except Exception:
+                self.release(conn)
+                raise
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                self._stats["hits"] += 1
+                return self._idle.pop()
+
+            if self._open >= self.size:
+                self._stats["waits"] += 1
+                if not self._lock.wait_for(lambda: self._idle, self.timeout):
+                    raise PoolTimeoutError(
+                        f"No connection available after {self.timeout}s (pool size {self.size})"
+                    )
+                return self._idle.pop()
+
+            self._open += 1
+            self._stats["opens"] += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            if self._closed:
+                conn.close()
+                self._open -= 1
+                return
+            self._idle.append(conn)
+            self._lock.notify()
+
+    def close(self) -> None:
+        """Closes all idle connections. Checked out connections are closed on release."""
+        with self._lock:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._open -= len(self._idle)
+            self._idle.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "size": self.size,
+            }
+
+    @contextmanager
+    def connection(self):
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        start = perf_counter()
+        conn = self.acquire()
+        profiler.record_acquire(perf_counter() - start)
+        local.conn = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            local.conn = None
+            self.release(conn)
+
+
+_pool = ConnectionPool()
+
+
+def configure_pool(
+    size: int = 5, timeout: float = 30.0, database=None, factory: type = PooledConnection
+) -> ConnectionPool:
+    """
+    Replaces the shared pool, closing the idle connections of the old one.
+    database points the pool at another SQLite file (default DATABASE_FILE) or a
+    "file:" URI, and factory is the connection class, see app.base.replica.
+    """
+    global _pool
+    old, _pool = _pool, ConnectionPool(
+        size, timeout, database=database, profile=_pool.profile, factory=factory
+    )
+    old.close()
+    return _pool
+
+
+def set_storage_profile(profile: str) -> None:
+    """Selects the PRAGMA profile, applied to each connection on its next checkout."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown storage profile. Valid profiles: {list(PROFILES)}")
+    _pool.profile = profile
+
+
+def get_storage_profile() -> str:
+    return _pool.profile
+
+
+@contextmanager
+def storage_profile(profile: str):
+    """Runs the block with the given profile for the whole process, then restores it."""
+    previous = get_storage_profile()
+    set_storage_profile(profile)
+    try:
+        yield
+    finally:
+        set_storage_profile(previous)
+
+
+def pool_stats() -> dict:
+    return _pool.stats()
+
+
+def pool_database() -> str:
+    """The SQLite file or "file:" URI the shared pool connects to."""
+    return str(_pool.database or DATABASE_FILE)
+
+
+_thread_pool = threading.local()
+
+
+def bind_pool(pool: Optional[ConnectionPool]) -> None:
+    """
+    Makes db_connection() in the calling thread use pool instead of the shared one,
+    e.g. for worker threads with their own connections. None unbinds it.
+    """
+    _thread_pool.pool = pool
+
+
+@contextmanager
+def db_connection():
+    pool = getattr(_thread_pool, "pool", None) or _pool
+    with pool.connection() as conn:
+        yield conn
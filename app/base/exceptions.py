@@ -2,4 +2,10 @@ class ForeignKeyConstraintError(Exception):
     pass
 
 class DuplicatePrimaryKeyError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class PoolTimeoutError(Exception):
+    pass
+
+class ScheduleConflictError(Exception):
+    pass
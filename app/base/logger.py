@@ -1,4 +1,104 @@
-import  logging
+import atexit
+import json
+import logging
+import queue
+import sys
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
+from typing import Optional
 
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that enqueues the record as is. The stock prepare() formats the
+    message in the calling thread; here the listener's handlers do it, so the
+    arguments must not be changed after the logging call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+# Dev logs go through a queue so the thread running the query only pays for
+# enqueueing the record. Formatting and writing happen on the listener thread.
 logger = logging.getLogger("flightmanagement")
-logging.basicConfig(level=logging.INFO)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+_console = logging.StreamHandler()
+_console.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+_queue = queue.SimpleQueue()
+_listener = QueueListener(_queue, _console)
+logger.addHandler(DeferredQueueHandler(_queue))
+_listener.start()
+atexit.register(_listener.stop)
+
+# Structured query log, off by default. One JSON line per statement.
+query_logger = logging.getLogger("flightmanagement.queries")
+query_logger.setLevel(logging.INFO)
+query_logger.propagate = False
+query_logger.disabled = True
+
+_query_listener: Optional[QueueListener] = None
+
+
+class QueryLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(
+            {
+                "time": record.created,
+                "sql": record.sql,
+                "params": record.params,
+                "duration_ms": round(record.duration * 1000, 3),
+                "rowcount": record.rowcount,
+            },
+            default=str,
+        )
+
+
+def enable_query_log(path: Optional[str] = None, buffer_size: int = 1000) -> None:
+    """
+    Starts writing the query log to path (stderr if None). Records are queued and
+    written in batches of buffer_size by a background thread.
+    """
+    global _query_listener
+    disable_query_log()
+
+    target = logging.FileHandler(path) if path else logging.StreamHandler(sys.stderr)
+    target.setFormatter(QueryLogFormatter())
+    buffered = MemoryHandler(buffer_size, flushLevel=logging.ERROR, target=target)
+
+    log_queue = queue.SimpleQueue()
+    query_logger.handlers = [DeferredQueueHandler(log_queue)]
+    _query_listener = QueueListener(log_queue, buffered)
+    _query_listener.start()
+    query_logger.disabled = False
+
+
+def disable_query_log() -> None:
+    """Stops the query log, flushing anything still buffered."""
+    global _query_listener
+    query_logger.disabled = True
+    if _query_listener is not None:
+        _query_listener.stop()
+        for handler in _query_listener.handlers:
+            target = handler.target
+            handler.close()
+            target.close()
+        _query_listener = None
+    query_logger.handlers = []
+
+
+def log_query(sql: str, params, duration: float, rowcount: int) -> None:
+    if query_logger.isEnabledFor(logging.INFO):
+        query_logger.info(
+            sql,
+            extra={
+                "sql": sql,
+                "params": list(params) if params is not None else None,
+                "duration": duration,
+                "rowcount": rowcount,
+            },
+        )
+
+
+atexit.register(disable_query_log)
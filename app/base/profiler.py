@@ -0,0 +1,148 @@
+from collections import deque
+import math
+import re
+import sqlite3
+import threading
+from typing import Optional
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_FULL_SCAN = re.compile(r"^SCAN (\w+)\b(?! USING)")
+
+
+def normalize_sql(query: str) -> str:
+    """Reduces a statement to its shape: literals become ? and IN lists collapse to (?...)."""
+    query = _STRING.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    query = _PARAM_LIST.sub("(?...)", query)
+    return " ".join(query.split())
+
+
+def _percentile(values: list[float], p: float) -> float:
+    """Nearest rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class QueryProfiler:
+    """
+    Records timings per statement shape. Statements slower than slow_ms get their
+    EXPLAIN QUERY PLAN captured once per shape so full table scans can be flagged.
+    """
+
+    def __init__(self, enabled: bool = False, slow_ms: float = 50.0, explain: bool = True, samples: int = 10000):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.samples = samples
+        self._shapes: dict[str, dict] = {}
+        self._acquire: deque = deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        query: str,
+        params,
+        duration: float,
+        rowcount: int,
+        connection: Optional[sqlite3.Connection] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+
+        shape = normalize_sql(query)
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                stats = self._shapes[shape] = {
+                    "calls": 0,
+                    "rows": 0,
+                    "total": 0.0,
+                    "durations": deque(maxlen=self.samples),
+                    "plan": None,
+                }
+            stats["calls"] += 1
+            stats["rows"] += max(rowcount, 0)
+            stats["total"] += duration
+            stats["durations"].append(duration)
+            needs_plan = (
+                self.explain
+                and stats["plan"] is None
+                and connection is not None
+                and params is not None
+                and duration * 1000 >= self.slow_ms
+            )
+
+        if needs_plan:
+            plan = self._explain(connection, query, params)
+            with self._lock:
+                stats["plan"] = plan
+
+    def record_acquire(self, duration: float) -> None:
+        if self.enabled:
+            self._acquire.append(duration)
+
+    @staticmethod
+    def _explain(connection: sqlite3.Connection, query: str, params) -> list[str]:
+        try:
+            rows = connection.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            return [row[3] for row in rows]
+        except sqlite3.Error as e:
+            return [f"EXPLAIN failed: {e}"]
+
+    def report(self) -> list[dict]:
+        """Per shape timings in ms, slowest total first."""
+        with self._lock:
+            shapes = [(shape, dict(stats)) for shape, stats in self._shapes.items()]
+
+        report = []
+        for shape, stats in shapes:
+            durations = sorted(stats["durations"])
+            plan = stats["plan"] or []
+            full_scans = [m.group(1) for m in map(_FULL_SCAN.match, plan) if m]
+            report.append(
+                {
+                    "query": shape,
+                    "calls": stats["calls"],
+                    "rows": stats["rows"],
+                    "total_ms": round(stats["total"] * 1000, 3),
+                    "p50_ms": round(_percentile(durations, 50) * 1000, 3),
+                    "p95_ms": round(_percentile(durations, 95) * 1000, 3),
+                    "p99_ms": round(_percentile(durations, 99) * 1000, 3),
+                    "full_scan": ", ".join(full_scans) if stats["plan"] is not None else "?",
+                    "plan": plan,
+                }
+            )
+        return sorted(report, key=lambda r: r["total_ms"], reverse=True)
+
+    def acquire_stats(self) -> dict:
+        """Connection acquire wait times in ms."""
+        durations = sorted(self._acquire)
+        return {
+            "acquires": len(durations),
+            "p50_ms": round(_percentile(durations, 50) * 1000, 3),
+            "p95_ms": round(_percentile(durations, 95) * 1000, 3),
+            "p99_ms": round(_percentile(durations, 99) * 1000, 3),
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+            self._acquire.clear()
+
+
+profiler = QueryProfiler()
+
+
+def configure_profiler(enabled: bool = True, slow_ms: float = 50.0, explain: bool = True) -> QueryProfiler:
+    """Turns profiling on or off. Statements over slow_ms get their query plan captured when explain is set."""
+    profiler.enabled = enabled
+    profiler.slow_ms = slow_ms
+    profiler.explain = explain
+    return profiler
+
+
+def profile_report() -> list[dict]:
+    return profiler.report()
@@ -0,0 +1,390 @@
+"""
+In-memory hot replica of the database file. enable_replica copies the file into an
+in-process memdb database with the backup API and points the shared pool at it, so
+reads never touch the disk or the OS page cache. Writes go to memory, and what
+reaches the file depends on the durability level:
+
+    snapshot       the memory copy is backed up to the file every snapshot_interval
+                   seconds and on disable_replica; a crash loses the writes since
+    journal        each committed transaction is also appended to a journal file,
+                   replayed on the next enable_replica after a crash (default)
+    fsync          journal, fsynced on every commit so it survives power loss
+    write-through  each committed transaction is replayed on the file before
+                   commit returns, so the file is always current
+
+The journal records the statements and parameters the pooled connections run, as
+JSON, not the pages, so it replays correctly only for deterministic statements (no
+random() or CURRENT_TIMESTAMP), which is all the models use. It is truncated by every
+snapshot. In write-through mode a commit the file rejects (e.g. SQLITE_BUSY from another
+process, disk full) makes the replica copy the whole database over the file instead,
+and the commit raises if that fails too.
+
+memdb has no WAL, so reads wait while a write transaction is open and a commit waits
+for running reads (up to the profile's busy_timeout). The mode suits read-mostly
+processes whose database fits in memory.
+"""
+
+import atexit
+import base64
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator, Optional
+
+from app.base import connection
+from app.base.connection import PooledConnection, configure_pool
+from app.base.logger import logger
+
+DURABILITY = ("snapshot", "journal", "fsync", "write-through")
+
+# statements that never change the database and aren't journaled
+READ_ONLY = ("SELECT", "EXPLAIN")
+
+
+class ReplicaCursor(sqlite3.Cursor):
+    """Cursor that runs its statements through ReplicaConnection._run."""
+
+    def execute(self, sql, parameters=()):
+        self.connection._run(super().execute, sql, parameters, False)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        self.connection._run(super().executemany, sql, seq_of_parameters, True)
+        return self
+
+
+class ReplicaConnection(PooledConnection):
+    """
+    Pooled connection to the memory copy. The statements of a transaction are kept
+    until it commits, then handed to the replica as one journal entry, or dropped
+    on rollback. Only changes made through execute/executemany are recorded.
+
+    A write transaction holds the replica's lock from its first write until it ends.
+    memdb blocks new readers while a transaction holds the write lock, so SQLite
+    would serialize the writers anyway; doing it here keeps the journal in commit
+    order and lets a snapshot wait for a point with no transaction open.
+    """
+
+    replica: "MemoryReplica" = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending: list[tuple[str, object, bool]] = []
+        self._writing = False
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or ReplicaCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _run(self, run, sql: str, parameters, many: bool) -> None:
+        keyword = sql.lstrip()[:7].upper()
+        # of the pragmas only foreign_keys changes what later statements do
+        if keyword.startswith(READ_ONLY) or (
+            keyword.startswith("PRAGMA") and "FOREIGN_KEYS" not in sql.upper()
+        ):
+            run(sql, parameters)
+            return
+
+        if not self._writing:
+            self.replica.lock.acquire()
+            self._writing = True
+        try:
+            run(sql, parameters)
+        except BaseException:
+            self._end_write()
+            raise
+        if isinstance(parameters, list) and not many:
+            parameters = tuple(parameters)
+        self._pending.append((sql, parameters, many))
+        if not self.in_transaction:
+            # ran in autocommit mode (e.g. DDL) or ended the transaction itself
+            self.commit()
+
+    def _end_write(self) -> None:
+        if self._writing and not self.in_transaction:
+            self._writing = False
+            self.replica.lock.release()
+
+    def commit(self) -> None:
+        try:
+            super().commit()
+            entry, self._pending = self._pending, []
+            if entry:
+                self.replica.log(entry)
+        finally:
+            self._end_write()
+
+    def rollback(self) -> None:
+        try:
+            super().rollback()
+            self._pending = []
+        finally:
+            self._end_write()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+def replay(
+    conn: sqlite3.Connection, entry: list[tuple[str, object, bool]], strict: bool = False
+) -> None:
+    """
+    Runs a journal entry on conn and commits it. A failing statement is skipped, or
+    with strict rolls the entry back and raises.
+    """
+    for sql, parameters, many in entry:
+        try:
+            if many:
+                conn.executemany(sql, parameters)
+            else:
+                conn.execute(sql, parameters)
+        except sqlite3.Error as e:
+            if strict:
+                conn.rollback()
+                raise
+            # the statement failed when it first ran too, or the copies have diverged
+            logger.info("replayed statement failed: %s: %s", sql, e)
+    conn.commit()
+
+
+def _encode_value(value):
+    # JSON has no bytes, BLOB parameters are tagged
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Can't journal a {type(value).__name__} parameter")
+
+
+def _decode_value(value: dict):
+    if value.keys() == {"__bytes__"}:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+def encode_entry(entry: list[tuple[str, object, bool]]) -> bytes:
+    """A journal entry as JSON, which unlike pickle can't run code when read back."""
+    return json.dumps(entry, default=_encode_value, separators=(",", ":")).encode()
+
+
+def decode_entry(data: bytes) -> list[tuple[str, object, bool]]:
+    return [
+        (sql, parameters, many)
+        for sql, parameters, many in json.loads(data, object_hook=_decode_value)
+    ]
+
+
+class MemoryReplica:
+    def __init__(
+        self,
+        database,
+        durability: str = "journal",
+        snapshot_interval: Optional[float] = 60.0,
+        journal=None,
+    ):
+        if durability not in DURABILITY:
+            raise ValueError(f"Unknown durability. Valid levels: {list(DURABILITY)}")
+        self.database = str(database)
+        self.durability = durability
+        self.snapshot_interval = snapshot_interval
+        self.journal_path = Path(journal or f"{database}-replica-journal")
+        self.uri = f"file:/replica-{id(self)}?vfs=memdb"
+        self.lock = threading.RLock()
+        self.connection_class = type("ReplicaConnection", (ReplicaConnection,), {"replica": self})
+        self._memory: Optional[sqlite3.Connection] = None
+        self._disk: Optional[sqlite3.Connection] = None
+        self._journal = None
+        self._generation = 0
+        self._dirty = False
+        # a write-through commit didn't reach the file, the next snapshot fixes it
+        self._diverged = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self, database: str, uri: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(database, uri=uri, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return conn
+
+    def open(self) -> "MemoryReplica":
+        """Loads the file into memory and replays the journal left by a crash."""
+        # this connection keeps the memory database alive while the pool's come and go
+        self._memory = self._connect(self.uri, uri=True)
+        self._disk = self._connect(self.database)
+        self._load()
+        self._generation = self._memory.execute("PRAGMA user_version").fetchone()[0]
+        logger.info("loaded %s into memory", self.database)
+
+        replayed = 0
+        for entry in self._read_journal():
+            replay(self._memory, entry)
+            replayed += 1
+        if replayed:
+            logger.info("replayed %d journaled transactions", replayed)
+        # snapshots set the file's user_version to their generation once the backup
+        # is done. Until then the file has the memory copy's, which no journal uses.
+        self._generation += 1
+        self._memory.execute(f"PRAGMA user_version = {self._generation}")
+        if replayed or self.durability != "write-through":
+            self.snapshot(force=True)
+        if self.durability != "write-through" and self.snapshot_interval:
+            self._thread = threading.Thread(target=self._snapshot_loop, name="db-snapshot", daemon=True)
+            self._thread.start()
+        return self
+
+    def _load(self) -> None:
+        # a copy of a WAL file keeps the WAL flag in its header, which memdb can't open,
+        # so the pages go through a private in-memory database with the flag cleared
+        data = bytearray(self._disk.serialize())
+        if len(data) > 19:
+            data[18] = data[19] = 1
+        staging = sqlite3.connect(":memory:")
+        try:
+            staging.deserialize(data)
+            del data
+            staging.backup(self._memory)
+        finally:
+            staging.close()
+
+    def _read_journal(self) -> Iterator[list]:
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path, "rb") as f:
+            header = f.read(8)
+            # the journal only holds what came after the file's snapshot if the generations match
+            if len(header) < 8 or int.from_bytes(header, "big") != self._generation:
+                return
+            while header := f.read(4):
+                data = f.read(int.from_bytes(header, "big"))
+                if len(header) < 4 or len(data) < int.from_bytes(header, "big"):
+                    logger.info("ignoring a partly written journal entry")
+                    return
+                try:
+                    entry = decode_entry(data)
+                except ValueError:
+                    logger.info("ignoring an unreadable journal entry")
+                    return
+                yield entry
+
+    def log(self, entry: list) -> None:
+        """Makes a transaction just committed to memory durable. Called under lock."""
+        self._dirty = True
+        if self.durability == "write-through":
+            if not self._diverged:
+                try:
+                    replay(self._disk, entry, strict=True)
+                    return
+                except sqlite3.Error as e:
+                    logger.info("write-through failed, copying the whole database: %s", e)
+                    self._diverged = True
+            # raises if the file can't be written either, the next commit tries again
+            self.snapshot(force=True)
+        elif self._journal is not None:
+            data = encode_entry(entry)
+            self._journal.write(len(data).to_bytes(4, "big") + data)
+            self._journal.flush()
+            if self.durability == "fsync":
+                os.fsync(self._journal.fileno())
+
+    def snapshot(self, force: bool = False) -> bool:
+        """
+        Backs the memory copy up to the file and starts a new journal, unless nothing
+        changed since the last snapshot. Commits wait while it runs.
+        """
+        with self.lock:
+            if not (self._dirty or force):
+                return False
+            # the generation tells a journal written before this snapshot from one written after
+            self._generation += 1
+            self._memory.backup(self._disk)
+            self._disk.execute(f"PRAGMA user_version = {self._generation}")
+            self._disk.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self.durability in ("journal", "fsync"):
+                self._journal = open(self.journal_path, "wb")
+                self._journal.write(self._generation.to_bytes(8, "big"))
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+            else:
+                self.journal_path.unlink(missing_ok=True)
+            self._dirty = self._diverged = False
+        logger.info("snapshot %d of the memory copy written to %s", self._generation, self.database)
+        return True
+
+    def _snapshot_loop(self) -> None:
+        while not self._stop.wait(self.snapshot_interval):
+            try:
+                self.snapshot()
+            except sqlite3.Error as e:
+                logger.info("snapshot failed: %s", e)
+
+    def close(self) -> None:
+        """Stops the snapshots, writes a last one and releases the memory copy."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.durability != "write-through" or self._diverged:
+            self.snapshot()
+        with self.lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            self._memory.close()
+            self._disk.close()
+
+
+_replica: Optional[MemoryReplica] = None
+
+
+def enable_replica(
+    durability: str = "journal",
+    snapshot_interval: Optional[float] = 60.0,
+    journal=None,
+    size: int = 5,
+) -> MemoryReplica:
+    """
+    Serves db_connection() from a memory copy of the shared pool's database for the
+    rest of the process, or until disable_replica. snapshot_interval None only
+    snapshots on disable_replica and at exit. journal defaults to the database path
+    with -replica-journal appended.
+    """
+    global _replica
+    disable_replica()
+    shared = connection._pool
+    replica = MemoryReplica(
+        shared.database or connection.DATABASE_FILE, durability, snapshot_interval, journal
+    ).open()
+    configure_pool(size, shared.timeout, replica.uri, replica.connection_class)
+    _replica = replica
+    return replica
+
+
+def disable_replica() -> None:
+    """Writes a last snapshot and points the shared pool back at the file."""
+    global _replica
+    if _replica is None:
+        return
+    replica, _replica = _replica, None
+    shared = connection._pool
+    configure_pool(shared.size, shared.timeout, replica.database)
+    replica.close()
+
+
+def get_replica() -> Optional[MemoryReplica]:
+    return _replica
+
+
+atexit.register(disable_replica)
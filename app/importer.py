@@ -0,0 +1,319 @@
+"""
+Streaming import of JSON array, JSONL and CSV files into the model tables.
+
+The stages are generators, so a record is only read when the writer asks for the
+next one and memory stays bounded by the batch size whatever the file size:
+
+    parse -> coerce to the dataclass field types -> check foreign keys -> insert_many
+
+Records failing a stage are counted and optionally written to a rejects JSONL file
+instead of aborting the import.
+"""
+
+import csv
+import json
+import sqlite3
+from dataclasses import MISSING, dataclass, field
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Iterator, Optional, Type, get_args
+
+from app.base.connection import db_connection, storage_profile
+from app.base.exceptions import DuplicatePrimaryKeyError, ForeignKeyConstraintError
+from app.base.logger import logger
+from app.models.base_model import DB
+
+FORMATS = {".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv"}
+
+READ_SIZE = 1 << 16
+
+# a single JSON array item bigger than this is treated as a broken file
+MAX_ITEM_SIZE = 1 << 24
+
+
+class RejectedRecord(ValueError):
+    """A record that can't be imported. kind groups the rejects in the report."""
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+
+def iter_json_array(path, read_size: int = READ_SIZE) -> Iterator[dict]:
+    """
+    Yields the items of a top level JSON array one at a time, reading the file in chunks.
+    Raises ValueError on a malformed array, e.g. an empty element or a trailing comma.
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        buffer, pos, eof = "", 0, False
+
+        def next_char() -> str:
+            """Skips whitespace, reading more as needed. Returns the next character, '' at the end."""
+            nonlocal buffer, pos, eof
+            while True:
+                pos = _skip(buffer, pos)
+                if pos < len(buffer) or eof:
+                    return buffer[pos : pos + 1]
+                chunk = f.read(read_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+
+        if next_char() != "[":
+            raise ValueError(f"{path} is not a JSON array")
+        pos += 1
+        if next_char() == "]":
+            return
+        count = 0
+        while True:
+            if next_char() in (",", "]"):
+                raise ValueError(f"{path}: missing item after item {count}, empty element or trailing comma")
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # the item runs past the buffer, keep the unread part and read more
+                if eof or len(buffer) - pos > MAX_ITEM_SIZE:
+                    raise
+                chunk = f.read(read_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield item
+            count += 1
+            pos = end
+            if len(buffer) - pos < read_size // 2 and not eof:
+                chunk = f.read(read_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+
+            char = next_char()
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"{path}: expected , or ] after item {count}")
+            pos += 1
+
+
+def _skip(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and buffer[pos].isspace():
+        pos += 1
+    return pos
+
+
+def iter_jsonl(path) -> Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_csv(path) -> Iterator[dict]:
+    with open(path, newline="") as f:
+        yield from csv.DictReader(f)
+
+
+READERS = {"json": iter_json_array, "jsonl": iter_jsonl, "csv": iter_csv}
+
+
+def read_records(path, file_format: str = None) -> Iterator[dict]:
+    """Picks the reader from file_format or the file extension."""
+    file_format = file_format or FORMATS.get(Path(path).suffix.lower())
+    if file_format not in READERS:
+        raise ValueError(f"Unknown file format for {path}. Valid formats: {list(READERS)}")
+    return READERS[file_format](path)
+
+
+def _coercers(model: Type[DB]) -> dict[str, tuple[Callable, bool, bool]]:
+    """Maps each field to (converter, nullable, required), from the dataclass field types."""
+    columns = DB.get_meta(model).condition_columns
+    coercers = {}
+    for f in DB.get_class_fields(model):
+        col_type = columns[f.name][1]
+        nullable = type(None) in get_args(f.type)
+        required = f.default is MISSING and f.default_factory is MISSING
+        if f.metadata.get("datetime"):
+            convert = _to_datetime
+        elif col_type in (int, float):
+            convert = _to_number(col_type)
+        elif col_type is str:
+            convert = str
+        else:
+            convert = lambda value: value
+        coercers[f.name] = (convert, nullable, required)
+    return coercers
+
+
+def _to_number(col_type: type) -> Callable:
+    def convert(value):
+        if isinstance(value, bool):
+            raise ValueError(f"{value!r} is not a number")
+        if col_type is int and isinstance(value, float) and not value.is_integer():
+            raise ValueError(f"{value!r} is not an integer")
+        return col_type(value.strip() if isinstance(value, str) else value)
+
+    return convert
+
+
+def _to_datetime(value) -> str:
+    value = str(value).strip()
+    parsed = datetime.fromisoformat(value)
+    # most feeds already use the stored format, only reformat the others
+    if len(value) == 19 and value[10] == " ":
+        return value
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def coerce(record: dict, coercers: dict) -> dict:
+    """Returns record with every value converted to its field type, or raises RejectedRecord."""
+    unknown = record.keys() - coercers.keys()
+    if unknown:
+        raise RejectedRecord("unknown columns", f"unknown columns {sorted(unknown)}")
+
+    row = {}
+    for name, (convert, nullable, required) in coercers.items():
+        value = record.get(name)
+        if value is None or value == "":
+            if required and not nullable:
+                raise RejectedRecord(f"missing {name}", f"missing {name}")
+            if name in record:
+                row[name] = None
+            continue
+        try:
+            row[name] = convert(value)
+        except (TypeError, ValueError) as e:
+            raise RejectedRecord(f"bad {name}", f"bad {name} {value!r}: {e}")
+    return row
+
+
+class ParentKeys:
+    """Cached primary key sets of the parent tables, loaded on first use."""
+
+    def __init__(self):
+        self._keys: dict[tuple[str, str], set] = {}
+
+    def get(self, table: str, column: str) -> set:
+        if (table, column) not in self._keys:
+            with db_connection() as connection:
+                self._keys[table, column] = {
+                    row[0] for row in connection.execute(f"SELECT {column} FROM {table}")
+                }
+            logger.info("cached %d keys of %s.%s", len(self._keys[table, column]), table, column)
+        return self._keys[table, column]
+
+    def add(self, table: str, column: str, keys) -> None:
+        """Adds just imported keys, if that table's keys are cached."""
+        if (table, column) in self._keys:
+            self._keys[table, column].update(keys)
+
+
+def check_foreign_keys(row: dict, foreign_keys: list[dict], parents: ParentKeys) -> None:
+    for fk in foreign_keys:
+        value = row.get(fk["from_column"])
+        if value is not None and value not in parents.get(fk["to_table"], fk["to_column"]):
+            raise RejectedRecord(
+                f"unknown {fk['from_column']}", f"{fk['from_column']} {value!r} not in {fk['to_table']}"
+            )
+
+
+@dataclass
+class ImportReport:
+    table: str
+    path: str
+    read: int = 0
+    inserted: int = 0
+    rejected: int = 0
+    reasons: dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def reject(self, kind: str) -> None:
+        self.rejected += 1
+        self.reasons[kind] = self.reasons.get(kind, 0) + 1
+
+
+def import_file(
+    model: Type[DB],
+    path,
+    file_format: str = None,
+    batch_size: int = 5000,
+    commit_every: int = 20000,
+    rejects_path=None,
+    parents: ParentKeys = None,
+    progress: Optional[Callable[[ImportReport], None]] = None,
+    progress_every: int = 100000,
+) -> ImportReport:
+    """
+    Imports a file into model's table. Rows are written with insert_many in transactions
+    of commit_every rows, so a multi GB feed never holds one huge transaction. Records
+    that can't be coerced or reference a missing parent key are rejected up front. If a
+    chunk still fails a constraint (e.g. a duplicate primary key) it is retried row by
+    row so only the bad rows are rejected. Pass the same parents to several calls to
+    share the key cache, e.g. when importing Airports then Flights.
+    """
+    parents = parents or ParentKeys()
+    report = ImportReport(model.__name__, str(path))
+    coercers = _coercers(model)
+    foreign_keys = model.get_foreign_keys(model)
+    pk = model.primary_key
+    rejects = open(rejects_path, "a") if rejects_path else None
+    start = perf_counter()
+
+    def valid_rows() -> Iterator[dict]:
+        for line, record in enumerate(read_records(path, file_format), 1):
+            report.read += 1
+            try:
+                if not isinstance(record, dict):
+                    raise RejectedRecord("not an object", "record is not an object")
+                row = coerce(record, coercers)
+                check_foreign_keys(row, foreign_keys, parents)
+                yield row
+            except RejectedRecord as e:
+                reject(line, record, e.kind, str(e))
+            if progress and report.read % progress_every == 0:
+                report.seconds = perf_counter() - start
+                progress(report)
+
+    def reject(line: Optional[int], record, kind: str, reason: str) -> None:
+        report.reject(kind)
+        if rejects:
+            rejects.write(json.dumps({"record": line, "reason": reason, "data": record}, default=str) + "\n")
+
+    def write(chunk: list[dict]) -> None:
+        try:
+            report.inserted += model.insert_many(chunk, batch_size)
+            parents.add(model.__name__, pk, (row.get(pk) for row in chunk))
+        except (DuplicatePrimaryKeyError, ForeignKeyConstraintError):
+            write_rows(chunk)
+
+    def write_rows(chunk: list[dict]) -> None:
+        # a failed statement only undoes its own row, so the good rows still commit together
+        meta = DB.get_meta(model)
+        with db_connection() as connection:
+            for row in chunk:
+                values = tuple(getattr(model(**row), name) for name in meta.names)
+                try:
+                    connection.execute(meta.insert_query, values)
+                except sqlite3.IntegrityError as e:
+                    reject(None, row, e.sqlite_errorname.removeprefix("SQLITE_").lower(), str(e))
+                    continue
+                report.inserted += 1
+                parents.add(model.__name__, pk, [row.get(pk)])
+            connection.commit()
+        DB._invalidate(model)
+
+    try:
+        with storage_profile("bulk-load"):
+            rows = valid_rows()
+            while chunk := list(islice(rows, commit_every)):
+                write(chunk)
+    finally:
+        if rejects:
+            rejects.close()
+
+    report.seconds = perf_counter() - start
+    logger.info(
+        "imported %s into %s: %d read, %d inserted, %d rejected",
+        path, model.__name__, report.read, report.inserted, report.rejected,
+    )
+    return report
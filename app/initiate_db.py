@@ -1,11 +1,12 @@
-import json
+from typing import Iterator
+from app.base.connection import storage_profile
+from app.importer import iter_json_array
 from app.models.base_model import DB
 from app.models import Aircrafts, Airports, Pilots, Flights
 
 
-def load_json(path: str) -> list:
-    with open(path) as f:
-        return json.load(f)
+def load_json(path: str) -> Iterator[dict]:
+    return iter_json_array(path)
 
 
 def initiate() -> None:
@@ -19,6 +20,6 @@ def initiate() -> None:
         (Flights, "app/data/flights.json"),
     ]
 
-    for model, path in models:
-        for data in load_json(path):
-            model(**data).insert()
+    with storage_profile("bulk-load"):
+        for model, path in models:
+            model.insert_many(load_json(path))
@@ -1,4 +1,5 @@
 from .aircrafts import Aircrafts
 from .airports import Airports
 from .pilots import Pilots
-from .flights import Flights
\ No newline at end of file
+from .flights import Flights
+from .results import ResultSet
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from app.models.base_model import DB
 
-@dataclass
+@dataclass(slots=True)
 class Aircrafts(DB, primary_key="registration"):
     registration: str
     aircraft_type: str
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from app.models.base_model import DB
 
-@dataclass
+@dataclass(slots=True)
 class Airports(DB, primary_key="code"):
     code: str
     name: str
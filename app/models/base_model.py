@@ -1,16 +1,48 @@
-from dataclasses import Field
+from dataclasses import Field, dataclass
 import sqlite3
+from app.base.cache import query_cache
 from app.base.connection import db_connection
-from app.base.logger import logger
-import inspect
-from typing import Optional, Type, Iterable
+from app.base.logger import logger, log_query
+from app.base.profiler import profiler
+from itertools import groupby, islice
+from time import perf_counter
+from typing import Optional, Type, Iterable, Iterator, Union, get_args
 from app.base.exceptions import ForeignKeyConstraintError, DuplicatePrimaryKeyError
+from app.models.results import ResultSet
+
+
+def _column_type(field_type) -> type:
+    """Unwraps Optional[X] field annotations to X."""
+    args = [a for a in get_args(field_type) if a is not type(None)]
+    return args[0] if args else field_type
+
+
+@dataclass(frozen=True)
+class ModelMeta:
+    """Compiled per-model metadata so the query paths only need to bind parameters."""
+
+    fields: tuple[Field, ...]
+    names: tuple[str, ...]
+    columns: tuple[str, ...]
+    foreign_keys: tuple[dict, ...]
+    tables: frozenset[str]
+    insert_query: str
+    details_columns: tuple[str, ...]
+    condition_columns: dict[str, tuple[str, type]]
+    details_sources: dict[str, tuple[str, type]]
+    details_joins: str
+    details_query: str
+    denormalized_sources: dict[str, tuple[str, type]]
+    denormalized_query: str
 
 
 class DB:
     """Base class with basic CRUD operations for db models using SQLite3."""
 
     __SUBCLASSES__: dict[[str, Type["DB"]]] = {}
+    __META_CACHE__: dict[str, ModelMeta] = {}
+    # models whose find_all_with_details reads the denormalized table, see app.models.details
+    __DETAILS_TABLES__: set[str] = set()
 
     __TYPE_MAP: dict[str, str] = {
         "int": "INTEGER",
@@ -21,16 +53,215 @@ class DB:
 
     ON_DELETE = "NO ACTION"
     ON_UPDATE = "NO ACTION"
+    # optional trigger maintained tables, see app.models.summaries, routes and details
+    MATERIALIZE_SUMMARIES = False
+    LOG_FLIGHT_CHANGES = False
+    DENORMALIZE_DETAILS = False
 
-    def __init_subclass__(cls, primary_key="id", **kwargs):
+    # lets the models use @dataclass(slots=True), so instances carry no __dict__
+    __slots__ = ()
+
+    def __init_subclass__(cls, primary_key=None, indexes=None, **kwargs):
+        # dataclass(slots=True) recreates the class without the class keywords,
+        # so keep what the first creation set
+        if primary_key is None:
+            primary_key = cls.__dict__.get("primary_key", "id")
+        if indexes is None:
+            indexes = cls.__dict__.get("indexes", ())
         cls.primary_key = primary_key
+        cls.indexes = [(idx,) if isinstance(idx, str) else tuple(idx) for idx in indexes]
         DB.__SUBCLASSES__[cls.__name__] = cls
 
+    @staticmethod
+    def get_meta(cls: Type["DB"]) -> ModelMeta:
+        """Returns the compiled metadata for the given db subclass, building it on first use."""
+        meta = DB.__META_CACHE__.get(cls.__name__)
+        if meta is None:
+            meta = DB.__META_CACHE__[cls.__name__] = DB._compile_meta(cls)
+        return meta
+
+    @staticmethod
+    def _compile_meta(cls: Type["DB"]) -> ModelMeta:
+        fields = tuple(cls.__dataclass_fields__.values())
+        names = tuple(field.name for field in fields)
+        # tables are created with the primary key first, see intialise_all
+        columns = (cls.primary_key,) + tuple(n for n in names if n != cls.primary_key)
+
+        foreign_keys = []
+        for f in fields:
+            fk_meta = f.metadata.get("foreign_key")
+            if fk_meta:
+                foreign_keys.append(
+                    {
+                        "from_column": f.name,
+                        "to_table": fk_meta["table"],
+                        "to_column": fk_meta["column"],
+                        "alias": fk_meta.get("alias", fk_meta["table"]),
+                    }
+                )
+
+        insert_query = (
+            f"INSERT INTO {cls.__name__}({','.join(names)}) "
+            f"VALUES ({','.join(['?'] * len(names))})"
+        )
+
+        select_clauses = [(cls.__name__, c) for c in columns]
+        alias_tables = {cls.__name__: cls}
+        joins = []
+        for fk in foreign_keys:
+            alias, from_column, to_table, to_column = (
+                fk["alias"],
+                fk["from_column"],
+                fk["to_table"],
+                fk["to_column"],
+            )
+            target = alias_tables[alias] = DB.__SUBCLASSES__[to_table]
+            target_names = [f.name for f in target.__dataclass_fields__.values()]
+            target_columns = [target.primary_key] + [
+                n for n in target_names if n != target.primary_key
+            ]
+            select_clauses += [(alias, c) for c in target_columns if c != to_column]
+            joins.append(
+                f"LEFT JOIN {to_table} AS {alias} ON {cls.__name__}.{from_column} = {alias}.{to_column}"
+            )
+
+        details_columns = tuple(f"{alias}_{c}" for alias, c in select_clauses)
+        condition_columns = {
+            f.name: (f.name, _column_type(f.type)) for f in fields
+        }
+        # filters on the joined query can use plain column names or the output aliases
+        details_sources = {
+            n: (f"{cls.__name__}.{n}", t) for n, (_, t) in condition_columns.items()
+        }
+        for alias, c in select_clauses:
+            field_type = alias_tables[alias].__dataclass_fields__[c].type
+            details_sources[f"{alias}_{c}"] = (f"{alias}.{c}", _column_type(field_type))
+        select = ", ".join(f"{alias}.{c} AS {alias}_{c}" for alias, c in select_clauses)
+        details_joins = " ".join(joins)
+        details_query = f"SELECT {select} FROM {cls.__name__} {details_joins}"
+        # the same filters on the details table, where every column is stored under its alias
+        denormalized_sources = {
+            n: (f"{cls.__name__}_{n}", t) for n, (_, t) in condition_columns.items()
+        }
+        denormalized_sources.update(
+            {name: (name, t) for name, (_, t) in details_sources.items() if name in details_columns}
+        )
+        denormalized_query = (
+            f"SELECT {', '.join(details_columns)} FROM {cls.__name__}Details"
+        )
+
+        return ModelMeta(
+            fields=fields,
+            names=names,
+            columns=columns,
+            foreign_keys=tuple(foreign_keys),
+            tables=frozenset([cls.__name__] + [fk["to_table"] for fk in foreign_keys]),
+            insert_query=insert_query,
+            details_columns=details_columns,
+            condition_columns=condition_columns,
+            details_sources=details_sources,
+            details_joins=details_joins,
+            details_query=details_query,
+            denormalized_sources=denormalized_sources,
+            denormalized_query=denormalized_query,
+        )
+
+    @staticmethod
+    def clear_meta_cache() -> None:
+        DB.__META_CACHE__.clear()
+        DB.__DETAILS_TABLES__.clear()
+
+    @staticmethod
+    def _dependent_tables(table: str) -> set[str]:
+        """Returns table and every table that references it through foreign keys, directly or not."""
+        tables = {table}
+        pending = [table]
+        while pending:
+            parent = pending.pop()
+            for name, model in DB.__SUBCLASSES__.items():
+                if name not in tables and any(
+                    fk["to_table"] == parent for fk in DB.get_meta(model).foreign_keys
+                ):
+                    tables.add(name)
+                    pending.append(name)
+        return tables
+
+    @staticmethod
+    def _invalidate(cls: Type["DB"]) -> None:
+        """Drops cached results that read cls or a child table a cascade could have changed."""
+        query_cache.invalidate(DB._dependent_tables(cls.__name__))
+
+    @staticmethod
+    def _execute(
+        cursor: sqlite3.Cursor, query: str, values=(), many: bool = False
+    ) -> sqlite3.Cursor:
+        """Runs a statement and reports it to the query log and profiler."""
+        start = perf_counter()
+        try:
+            if many:
+                return cursor.executemany(query, values)
+            return cursor.execute(query, values)
+        finally:
+            duration = perf_counter() - start
+            params = None if many else values
+            log_query(query, params, duration, cursor.rowcount)
+            profiler.record(query, params, duration, cursor.rowcount, cursor.connection)
+
+    @staticmethod
+    def _fetch_rows(
+        label: str,
+        query: str,
+        values: list,
+        model: str,
+        tables: Iterable[str],
+        rows: str = "dict",
+        share_from: Optional[int] = None,
+    ) -> Union[list[dict], ResultSet]:
+        """
+        Runs a read query, going through the result cache when it is enabled.
+        rows="dict" returns a list of dicts, rows="tuple" a ResultSet of plain tuples.
+        share_from is passed to ResultSet.with_shared_values for tuple results.
+        """
+        if rows not in ("dict", "tuple"):
+            raise ValueError('rows must be "dict" or "tuple"')
+
+        key = query_cache.key(model, query, values) + (rows,)
+        cached = query_cache.get(key)
+        if cached is not None:
+            return cached if rows == "tuple" else [dict(row) for row in cached]
+
+        version = query_cache.version()
+        with db_connection() as connection:
+            cursor = connection.cursor()
+            if rows == "tuple":
+                cursor.row_factory = None
+            logger.info("Running %s query: %s with values %s", label, query, values)
+            start = perf_counter()
+            cursor.execute(query, values)
+            if rows == "tuple":
+                columns = [d[0] for d in cursor.description]
+                if share_from is None:
+                    result = ResultSet(columns, cursor.fetchall())
+                else:
+                    result = ResultSet.with_shared_values(
+                        columns, cursor.fetchall(), share_from
+                    )
+            else:
+                result = [dict(row) for row in cursor]
+            duration = perf_counter() - start
+            log_query(query, values, duration, len(result))
+            profiler.record(query, values, duration, len(result), connection)
+
+        if query_cache.enabled:
+            # ResultSets are immutable so they can be shared, dicts are copied
+            cached = result if rows == "tuple" else [dict(row) for row in result]
+            query_cache.put(key, tables, cached, version)
+        return result
+
     @staticmethod
     def get_class_fields(cls: Type["DB"]) -> Iterable[Field]:
         """Returns all dataclass fields for the given db subclass."""
-        members = inspect.getmembers(cls)
-        return dict(members)["__dataclass_fields__"].values()
+        return DB.get_meta(cls).fields
 
     @staticmethod
     def get_class_field_type(cls: Type["DB"], field: str) -> type:
@@ -42,7 +273,7 @@ class DB:
     def intialise_all(cls):
         with db_connection() as connection:
             for k, v in DB.__SUBCLASSES__.items():
-                logger.info(f"{k} creating key automatically")
+                logger.info("%s creating key automatically", k)
                 fields = DB.get_class_fields(v)
 
                 sqlite_fields = []
@@ -65,159 +296,601 @@ class DB:
                     sqlite_fields.extend(fk_fields)
 
                 create_table = f"CREATE TABLE IF NOT EXISTS {k} ({v.primary_key} {primary_type} PRIMARY KEY, {", ".join(sqlite_fields)})"
-                logger.info(f"running sql {create_table}")
+                logger.info("running sql %s", create_table)
                 connection.execute(create_table)
 
+            DB.create_indexes()
+
+            if "Flights" in DB.__SUBCLASSES__:
+                from app.models.flights import create_duration_indexes
+                from app.models.routes import create_change_log, has_change_log
+                from app.models.summaries import create_summaries, has_summaries
+
+                create_duration_indexes(connection)
+
+                # a database that already has them keeps them current
+                if DB.MATERIALIZE_SUMMARIES or has_summaries(connection):
+                    create_summaries(connection)
+                if DB.LOG_FLIGHT_CHANGES or has_change_log(connection):
+                    create_change_log(connection)
+
+            from app.models.details import create_details, load_details
+
+            if DB.DENORMALIZE_DETAILS:
+                create_details(connection)
+            else:
+                load_details(connection)
+
+        for v in DB.__SUBCLASSES__.values():
+            DB.get_meta(v)
+
+    @staticmethod
+    def get_indexes(cls: Type["DB"]) -> list[tuple[str, ...]]:
+        """
+        Returns the column tuples to index for the given db subclass: every foreign key
+        column, fields with index=True metadata and the class level indexes keyword.
+        """
+        names = [field.name for field in DB.get_class_fields(cls)]
+        indexes = [(fk["from_column"],) for fk in DB.get_foreign_keys(cls)]
+        indexes += [
+            (field.name,)
+            for field in DB.get_class_fields(cls)
+            if field.metadata.get("index")
+        ]
+        indexes += cls.indexes
+
+        result = []
+        for columns in indexes:
+            unknown = [c for c in columns if c not in names]
+            if unknown:
+                raise ValueError(f"{cls.__name__} index on unknown columns: {unknown}")
+            if columns != (cls.primary_key,) and columns not in result:
+                result.append(columns)
+
+        # an index already serves lookups on any leading prefix of its columns
+        return [
+            columns
+            for columns in result
+            if not any(
+                len(other) > len(columns) and other[: len(columns)] == columns
+                for other in result
+            )
+        ]
+
+    @classmethod
+    def create_indexes(cls) -> None:
+        """Creates any missing indexes for all db subclasses. Safe to run on existing databases."""
+        with db_connection() as connection:
+            for k, v in DB.__SUBCLASSES__.items():
+                for columns in DB.get_indexes(v):
+                    create_index = f"CREATE INDEX IF NOT EXISTS idx_{k}_{'_'.join(columns)} ON {k} ({', '.join(columns)})"
+                    logger.info("running sql %s", create_index)
+                    connection.execute(create_index)
+
     def drop_table(cls) -> None:
         with db_connection() as connection:
             drop_table = f"DROP TABLE IF EXISTS {cls.__name__}"
-            logger.info(f"running sql {drop_table}")
+            logger.info("running sql %s", drop_table)
             connection.execute(drop_table)
+        DB.clear_meta_cache()
+        query_cache.clear()
 
     def drop_all() -> None:
         with db_connection() as connection:
             cursor = connection.cursor()
             cursor.execute("PRAGMA foreign_keys = OFF;")
-            cursor.execute("SELECT name FROM sqlite_schema WHERE type='table';")
+            # sqlite_sequence (from FlightChanges' AUTOINCREMENT) can't be dropped
+            cursor.execute("SELECT name FROM sqlite_schema WHERE type='table' AND name NOT GLOB 'sqlite_*';")
             tables = cursor.fetchall()
             for t in tables:
                 cursor.execute(f'DROP TABLE IF EXISTS "{t[0]}" ')
             connection.commit()
+            cursor.execute("PRAGMA foreign_keys = ON;")
+        DB.clear_meta_cache()
+        query_cache.clear()
 
     def insert(self) -> None:
-        """Inserts the current object instance into its corresponding table."""
-        fields = DB.get_class_fields(self.__class__)
-        names = [field.name for field in fields]
-        names_key = ",".join(names)
-        questions = ",".join(["?"] * len(names))
-        insert_query = (
-            f"INSERT INTO {self.__class__.__name__}({names_key}) VALUES ({questions})"
-        )
+        """
+        Inserts the current object instance into its corresponding table. Inside a
+        transaction the caller has open, it is committed with that transaction.
+        """
+        meta = DB.get_meta(self.__class__)
+        names, insert_query = meta.names, meta.insert_query
 
         with db_connection() as connection:
             cursor = connection.cursor()
             values = tuple([getattr(self, name) for name in names])
             logger.info(
-                f"running following insert query: {insert_query} with values: {values}"
+                "running following insert query: %s with values: %s", insert_query, values
             )
+            # a transaction the caller has open is left for the caller to commit
+            joined = connection.in_transaction
             try:
-                cursor.execute(insert_query, values)
-                connection.commit()
+                DB._execute(cursor, insert_query, values)
+                if not joined:
+                    connection.commit()
+                DB._invalidate(self.__class__)
             except sqlite3.IntegrityError as e:
                 if e.sqlite_errorname == "SQLITE_CONSTRAINT_FOREIGNKEY":
                     raise ForeignKeyConstraintError(e)
                 if e.sqlite_errorname == "SQLITE_CONSTRAINT_PRIMARYKEY":
                     raise DuplicatePrimaryKeyError(e)
+                raise
             except Exception as e:
                 print(e)
                 raise
 
+    @classmethod
+    def insert_many(
+        cls, records: Iterable[Union["DB", dict]], batch_size: int = 1000
+    ) -> int:
+        """
+        Inserts many records in a single transaction using executemany.
+        Records can be model instances or dicts of field values. Rows are streamed
+        in batches of batch_size so the iterable is never fully materialised.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        meta = DB.get_meta(cls)
+        names, insert_query = meta.names, meta.insert_query
+
+        def to_row(record) -> tuple:
+            if isinstance(record, dict):
+                record = cls(**record)
+            return tuple([getattr(record, name) for name in names])
+
+        rows = map(to_row, records)
+        inserted = 0
+
+        with db_connection() as connection:
+            cursor = connection.cursor()
+            logger.info("running bulk insert query: %s", insert_query)
+            try:
+                connection.execute("BEGIN")
+                while batch := list(islice(rows, batch_size)):
+                    cursor.execute("SAVEPOINT insert_batch")
+                    try:
+                        DB._execute(cursor, insert_query, batch, many=True)
+                    except sqlite3.IntegrityError:
+                        cursor.execute("ROLLBACK TO insert_batch")
+                        cls._raise_failed_row(
+                            cursor, [(insert_query, values) for values in batch], inserted
+                        )
+                    cursor.execute("RELEASE insert_batch")
+                    inserted += len(batch)
+                    logger.info("%s: %d rows inserted", cls.__name__, inserted)
+                connection.commit()
+                DB._invalidate(cls)
+                return inserted
+            except Exception:
+                connection.rollback()
+                raise
+
+    @staticmethod
+    def _raise_failed_row(
+        cursor: sqlite3.Cursor, statements: list[tuple[str, tuple]], offset: int
+    ) -> None:
+        """Replays a failed batch's (query, values) row by row to report which row broke a constraint."""
+        for i, (query, values) in enumerate(statements):
+            try:
+                cursor.execute(query, values)
+            except sqlite3.IntegrityError as e:
+                message = f"row {offset + i} {values}: {e}"
+                if e.sqlite_errorname == "SQLITE_CONSTRAINT_FOREIGNKEY":
+                    raise ForeignKeyConstraintError(message)
+                if e.sqlite_errorname == "SQLITE_CONSTRAINT_PRIMARYKEY":
+                    raise DuplicatePrimaryKeyError(message)
+                raise
+
     @staticmethod
     def get_foreign_keys(cls: Type["DB"]) -> list[dict]:
-        result = []
-        for f in DB.get_class_fields(cls):
-            fk_meta = f.metadata.get("foreign_key")
-            if fk_meta:
-                result.append(
-                    {
-                        "from_column": f.name,
-                        "to_table": fk_meta["table"],
-                        "to_column": fk_meta["column"],
-                        "alias": fk_meta.get("alias", fk_meta["table"]),
-                    }
-                )
-        return result
+        return [dict(fk) for fk in DB.get_meta(cls).foreign_keys]
 
     @classmethod
-    def find_all_with_details(cls) -> list[dict]:
+    def find_all_with_details(
+        cls,
+        conditions: list[dict] = None,
+        order_by: str = None,
+        limit: int = None,
+        after=None,
+        before=None,
+        descending: bool = False,
+        rows: str = "dict",
+    ) -> Union[list[dict], ResultSet]:
         """
         Finds all records with full details using left joins on foreign keys.
+        Conditions can use the table's own columns or the aliased detail columns (e.g. DepartureAirport_country).
+        rows="tuple" returns a ResultSet instead of dicts, which is much smaller for wide joins.
         """
+        query, values, reverse = cls._details_query(
+            conditions, order_by, limit, after, before, descending
+        )
 
-        def get_columns_with_alias(
-            table: str, alias: str, connection, exclude_cols: list[str] = []
-        ) -> list[str]:
-            cursor = connection.execute(f"PRAGMA table_info({table})")
-            return [
-                f"{alias}.{row[1]} AS {alias}_{row[1]}"
-                for row in cursor.fetchall()
-                if row[1] not in exclude_cols
-            ]
+        result = DB._fetch_rows(
+            "find_all_with_details",
+            query,
+            values,
+            cls.__name__,
+            DB.get_meta(cls).tables,
+            rows,
+            share_from=len(DB.get_meta(cls).columns),
+        )
+        if reverse:
+            return result.reversed() if rows == "tuple" else result[::-1]
+        return result
+
+    @classmethod
+    def iter_find_all_with_details(
+        cls,
+        conditions: list[dict] = None,
+        order_by: str = None,
+        limit: int = None,
+        after=None,
+        before=None,
+        descending: bool = False,
+        chunk_size: int = 500,
+    ) -> Iterator[dict]:
+        """
+        Generator version of find_all_with_details. Rows are fetched in chunks of
+        chunk_size and the connection stays checked out until the generator is exhausted or closed.
+        """
+        query, values, reverse = cls._details_query(
+            conditions, order_by, limit, after, before, descending
+        )
 
         with db_connection() as connection:
-            select_clauses = get_columns_with_alias(
-                cls.__name__, cls.__name__, connection
+            logger.info(
+                "running streaming find_all_with_details query: %s with values %s",
+                query,
+                values,
             )
+            cursor = DB._execute(connection.cursor(), query, values)
+            if reverse:
+                yield from (dict(row) for row in reversed(cursor.fetchall()))
+                return
+            while rows := cursor.fetchmany(chunk_size):
+                for row in rows:
+                    yield dict(row)
 
-            fk_mapping = DB.get_foreign_keys(cls)
-            joins = []
+    @classmethod
+    def _details_query(
+        cls, conditions, order_by, limit, after, before, descending
+    ) -> tuple[str, list, bool]:
+        meta = DB.get_meta(cls)
+        if cls.__name__ in DB.__DETAILS_TABLES__:
+            sources, query = meta.denormalized_sources, meta.denormalized_query
+        else:
+            sources, query = meta.details_sources, meta.details_query
+        where_clause, values = cls._build_condition_clause(conditions, sources)
+        page_clause, page_values, order, reverse = cls._page_clauses(
+            order_by, limit, after, before, descending, details=True, sources=sources
+        )
 
-            for fk in fk_mapping:
-                alias, from_column, to_table, to_column = (
-                    fk["alias"],
-                    fk["from_column"],
-                    fk["to_table"],
-                    fk["to_column"],
-                )
-                select_clauses += get_columns_with_alias(
-                    to_table, alias, connection, [to_column]
-                )
-                joins.append(
-                    f"LEFT JOIN {to_table} AS {alias} ON {cls.__name__}.{from_column} = {alias}.{to_column}"
-                )
+        where = " AND ".join(f"({c})" for c in [where_clause, page_clause] if c)
+        if where:
+            query += f" WHERE {where}"
+        return f"{query} {order}", values + page_values, reverse
+
+    @classmethod
+    def _page_clauses(
+        cls,
+        order_by: str = None,
+        limit: int = None,
+        after=None,
+        before=None,
+        descending: bool = False,
+        details: bool = False,
+        sources: Optional[dict[str, tuple[str, type]]] = None,
+    ) -> tuple[str, list, str, bool]:
+        """
+        Builds the keyset pagination clauses. Rows are ordered by order_by (default the
+        primary key) with the primary key as tie breaker. after/before take the last/first
+        row of the current page (or a tuple of its order_by and primary key values) and
+        return the page next to it without an OFFSET scan.
+        details orders the joined query, whose columns are looked up in sources.
+        Returns (where clause, values, ORDER BY/LIMIT clause, reverse) where reverse
+        means the rows were fetched backwards and need flipping.
+        """
+        if after is not None and before is not None:
+            raise ValueError("Only one of after and before can be given")
 
-            query = f"SELECT {', '.join(select_clauses)} FROM {cls.__name__} {' '.join(joins)}"
+        pk = cls.primary_key
+        order_by = order_by or pk
+        if order_by not in DB.get_meta(cls).names:
+            raise ValueError(f"Not a valid column to order by: {order_by}")
 
-            cursor = connection.cursor()
-            logger.info(f"running find_all_with_details query: {query}")
-            rows = cursor.execute(query).fetchall()
-            return [dict(row) for row in rows]
+        keys = [order_by] if order_by == pk else [order_by, pk]
+        table = cls.__name__
+        sources = sources or DB.get_meta(cls).details_sources
+        columns = [sources[k][0] if details else k for k in keys]
+
+        where_clause, values = "", []
+        cursor = after if after is not None else before
+        if cursor is not None:
+            if isinstance(cursor, dict):
+                values = [cursor[f"{table}_{k}" if details else k] for k in keys]
+            elif isinstance(cursor, (tuple, list)):
+                values = list(cursor)
+            else:
+                values = [cursor]
+            if len(values) != len(keys):
+                raise ValueError(f"Page cursor needs values for {keys}")
+
+            operator = ">" if (after is not None) != descending else "<"
+            questions = ", ".join(["?"] * len(keys))
+            where_clause = f"({', '.join(columns)}) {operator} ({questions})"
+            if len(keys) == 2:
+                # a row value with a NULL compares to NULL, and SQLite sorts NULLs first
+                column, pk_column = columns
+                if values[0] is None:
+                    where_clause = f"{column} IS NULL AND {pk_column} {operator} ?"
+                    values = values[1:]
+                    if operator == ">":
+                        where_clause = f"({where_clause}) OR {column} IS NOT NULL"
+                elif operator == "<":
+                    where_clause += f" OR {column} IS NULL"
+
+        reverse = before is not None
+        direction = "DESC" if descending != reverse else "ASC"
+        order = "ORDER BY " + ", ".join(f"{c} {direction}" for c in columns)
+        if limit is not None:
+            order += f" LIMIT {int(limit)}"
+        return where_clause, values, order, reverse
+
+    OPERATORS = [
+        "=",
+        "!=",
+        ">",
+        "<",
+        ">=",
+        "<=",
+        "IN",
+        "NOT IN",
+        "BETWEEN",
+        "LIKE",
+        "STARTS WITH",
+        "IS NULL",
+        "IS NOT NULL",
+    ]
+    # only offered on text columns, see operators_for
+    TEXT_OPERATORS = ["LIKE", "STARTS WITH"]
 
     @staticmethod
-    def _build_condition_clause(conditions: Optional[list[dict]]) -> tuple[str, list]:
+    def operators_for(col_type: type) -> list[str]:
+        """Returns the condition operators that make sense for a column of col_type."""
+        if col_type is str:
+            return list(DB.OPERATORS)
+        return [op for op in DB.OPERATORS if op not in DB.TEXT_OPERATORS]
+
+    @classmethod
+    def _build_condition_clause(
+        cls,
+        conditions: Optional[list[dict]],
+        columns: Optional[dict[str, tuple[str, type]]] = None,
+    ) -> tuple[str, list]:
+        """
+        Builds a WHERE clause from conditions. Each condition is either
+        {"column", "operator", "value"} or a nested {"and": [...]} / {"or": [...]} group,
+        and the top level list is ANDed. Values are coerced to the column type so
+        comparisons can use the indexes. columns maps condition column names to their
+        SQL expression and type, defaulting to the table's own columns.
+        """
         if not conditions:
             return "", []
 
-        VALID_OPERATORS = ["=", "!=", ">", "<", "IN"]
-        clauses = []
+        if columns is None:
+            columns = DB.get_meta(cls).condition_columns
+
         values = []
+        where_clause = DB._build_group("AND", conditions, columns, values)
+        return where_clause, values
 
+    @staticmethod
+    def _build_group(
+        joiner: str, conditions: list[dict], columns: dict, values: list
+    ) -> str:
+        clauses = []
         for c in conditions:
-            column, operator, value = c["column"], c["operator"], c["value"]
+            if "and" in c or "or" in c:
+                group_joiner = "AND" if "and" in c else "OR"
+                group = c.get("and", c.get("or"))
+                if not group:
+                    raise ValueError("Condition groups can't be empty")
+                clauses.append(f"({DB._build_group(group_joiner, group, columns, values)})")
+            else:
+                clauses.append(DB._build_predicate(c, columns, values))
+        return f" {joiner} ".join(clauses)
 
-            if operator not in VALID_OPERATORS:
-                raise ValueError(
-                    f"Not a valid operator. Valid operators: {VALID_OPERATORS}"
-                )
+    @staticmethod
+    def _build_predicate(condition: dict, columns: dict, values: list) -> str:
+        column, operator = condition["column"], condition["operator"].upper()
+        value = condition.get("value")
 
-            if operator == "IN":
-                value = [v.strip() for v in value.split(",")]
-                questions = ", ".join(["?"] * len(value))
-                clauses.append(f"{column} IN ({questions})")
-                values.extend(value)
+        if column not in columns:
+            raise ValueError(f"Not a valid column: {column}")
+        column, col_type = columns[column]
 
-            else:
-                clauses.append(f"{column} {operator} ?")
-                values.append(value)
+        if operator not in DB.OPERATORS:
+            raise ValueError(f"Not a valid operator. Valid operators: {DB.OPERATORS}")
 
-        where_clause = " AND ".join(clauses)
-        return where_clause, values
+        if operator in ("IS NULL", "IS NOT NULL"):
+            return f"{column} {operator}"
+
+        if operator in ("IN", "NOT IN"):
+            value = DB._split_values(value)
+            values.extend(DB._coerce(col_type, v) for v in value)
+            return f"{column} {operator} ({', '.join(['?'] * len(value))})"
+
+        if operator == "BETWEEN":
+            value = DB._split_values(value)
+            if len(value) != 2:
+                raise ValueError("BETWEEN needs exactly two values: low, high")
+            values.extend(DB._coerce(col_type, v) for v in value)
+            return f"{column} BETWEEN ? AND ?"
+
+        if operator == "STARTS WITH":
+            if col_type is not str:
+                raise ValueError("STARTS WITH is only valid for text columns")
+            prefix = str(value)
+            if not prefix:
+                return f"{column} IS NOT NULL"
+            # a range on the prefix can use the index, unlike LIKE under the default collation
+            values.extend([prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)])
+            return f"({column} >= ? AND {column} < ?)"
+
+        if operator == "LIKE":
+            # a pattern, never a number
+            values.append(str(value))
+            return f"{column} LIKE ?"
+
+        values.append(DB._coerce(col_type, value))
+        return f"{column} {operator} ?"
+
+    @staticmethod
+    def _split_values(value) -> list:
+        if isinstance(value, str):
+            return [v.strip() for v in value.split(",")]
+        return list(value)
+
+    @staticmethod
+    def _coerce(col_type: type, value):
+        if isinstance(value, str) and col_type in (int, float):
+            return col_type(value.strip())
+        return value
+
+    @classmethod
+    def find(
+        cls,
+        conditions: list[dict] = None,
+        order_by: str = None,
+        limit: int = None,
+        after=None,
+        before=None,
+        descending: bool = False,
+        rows: str = "dict",
+    ):
+        """
+        Finds all records. Pass order_by and limit with after/before (the last/first
+        row of the current page) for keyset pagination, see _page_clauses.
+        rows picks the result form: "dict" (default) a list of dicts, "tuple" a
+        ResultSet of plain tuples and "model" a list of model instances.
+        """
+        query, values, reverse = cls._find_query(
+            conditions, order_by, limit, after, before, descending
+        )
+
+        fetch_as = "tuple" if rows == "model" else rows
+        result = DB._fetch_rows(
+            "SELECT", query, values, cls.__name__, [cls.__name__], fetch_as
+        )
+        if reverse:
+            result = result.reversed() if fetch_as == "tuple" else result[::-1]
+        if rows == "model":
+            return cls._to_models(result)
+        return result
 
     @classmethod
-    def find(cls, conditions: list[dict] = None):
-        """Finds all records."""
+    def _to_models(cls, result: ResultSet) -> list["DB"]:
+        positions = [result.columns.index(name) for name in DB.get_meta(cls).names]
+        return [cls(*[row[p] for p in positions]) for row in result]
+
+    @classmethod
+    def iter_find(
+        cls,
+        conditions: list[dict] = None,
+        order_by: str = None,
+        limit: int = None,
+        after=None,
+        before=None,
+        descending: bool = False,
+        chunk_size: int = 500,
+    ) -> Iterator[dict]:
+        """
+        Generator version of find. Rows are fetched in chunks of chunk_size and the
+        connection stays checked out until the generator is exhausted or closed.
+        """
+        query, values, reverse = cls._find_query(
+            conditions, order_by, limit, after, before, descending
+        )
+
+        with db_connection() as connection:
+            logger.info("Running streaming SELECT query: %s with values %s", query, values)
+            cursor = DB._execute(connection.cursor(), query, values)
+            if reverse:
+                yield from (dict(row) for row in reversed(cursor.fetchall()))
+                return
+            while rows := cursor.fetchmany(chunk_size):
+                for row in rows:
+                    yield dict(row)
+
+    @classmethod
+    def _find_query(
+        cls,
+        conditions: list[dict] = None,
+        order_by: str = None,
+        limit: int = None,
+        after=None,
+        before=None,
+        descending: bool = False,
+    ) -> tuple[str, list, bool]:
         query = f"SELECT * FROM {cls.__name__}"
         where_clause, values = cls._build_condition_clause(conditions)
 
-        if where_clause:
-            query += f" WHERE {where_clause}"
+        paginate = order_by or limit is not None or after is not None or before is not None
+        if not paginate:
+            if where_clause:
+                query += f" WHERE {where_clause}"
+            return query, values, False
 
-        with db_connection() as connection:
-            cursor = connection.cursor()
-            logger.info(f"Running SELECT query: {query} with values {values}")
-            rows = cursor.execute(query, values)
-            # return [cls(**row) for row in rows]
-            return [dict(row) for row in rows]
+        page_clause, page_values, order, reverse = cls._page_clauses(
+            order_by, limit, after, before, descending
+        )
+        where = " AND ".join(f"({c})" for c in [where_clause, page_clause] if c)
+        if where:
+            query += f" WHERE {where}"
+        return f"{query} {order}", values + page_values, reverse
+
+    @classmethod
+    def to_columns(
+        cls, conditions: list[dict] = None, details: bool = False, chunk_size: int = 50000
+    ) -> dict:
+        """
+        Returns the find (or find_all_with_details if details) result as one NumPy array
+        per column, with dtypes from the field types. Needs numpy, see app.models.columnar.
+        """
+        from app.models.columnar import query_columns
+
+        return query_columns(cls, conditions, details, chunk_size)
+
+    @classmethod
+    def export_columns(
+        cls, path, conditions: list[dict] = None, details: bool = False
+    ) -> None:
+        """
+        Writes the to_columns result to a directory of .npy files. Read it back with
+        app.models.columnar.load_columns, which memory-maps it instead of re-querying.
+        """
+        from app.models.columnar import save_columns
+
+        save_columns(cls.to_columns(conditions, details), path)
+
+    @classmethod
+    def parallel_group_by(cls, *args, **kwargs) -> Union[list[dict], ResultSet]:
+        """
+        group_by split into primary key (or partition_on) ranges run on several
+        threads or processes, for full history reports. See app.models.parallel.
+        """
+        from app.models.parallel import group_by
+
+        return group_by(cls, *args, **kwargs)
+
+    @classmethod
+    def parallel_find_all_with_details(cls, *args, **kwargs) -> Union[list[dict], ResultSet]:
+        """find_all_with_details split into ranges like parallel_group_by, for exports."""
+        from app.models.parallel import find_all_with_details
+
+        return find_all_with_details(cls, *args, **kwargs)
 
     @classmethod
     def delete(cls, conditions: list[dict] = None) -> int:
@@ -230,15 +903,18 @@ class DB:
 
         with db_connection() as connection:
             cursor = connection.cursor()
-            logger.info(f"Running DELETE query: {query} with values {values}")
+            logger.info("Running DELETE query: %s with values %s", query, values)
             try:
-                cursor.execute(query, values)
+                DB._execute(cursor, query, values)
+                connection.commit()
+                DB._invalidate(cls)
                 return cursor.rowcount
             except sqlite3.IntegrityError as e:
                 if e.sqlite_errorname == "SQLITE_CONSTRAINT_FOREIGNKEY":
                     raise ForeignKeyConstraintError(e)
                 if e.sqlite_errorname == "SQLITE_CONSTRAINT_PRIMARYKEY":
                     raise DuplicatePrimaryKeyError(e)
+                raise
             except Exception as e:
                 print(e)
                 raise Exception()
@@ -258,33 +934,278 @@ class DB:
 
         with db_connection() as connection:
             cursor = connection.cursor()
-            logger.info(f"Running UPDATE query: {query} with values {values}")
+            logger.info("Running UPDATE query: %s with values %s", query, values)
             try:
-                cursor.execute(query, values)
+                DB._execute(cursor, query, values)
                 connection.commit()
+                DB._invalidate(cls)
                 return cursor.rowcount
             except sqlite3.IntegrityError as e:
                 if e.sqlite_errorname == "SQLITE_CONSTRAINT_FOREIGNKEY":
                     raise ForeignKeyConstraintError(e)
                 if e.sqlite_errorname == "SQLITE_CONSTRAINT_PRIMARYKEY":
                     raise DuplicatePrimaryKeyError(e)
+                raise
             except Exception as e:
                 print(e)
                 raise Exception()
 
     @classmethod
-    def group_by(cls, group_on: str, agg_on: str):
-        """Groups table on group_on column by the agg_on column. Agg (SUM/COUNT) depends on the agg_on type."""
-        col_type = cls.get_class_field_type(cls, agg_on)
-        if col_type in [int, float]:
-            agg = f"SUM({agg_on})"
-        else:
-            agg = f"COUNT({agg_on})"
+    def update_many(
+        cls, updates: Iterable[tuple[object, dict]], batch_size: int = 1000
+    ) -> list[int]:
+        """
+        Applies many (primary key, changes dict) pairs in a single transaction, e.g. a
+        feed of per flight status changes. Runs of pairs changing the same columns share
+        one executemany. Returns how many rows each pair updated, in order: 0 if its
+        primary key doesn't exist. A constraint error rolls everything back and names
+        the failing pair, like insert_many.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        pk, names = cls.primary_key, DB.get_meta(cls).names
 
-        query = f"SELECT {group_on}, {agg} FROM {cls.__name__} GROUP BY {group_on}"
+        def to_statement(update: tuple) -> tuple[str, tuple]:
+            key, changes = update
+            if not changes:
+                raise ValueError(f"No changes given for {pk} {key}")
+            for column in changes:
+                if column not in names:
+                    raise ValueError(f"Not a valid column: {column}")
+                if column == pk:
+                    raise ValueError("update_many can't change the primary key, use update")
+            questions = ", ".join(f"{column} = ?" for column in changes)
+            query = f"UPDATE {cls.__name__} SET {questions} WHERE {pk} = ?"
+            return query, (*changes.values(), key)
+
+        updates = iter(updates)
+        results = []
 
         with db_connection() as connection:
             cursor = connection.cursor()
-            logger.info(f"Running SELECT query: {query}")
-            rows = cursor.execute(query)
-            return [dict(row) for row in rows]
+            try:
+                connection.execute("BEGIN")
+                while batch := list(islice(updates, batch_size)):
+                    statements = [to_statement(update) for update in batch]
+                    found = cls._existing_keys(cursor, [key for key, _ in batch])
+                    try:
+                        for query, group in groupby(statements, key=lambda s: s[0]):
+                            DB._execute(cursor, query, [values for _, values in group], many=True)
+                    except sqlite3.IntegrityError:
+                        # the primary keys don't change, so a pair's constraints only depend
+                        # on its own row and the parents: replaying just this batch names it.
+                        # No per batch savepoint, they slow down the triggers' statement journals
+                        connection.rollback()
+                        connection.execute("BEGIN")
+                        cls._raise_failed_row(cursor, statements, len(results))
+                        raise
+                    results += [1 if key in found else 0 for key, _ in batch]
+                    logger.info("%s: %d rows updated", cls.__name__, len(results))
+                connection.commit()
+                DB._invalidate(cls)
+                return results
+            except Exception:
+                connection.rollback()
+                raise
+
+    @classmethod
+    def _existing_keys(cls, cursor: sqlite3.Cursor, keys: list) -> set:
+        found = set()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            DB._execute(
+                cursor,
+                f"SELECT {cls.primary_key} FROM {cls.__name__} "
+                f"WHERE {cls.primary_key} IN ({', '.join(['?'] * len(chunk))})",
+                chunk,
+            )
+            found.update(row[0] for row in cursor.fetchall())
+        return found
+
+    AGGREGATES = ["COUNT", "SUM", "AVG", "MIN", "MAX"]
+
+    TIME_BUCKETS = {
+        "hour": "%Y-%m-%d %H:00",
+        "day": "%Y-%m-%d",
+        "week": "%Y-W%W",
+        "month": "%Y-%m",
+        "year": "%Y",
+    }
+
+    @classmethod
+    def group_by(
+        cls,
+        group_on: Union[str, list[str]],
+        agg_on: Union[str, list] = None,
+        conditions: list[dict] = None,
+        having: list[dict] = None,
+        buckets: dict[str, str] = None,
+        rows: str = "dict",
+    ):
+        """
+        Groups the table on the group_on column(s) and aggregates in a single query.
+        agg_on is a column or a list of columns and (function, column) pairs, e.g.
+        ["capacity", ("AVG", "capacity"), ("COUNT", "*")]. A bare column is SUMmed
+        if numeric and COUNTed otherwise. Columns of joined tables can be used as
+        Alias.column or Alias_column (e.g. DepartureAirport.country).
+        conditions filters rows before grouping (WHERE) and having filters the groups,
+        using the output names like "COUNT(flight_id)". buckets truncates time columns
+        to a TIME_BUCKETS unit, e.g. {"departure_time": "day"}.
+        """
+        query, values, tables = cls._group_by_query(
+            group_on, cls._aggregates(agg_on), conditions, having, buckets
+        )
+        return DB._fetch_rows("SELECT", query, values, cls.__name__, tables, rows)
+
+    @classmethod
+    def _aggregates(cls, agg_on: Union[str, list, None]) -> list[tuple[str, str]]:
+        """Normalises group_by's agg_on to (function, column) pairs."""
+        if agg_on is None:
+            return []
+        if isinstance(agg_on, (str, tuple)):
+            agg_on = [agg_on]
+        sources = DB.get_meta(cls).details_sources
+        aggregates = []
+        for agg in agg_on:
+            if isinstance(agg, str):
+                name = agg.replace(".", "_")
+                if name not in sources:
+                    raise ValueError(f"Not a valid column: {agg}")
+                agg = ("SUM" if sources[name][1] in (int, float) else "COUNT", agg)
+            function, column = agg[0].upper(), agg[1]
+            if function not in DB.AGGREGATES:
+                raise ValueError(f"Not a valid aggregate. Valid aggregates: {DB.AGGREGATES}")
+            if column == "*" and function != "COUNT":
+                raise ValueError("Only COUNT can aggregate on *")
+            aggregates.append((function, column))
+        return aggregates
+
+    @classmethod
+    def _group_by_query(
+        cls,
+        group_on: Union[str, list[str]],
+        aggregates: list[tuple[str, str]],
+        conditions: list[dict] = None,
+        having: list[dict] = None,
+        buckets: dict[str, str] = None,
+    ) -> tuple[str, list, Iterable[str]]:
+        """Builds the group_by query, returning (query, values, tables it reads)."""
+        meta = DB.get_meta(cls)
+        sources = meta.details_sources
+        used = set()
+
+        def source(column: str) -> tuple[str, type]:
+            name = column.replace(".", "_")
+            if name not in sources:
+                raise ValueError(f"Not a valid column: {column}")
+            used.add(name)
+            return sources[name]
+
+        group_on = [group_on] if isinstance(group_on, str) else list(group_on)
+        if not group_on:
+            raise ValueError("group_by needs at least one column to group on")
+        buckets = buckets or {}
+        for column, unit in buckets.items():
+            if column not in group_on:
+                raise ValueError(f"Bucketed column {column} is not grouped on")
+            if unit not in DB.TIME_BUCKETS:
+                raise ValueError(f"Not a valid time bucket. Valid buckets: {list(DB.TIME_BUCKETS)}")
+
+        selects, output_columns = [], {}
+        for column in group_on:
+            sql, col_type = source(column)
+            if column in buckets:
+                sql, col_type = f"strftime('{DB.TIME_BUCKETS[buckets[column]]}', {sql})", str
+            selects.append(f'{sql} AS "{column}"')
+            output_columns[column] = (sql, col_type)
+
+        for function, column in aggregates:
+            sql, col_type = ("*", int) if column == "*" else source(column)
+            name = f"{function}({column})"
+            expression = f"{function}({sql})"
+            selects.append(f'{expression} AS "{name}"')
+            output_columns[name] = (
+                expression,
+                int if function == "COUNT" else float if function == "AVG" else col_type,
+            )
+
+        where_clause, values = cls._build_condition_clause(conditions, sources)
+        used.update(DB._condition_names(conditions))
+        having_clause, having_values = cls._build_condition_clause(having, output_columns)
+
+        joined = any(not sources[n][0].startswith(f"{cls.__name__}.") for n in used if n in sources)
+        query = f"SELECT {', '.join(selects)} FROM {cls.__name__}"
+        if joined:
+            query += f" {meta.details_joins}"
+        if where_clause:
+            query += f" WHERE {where_clause}"
+        positions = ", ".join(str(i + 1) for i in range(len(group_on)))
+        query += f" GROUP BY {positions}"
+        if having_clause:
+            query += f" HAVING {having_clause}"
+        query += f" ORDER BY {positions}"
+
+        tables = meta.tables if joined else [cls.__name__]
+        return query, values + having_values, tables
+
+    @staticmethod
+    def _condition_names(conditions: Optional[list[dict]]) -> Iterator[str]:
+        for c in conditions or []:
+            if "and" in c or "or" in c:
+                yield from DB._condition_names(c.get("and", c.get("or")))
+            else:
+                yield c["column"]
+
+    # asyncio versions of the query methods, run on the worker threads of
+    # app.base.aio.async_executor: reads in parallel, writes one at a time.
+    # They take the same arguments plus timeout (seconds, default the executor's)
+    # and raise the same exceptions.
+
+    @classmethod
+    async def afind(cls, *args, timeout: float = None, **kwargs):
+        from app.base import aio
+
+        return await aio.async_executor.read(cls.find, *args, timeout=timeout, **kwargs)
+
+    @classmethod
+    async def afind_all_with_details(cls, *args, timeout: float = None, **kwargs):
+        from app.base import aio
+
+        return await aio.async_executor.read(
+            cls.find_all_with_details, *args, timeout=timeout, **kwargs
+        )
+
+    @classmethod
+    async def agroup_by(cls, *args, timeout: float = None, **kwargs):
+        from app.base import aio
+
+        return await aio.async_executor.read(cls.group_by, *args, timeout=timeout, **kwargs)
+
+    async def ainsert(self, timeout: float = None) -> None:
+        from app.base import aio
+
+        await aio.async_executor.write(self.insert, timeout=timeout)
+
+    @classmethod
+    async def ainsert_many(cls, *args, timeout: float = None, **kwargs) -> int:
+        from app.base import aio
+
+        return await aio.async_executor.write(cls.insert_many, *args, timeout=timeout, **kwargs)
+
+    @classmethod
+    async def aupdate(cls, *args, timeout: float = None, **kwargs) -> int:
+        from app.base import aio
+
+        return await aio.async_executor.write(cls.update, *args, timeout=timeout, **kwargs)
+
+    @classmethod
+    async def aupdate_many(cls, *args, timeout: float = None, **kwargs) -> list[int]:
+        from app.base import aio
+
+        return await aio.async_executor.write(cls.update_many, *args, timeout=timeout, **kwargs)
+
+    @classmethod
+    async def adelete(cls, *args, timeout: float = None, **kwargs) -> int:
+        from app.base import aio
+
+        return await aio.async_executor.write(cls.delete, *args, timeout=timeout, **kwargs)
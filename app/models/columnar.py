@@ -0,0 +1,130 @@
+"""
+Columnar export of query results into NumPy arrays, plus an on-disk bundle of
+.npy files that can be memory-mapped back. NumPy is only needed for this module.
+"""
+
+import json
+from pathlib import Path
+from typing import Type
+
+from app.base.connection import db_connection
+from app.base.logger import logger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BUNDLE_META = "columns.json"
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("Columnar export needs numpy: pip install numpy")
+
+
+def column_kinds(cls: Type, details: bool = False) -> dict[str, str]:
+    """
+    Maps each result column to how it is stored: "int", "float", "datetime" or "str".
+    Fields with datetime=True metadata become datetime64 columns.
+    """
+    tables = {cls.__name__: cls}
+    if details:
+        for fk in cls.get_foreign_keys(cls):
+            tables[fk["alias"]] = cls.__SUBCLASSES__[fk["to_table"]]
+
+    meta = cls.get_meta(cls)
+    kinds = {}
+    for column in meta.details_columns if details else meta.columns:
+        table, name = cls, column
+        if details:
+            alias = next(a for a in tables if column.startswith(f"{a}_"))
+            table, name = tables[alias], column[len(alias) + 1 :]
+
+        field = table.__dataclass_fields__[name]
+        field_type = table.get_meta(table).condition_columns[name][1]
+        if field.metadata.get("datetime"):
+            kinds[column] = "datetime"
+        elif field_type is int:
+            kinds[column] = "int"
+        elif field_type is float:
+            kinds[column] = "float"
+        else:
+            kinds[column] = "str"
+    return kinds
+
+
+def _to_array(values: list, kind: str):
+    if kind == "datetime":
+        return np.array(values, dtype="datetime64[s]")
+    if kind == "int":
+        try:
+            return np.array(values, dtype=np.int64)
+        except TypeError:
+            # NULLs in an integer column, fall back to float with NaN
+            return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if kind == "float":
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return np.array(["" if v is None else v for v in values], dtype=str)
+
+
+def query_columns(
+    cls: Type,
+    conditions: list[dict] = None,
+    details: bool = False,
+    chunk_size: int = 50000,
+) -> dict:
+    """
+    Streams a find / find_all_with_details query into one NumPy array per column.
+    Rows are converted chunk by chunk, so the result is never held as Python objects.
+    Text NULLs become "" and integer columns with NULLs become float64 with NaN.
+    """
+    _require_numpy()
+    kinds = column_kinds(cls, details)
+    if details:
+        query, values, _ = cls._details_query(conditions, None, None, None, None, False)
+    else:
+        query, values, _ = cls._find_query(conditions)
+
+    chunks: dict[str, list] = {}
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.row_factory = None
+        logger.info("Running columnar export query: %s with values %s", query, values)
+        cursor.execute(query, values)
+        columns = [d[0] for d in cursor.description]
+        for column in columns:
+            chunks[column] = []
+
+        while rows := cursor.fetchmany(chunk_size):
+            for column, col_values in zip(columns, zip(*rows)):
+                chunks[column].append(_to_array(list(col_values), kinds[column]))
+
+    return {
+        column: np.concatenate(parts) if parts else _to_array([], kinds[column])
+        for column, parts in chunks.items()
+    }
+
+
+def save_columns(columns: dict, path) -> Path:
+    """Writes one .npy file per column into the directory path, plus the column order."""
+    _require_numpy()
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    names = list(columns)
+    for i, name in enumerate(names):
+        np.save(path / f"{i}.npy", columns[name], allow_pickle=False)
+    (path / BUNDLE_META).write_text(json.dumps({"columns": names}))
+    return path
+
+
+def load_columns(path, mmap: bool = True) -> dict:
+    """Loads a bundle written by save_columns, memory-mapped read-only by default."""
+    _require_numpy()
+    path = Path(path)
+    names = json.loads((path / BUNDLE_META).read_text())["columns"]
+    mode = "r" if mmap else None
+    return {
+        name: np.load(path / f"{i}.npy", mmap_mode=mode, allow_pickle=False)
+        for i, name in enumerate(names)
+    }
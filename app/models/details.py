@@ -0,0 +1,155 @@
+"""
+Denormalized details tables. For a model with foreign keys, e.g. Flights, the
+FlightsDetails table holds the find_all_with_details rows already joined, one per
+Flights row, with the same aliased column names. Triggers keep it current: a changed
+Flights row is re-read through the joins, and a changed parent row (found through
+the foreign keys) updates its columns in the rows that reference it.
+
+While a model's details table exists, find_all_with_details and its filters and
+pagination read from it instead of joining, see DB._details_query. It costs an
+extra indexed row write per child write, so it is optional: set
+DB.DENORMALIZE_DETAILS before DB.intialise_all, or use enable_details.
+"""
+
+import sqlite3
+from typing import Type
+
+from app.base.connection import db_connection
+from app.base.logger import logger
+from app.models.base_model import DB
+
+SQL_TYPES = {int: "INTEGER", float: "REAL", str: "TEXT"}
+
+
+def details_table(cls: Type[DB]) -> str:
+    return f"{cls.__name__}Details"
+
+
+def _models() -> list[Type[DB]]:
+    return [model for model in DB.__SUBCLASSES__.values() if DB.get_meta(model).foreign_keys]
+
+
+def _create_statements(cls: Type[DB]) -> list[str]:
+    meta = DB.get_meta(cls)
+    table, name, pk = details_table(cls), cls.__name__, cls.primary_key
+    sources = meta.denormalized_sources
+
+    columns = []
+    for column in meta.details_columns:
+        sql_type = SQL_TYPES.get(sources[column][1], "")
+        key = " PRIMARY KEY" if column == f"{name}_{pk}" else ""
+        columns.append(f"{column} {sql_type}{key}")
+    statements = [f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})"]
+
+    # the child's own indexes, so filters and keyset pages on its columns stay indexed
+    for index in DB.get_indexes(cls):
+        index_columns = [f"{name}_{c}" for c in index]
+        statements.append(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(index)} ON {table} ({', '.join(index_columns)})"
+        )
+
+    def trigger(suffix: str, event: str, on: str, body: list[str]) -> str:
+        body = "".join(f"{s}; " for s in body)
+        return f"CREATE TRIGGER IF NOT EXISTS {table}_{suffix} AFTER {event} ON {on} BEGIN {body}END"
+
+    delete = f"DELETE FROM {table} WHERE {name}_{pk} = OLD.{pk}"
+    # OR REPLACE: an INSERT OR REPLACE on the child doesn't fire its delete trigger
+    insert = f"INSERT OR REPLACE INTO {table} {meta.details_query} WHERE {name}.{pk} = NEW.{pk}"
+    statements += [
+        trigger("insert", "INSERT", name, [insert]),
+        trigger("update", "UPDATE", name, [delete, insert]),
+        trigger("delete", "DELETE", name, [delete]),
+    ]
+
+    parents: dict[str, list[dict]] = {}
+    for fk in meta.foreign_keys:
+        parents.setdefault(fk["to_table"], []).append(fk)
+    for parent, fks in parents.items():
+        on_insert, on_update, on_delete = [], [], []
+        for fk in fks:
+            alias, to_column = fk["alias"], fk["to_column"]
+            copied = [c for c in meta.details_columns if c.startswith(f"{alias}_") and c != f"{alias}_{to_column}"]
+            parent_columns = [c.removeprefix(f"{alias}_") for c in copied]
+            reference = f"{name}_{fk['from_column']}"
+            set_new = ", ".join(f"{c} = NEW.{p}" for c, p in zip(copied, parent_columns))
+            set_null = ", ".join(f"{c} = NULL" for c in copied)
+
+            on_insert.append(f"UPDATE {table} SET {set_new} WHERE {reference} = NEW.{to_column}")
+            # rows left pointing at a changed key no longer join, like in the LEFT JOIN
+            on_update += [
+                f"UPDATE {table} SET {set_null} WHERE {reference} = OLD.{to_column} AND OLD.{to_column} IS NOT NEW.{to_column}",
+                f"UPDATE {table} SET {set_new} WHERE {reference} = NEW.{to_column}",
+            ]
+            on_delete.append(f"UPDATE {table} SET {set_null} WHERE {reference} = OLD.{to_column}")
+        statements += [
+            trigger(f"{parent}_insert", "INSERT", parent, on_insert),
+            trigger(f"{parent}_update", "UPDATE", parent, on_update),
+            trigger(f"{parent}_delete", "DELETE", parent, on_delete),
+        ]
+    return statements
+
+
+def _tables(connection: sqlite3.Connection) -> set[str]:
+    return {row[0] for row in connection.execute("SELECT name FROM sqlite_schema WHERE type='table'")}
+
+
+def _fill(connection: sqlite3.Connection, cls: Type[DB]) -> None:
+    table = details_table(cls)
+    connection.execute(f"DELETE FROM {table}")
+    connection.execute(f"INSERT INTO {table} {DB.get_meta(cls).details_query}")
+
+
+def create_details(connection: sqlite3.Connection) -> None:
+    """Creates the details tables and their triggers, filling any new table."""
+    existing = _tables(connection)
+    for cls in _models():
+        for statement in _create_statements(cls):
+            logger.info("running sql %s", statement)
+            connection.execute(statement)
+        if details_table(cls) not in existing:
+            _fill(connection, cls)
+        DB.__DETAILS_TABLES__.add(cls.__name__)
+    connection.commit()
+
+
+def load_details(connection: sqlite3.Connection) -> None:
+    """Starts reading from the details tables that already exist in the database."""
+    existing = _tables(connection)
+    DB.__DETAILS_TABLES__.clear()
+    DB.__DETAILS_TABLES__.update(cls.__name__ for cls in _models() if details_table(cls) in existing)
+
+
+def enable_details() -> None:
+    with db_connection() as connection:
+        create_details(connection)
+
+
+def disable_details() -> None:
+    """Drops the details tables and their triggers, find_all_with_details joins again."""
+    with db_connection() as connection:
+        for cls in _models():
+            DB.__DETAILS_TABLES__.discard(cls.__name__)
+            logger.info("dropping %s", details_table(cls))
+            # dropping a table drops its triggers, but these are on the source tables
+            triggers = connection.execute(
+                "SELECT name FROM sqlite_schema WHERE type='trigger' AND name GLOB ?",
+                (f"{details_table(cls)}_*",),
+            ).fetchall()
+            for (trigger,) in triggers:
+                connection.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            connection.execute(f"DROP TABLE IF EXISTS {details_table(cls)}")
+        connection.commit()
+
+
+def rebuild_details() -> None:
+    """Refills every details table from the joined query in one transaction."""
+    with db_connection() as connection:
+        try:
+            connection.execute("BEGIN")
+            for cls in _models():
+                if cls.__name__ in DB.__DETAILS_TABLES__:
+                    _fill(connection, cls)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
@@ -1,11 +1,36 @@
+import sqlite3
 from dataclasses import dataclass, field
-from typing import Optional
+from datetime import datetime, timedelta
+from heapq import heappop, heappush
+from itertools import groupby
+from typing import Iterable, Iterator, Optional
+from app.base.connection import db_connection
+from app.base.exceptions import ScheduleConflictError
+from app.base.logger import logger
 from app.models.base_model import DB
 
-@dataclass
-class Flights(DB, primary_key="flight_id"):
-    departure_time: str
-    arrival_time: str
+# columns a pilot or aircraft can't be double booked on
+RESOURCES = ("pilot_id", "aircraft_id")
+# cancelled flights don't occupy their pilot or aircraft
+CANCELLED = "Cancelled"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# a flight's length in days, indexed per resource so the longest one is a single lookup
+DURATION = "julianday(arrival_time) - julianday(departure_time)"
+
+
+@dataclass(slots=True)
+class Flights(
+    DB,
+    primary_key="flight_id",
+    indexes=[
+        "departure_time",
+        ("departure_id", "departure_time"),
+        ("pilot_id", "departure_time"),
+        ("aircraft_id", "departure_time"),
+    ],
+):
+    departure_time: str = field(metadata={"datetime": True})
+    arrival_time: str = field(metadata={"datetime": True})
     status: str
     pilot_id: int = field(
         metadata={"foreign_key": {"table": "Pilots", "column": "pilot_id"}}
@@ -33,3 +58,159 @@ class Flights(DB, primary_key="flight_id"):
     )
     flight_id: Optional[int] = None
 
+    def insert(self, check_conflicts: bool = True) -> None:
+        """
+        Inserts the flight, refusing it if its pilot or aircraft is already booked for an
+        overlapping time. Check and insert run in one write transaction, so a concurrent
+        writer can't book the same slot in between. Inside a transaction the caller has
+        open, they run under a savepoint and a conflict only undoes this insert.
+        """
+        if not check_conflicts or self.status == CANCELLED:
+            # zero argument super() doesn't work in slots dataclasses
+            DB.insert(self)
+            return
+
+        with db_connection() as connection:
+            own = not connection.in_transaction
+            connection.execute("BEGIN IMMEDIATE" if own else "SAVEPOINT flight_insert")
+            try:
+                conflicts = self.find_conflicts()
+                if conflicts:
+                    ids = sorted({c["flight_id"] for c in conflicts})
+                    raise ScheduleConflictError(
+                        f"Flight overlaps with flight(s) {ids} for the same pilot or aircraft"
+                    )
+                DB.insert(self)
+            except BaseException:
+                if own:
+                    connection.rollback()
+                else:
+                    connection.execute("ROLLBACK TO flight_insert")
+                    connection.execute("RELEASE flight_insert")
+                raise
+            if own:
+                connection.commit()
+                # again, a reader may have cached the table between the insert and the commit
+                DB._invalidate(Flights)
+            else:
+                connection.execute("RELEASE flight_insert")
+
+    def find_conflicts(self) -> list[dict]:
+        """
+        Returns stored flights, other than cancelled ones, sharing this flight's pilot or
+        aircraft with an overlapping time window. Uses the (resource, departure_time)
+        indexes: flights departing inside the window, and before it back to the longest
+        stored flight of the resource, which may still be airborne. The stored schedule
+        can have overlaps of its own (insert_many, update and imports don't check), so
+        the lookback is bounded by duration rather than by the last flight, see
+        create_duration_indexes.
+        """
+        conflicts = {}
+        try:
+            departure = datetime.fromisoformat(self.departure_time)
+        except (TypeError, ValueError):
+            # no time to count back from, every earlier flight is a candidate
+            departure = None
+        with db_connection() as connection:
+            for resource in RESOURCES:
+                value = getattr(self, resource)
+                # cancelled flights included, they only lengthen the lookback
+                longest = DB._execute(
+                    connection.cursor(),
+                    f"SELECT MAX({DURATION}) FROM Flights WHERE {resource} = ?",
+                    (value,),
+                ).fetchone()[0]
+                since = ""
+                if longest is not None and departure is not None:
+                    # a second of slack for julianday's rounding
+                    since = (departure - timedelta(days=max(0, longest), seconds=1)).strftime(TIME_FORMAT)
+                rows = DB._execute(
+                    connection.cursor(),
+                    f"SELECT * FROM Flights WHERE {resource} = ? AND departure_time >= ? "
+                    "AND departure_time < ? AND flight_id IS NOT ? AND status IS NOT ?",
+                    (value, since, self.arrival_time, self.flight_id, CANCELLED),
+                )
+                for row in rows.fetchall():
+                    if row["arrival_time"] > self.departure_time:
+                        conflicts[row["flight_id"]] = dict(row)
+        return list(conflicts.values())
+
+    @classmethod
+    def schedule_conflicts(cls, flights: Iterable[dict] = None) -> list[dict]:
+        """
+        Finds every pair of flights that double book a pilot or aircraft in O(n log n).
+        Cancelled flights are left out.
+        Scans the stored schedule by default, or checks the given flight dicts (e.g. a
+        schedule about to be imported). Returns dicts with resource, resource_id and the
+        flight_ids pair; for given flights also the positions pair, their indexes in
+        flights, as flights that aren't stored yet have no flight_id (None).
+        """
+        if flights is not None:
+            flights = [
+                {**f, "position": i} for i, f in enumerate(flights) if f.get("status") != CANCELLED
+            ]
+            ids = {f["position"]: f.get("flight_id") for f in flights}
+
+        report = []
+        for resource in RESOURCES:
+            for resource_id, intervals in _intervals_by_resource(resource, flights):
+                for pair in _overlapping_pairs(intervals):
+                    conflict = {"resource": resource, "resource_id": resource_id, "flight_ids": pair}
+                    if flights is not None:
+                        conflict["flight_ids"] = (ids[pair[0]], ids[pair[1]])
+                        conflict["positions"] = pair
+                    report.append(conflict)
+
+        logger.info("schedule scan found %d conflicts", len(report))
+        return report
+
+
+def _intervals_by_resource(
+    resource: str, flights: Optional[list[dict]]
+) -> Iterator[tuple]:
+    """Yields (resource_id, intervals sorted by departure) for one resource column."""
+    if flights is None:
+        # streams in index order, so only one resource's flights are held at a time
+        with db_connection() as connection:
+            rows = connection.execute(
+                f"SELECT {resource}, departure_time, arrival_time, flight_id FROM Flights "
+                f"WHERE status IS NOT ? ORDER BY {resource}, departure_time",
+                (CANCELLED,),
+            )
+            for resource_id, group in groupby(rows, key=lambda r: r[0]):
+                yield resource_id, (tuple(r)[1:] for r in group)
+        return
+
+    rows = sorted(
+        (
+            (f[resource], f["departure_time"], f["arrival_time"], f["position"])
+            for f in flights
+        ),
+        key=lambda r: (str(r[0]), r[1]),
+    )
+    for resource_id, group in groupby(rows, key=lambda r: r[0]):
+        yield resource_id, (r[1:] for r in group)
+
+
+def _overlapping_pairs(intervals: Iterable[tuple]) -> Iterator[tuple]:
+    """
+    Sweeps (departure, arrival, flight_id) intervals sorted by departure, keeping a heap
+    of flights still airborne. Back to back flights (arrival == next departure) don't overlap.
+    """
+    airborne = []
+    for departure, arrival, flight_id in intervals:
+        while airborne and airborne[0][0] <= departure:
+            heappop(airborne)
+        for _, other in airborne:
+            yield (other, flight_id)
+        heappush(airborne, (arrival, flight_id))
+
+
+def create_duration_indexes(connection: sqlite3.Connection) -> None:
+    """Creates the (resource, duration) expression indexes find_conflicts reads its lookback from."""
+    for resource in RESOURCES:
+        create_index = (
+            f"CREATE INDEX IF NOT EXISTS idx_Flights_{resource}_duration ON Flights ({resource}, ({DURATION}))"
+        )
+        logger.info("running sql %s", create_index)
+        connection.execute(create_index)
@@ -0,0 +1,256 @@
+"""
+Parallel full-table reports. The table is split into ranges of one column (the
+primary key or a datetime column such as departure_time), each range runs as its
+own query on a worker with a read-only connection, and the partial results are
+merged: partial aggregates are combined in an in-memory SQLite database, which also
+applies HAVING and the ordering, and rows are merged in order.
+
+Threads are the default. SQLite releases the GIL while a query runs, so aggregate
+queries scale with cores on threads; row exports spend more time building Python
+tuples and can use processes instead. Processes are started with "spawn", never
+fork, so they don't inherit the pooled connections or a lock held by one of the
+parent's threads (e.g. the logger's listener). Each worker imports the app afresh,
+starting its own logger listener, so the calling script's main module must be
+importable without side effects (the usual `if __name__ == "__main__":`).
+
+The workers only see committed data and bypass the query cache.
+"""
+
+import heapq
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Type, Union
+
+from app.base.connection import ConnectionPool, bind_pool, db_connection, pool_database
+from app.base.logger import logger
+from app.models.base_model import DB
+from app.models.results import ResultSet
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# how partial aggregates combine: the partial functions each one needs, and the merge
+PARTIALS = {
+    "COUNT": (["COUNT"], "SUM({0})"),
+    "SUM": (["SUM"], "SUM({0})"),
+    "MIN": (["MIN"], "MIN({0})"),
+    "MAX": (["MAX"], "MAX({0})"),
+    "AVG": (["SUM", "COUNT"], "CAST(SUM({0}) AS REAL) / SUM({1})"),
+}
+
+
+def partitions(cls: Type[DB], count: int, column: str = None) -> list[list[dict]]:
+    """
+    Splits cls's table into count ranges of equal width on column (default the primary
+    key), returned as condition lists. The first and last ranges have no outer bound.
+    Rows with a NULL column get one more range.
+    The column should be indexed, it is read once for its MIN and MAX.
+    """
+    column = column or cls.primary_key
+    columns = DB.get_meta(cls).condition_columns
+    if column not in columns:
+        raise ValueError(f"Not a valid column to partition on: {column}")
+    is_time = cls.__dataclass_fields__[column].metadata.get("datetime", False)
+    if not is_time and columns[column][1] is not int:
+        raise ValueError("Partition on an integer or datetime column")
+
+    with db_connection() as conn:
+        low, high = conn.execute(f"SELECT MIN({column}), MAX({column}) FROM {cls.__name__}").fetchone()
+
+    ranges = [[{"column": column, "operator": "IS NULL"}]]
+    if low is None:
+        return ranges
+    if is_time:
+        low, high = datetime.fromisoformat(low), datetime.fromisoformat(high)
+    step = (high - low) / max(1, count)
+    cuts = [low + step * i for i in range(1, count)]
+    if is_time:
+        cuts = [b.strftime(TIME_FORMAT) for b in cuts]
+    else:
+        cuts = [int(b) for b in cuts]
+    cuts = sorted(set(cuts))
+
+    # the outer ranges are open ended, so values stored in another ISO form past the
+    # MIN/MAX read (T separator, fractions) or inserted after it still land in one
+    if not cuts:
+        ranges.append([{"column": column, "operator": "IS NOT NULL"}])
+        return ranges
+    ranges.append([{"column": column, "operator": "<", "value": cuts[0]}])
+    for lower, upper in zip(cuts, cuts[1:]):
+        ranges.append(
+            [
+                {"column": column, "operator": ">=", "value": lower},
+                {"column": column, "operator": "<", "value": upper},
+            ]
+        )
+    ranges.append([{"column": column, "operator": ">=", "value": cuts[-1]}])
+    return ranges
+
+
+def _bind_read_only(database: str) -> None:
+    bind_pool(ConnectionPool(1, database=database, read_only=True))
+
+
+def _run_query(query: str, values: list) -> tuple[list[str], list[tuple]]:
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(query, values)
+        return [d[0] for d in cursor.description], cursor.fetchall()
+
+
+@contextmanager
+def _executor(workers: int, processes: bool) -> Executor:
+    database = pool_database()
+    if processes:
+        if "vfs=memdb" in database:
+            raise ValueError("Processes can't read the in-memory replica, use threads")
+        with ProcessPoolExecutor(
+            workers, multiprocessing.get_context("spawn"), _bind_read_only, (database,)
+        ) as executor:
+            yield executor
+        return
+
+    pool = ConnectionPool(workers, database=database, read_only=True)
+    try:
+        with ThreadPoolExecutor(workers, "db-partition", bind_pool, (pool,)) as executor:
+            yield executor
+    finally:
+        pool.close()
+
+
+def _run_partitions(
+    queries: list[tuple[str, list]], workers: int, processes: bool
+) -> list[tuple[list[str], list[tuple]]]:
+    logger.info("running %d partition queries on %d workers", len(queries), workers)
+    with _executor(workers, processes) as executor:
+        futures = [executor.submit(_run_query, query, values) for query, values in queries]
+        return [f.result() for f in futures]
+
+
+def _workers(workers: Optional[int]) -> int:
+    workers = workers or os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    return workers
+
+
+def group_by(
+    cls: Type[DB],
+    group_on: Union[str, list[str]],
+    agg_on: Union[str, list] = None,
+    conditions: list[dict] = None,
+    having: list[dict] = None,
+    buckets: dict[str, str] = None,
+    rows: str = "dict",
+    workers: int = None,
+    partition_on: str = None,
+    processes: bool = False,
+) -> Union[list[dict], ResultSet]:
+    """
+    DB.group_by run over partitions of partition_on (default the primary key) on
+    workers threads or processes, default one per core. Returns the same rows.
+    """
+    if rows not in ("dict", "tuple"):
+        raise ValueError('rows must be "dict" or "tuple"')
+    workers = _workers(workers)
+    group_on = [group_on] if isinstance(group_on, str) else list(group_on)
+    aggregates = cls._aggregates(agg_on)
+
+    # each aggregate becomes one or two partial aggregates, merged by position
+    sources = DB.get_meta(cls).details_sources
+    partial, merges = [], []
+    for function, column in aggregates:
+        functions, merge = PARTIALS[function]
+        positions = [f"a{len(partial) + i}" for i in range(len(functions))]
+        partial += [(f, column) for f in functions]
+        if function in ("COUNT", "AVG"):
+            output_type = int if function == "COUNT" else float
+        else:
+            output_type = sources[column.replace(".", "_")][1]
+        merges.append((f"{function}({column})", merge.format(*positions), output_type))
+
+    queries = [
+        cls._group_by_query(group_on, partial, (conditions or []) + part, None, buckets)[:2]
+        for part in partitions(cls, workers * 4, partition_on)
+    ]
+    results = _run_partitions(queries, workers, processes)
+
+    keys = [f"g{i}" for i in range(len(group_on))]
+    columns = keys + [f"a{i}" for i in range(len(partial))]
+    output_columns = {name: (key, object) for name, key in zip(group_on, keys)}
+    output_columns.update({name: (merge, t) for name, merge, t in merges})
+    having_clause, values = cls._build_condition_clause(having, output_columns)
+
+    selects = [f'{sql} AS "{name}"' for name, (sql, _) in output_columns.items()]
+    positions = ", ".join(str(i + 1) for i in range(len(group_on)))
+    query = f"SELECT {', '.join(selects)} FROM partials GROUP BY {positions}"
+    if having_clause:
+        query += f" HAVING {having_clause}"
+    query += f" ORDER BY {positions}"
+
+    merged = sqlite3.connect(":memory:")
+    try:
+        merged.execute(f"CREATE TABLE partials ({', '.join(columns)})")
+        questions = ", ".join(["?"] * len(columns))
+        for _, partial_rows in results:
+            merged.executemany(f"INSERT INTO partials VALUES ({questions})", partial_rows)
+        cursor = merged.execute(query, values)
+        result = ResultSet([d[0] for d in cursor.description], cursor.fetchall())
+    finally:
+        merged.close()
+    return result if rows == "tuple" else result.as_dicts()
+
+
+def find_all_with_details(
+    cls: Type[DB],
+    conditions: list[dict] = None,
+    order_by: str = None,
+    limit: int = None,
+    descending: bool = False,
+    rows: str = "dict",
+    workers: int = None,
+    partition_on: str = None,
+    processes: bool = False,
+) -> Union[list[dict], ResultSet]:
+    """
+    DB.find_all_with_details run over partitions of partition_on (default the primary
+    key) on workers threads or processes. Rows come back in the same order: the
+    partitions are concatenated when ordering by partition_on, otherwise merged.
+    """
+    if rows not in ("dict", "tuple"):
+        raise ValueError('rows must be "dict" or "tuple"')
+    workers = _workers(workers)
+    pk = cls.primary_key
+    partition_on = partition_on or pk
+    order_by = order_by or pk
+
+    parts = partitions(cls, workers * 4, partition_on)
+    queries = [
+        cls._details_query((conditions or []) + part, order_by, limit, None, None, descending)[:2]
+        for part in parts
+    ]
+    results = _run_partitions(queries, workers, processes)
+    columns = results[0][0]
+
+    # partitions come in ascending order with the NULL one first, where SQLite sorts NULLs
+    if descending:
+        results = results[::-1]
+    if order_by == partition_on:
+        merged = [row for _, part_rows in results for row in part_rows]
+    else:
+        table = cls.__name__
+        key_positions = [columns.index(f"{table}_{k}") for k in dict.fromkeys([order_by, pk])]
+
+        def key(row: tuple) -> tuple:
+            return tuple((row[p] is not None, row[p]) for p in key_positions)
+
+        merged = list(heapq.merge(*(r for _, r in results), key=key, reverse=descending))
+    if limit is not None:
+        merged = merged[: int(limit)]
+
+    result = ResultSet.with_shared_values(columns, merged, len(DB.get_meta(cls).columns))
+    return result if rows == "tuple" else result.as_dicts()
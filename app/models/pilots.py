@@ -2,7 +2,7 @@ from dataclasses import dataclass, field
 from typing import Optional
 from app.models.base_model import DB
 
-@dataclass
+@dataclass(slots=True)
 class Pilots(DB, primary_key="pilot_id"):
     first_name: str
     last_name: str
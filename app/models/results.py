@@ -0,0 +1,57 @@
+from typing import Iterator, Sequence
+
+
+class ResultSet:
+    """
+    Compact query result: rows are plain tuples sharing a single column header
+    instead of one dict per row.
+    """
+
+    __slots__ = ("columns", "rows")
+
+    def __init__(self, columns: Sequence[str], rows: Sequence[tuple]):
+        self.columns = tuple(columns)
+        self.rows = tuple(rows)
+
+    @classmethod
+    def with_shared_values(
+        cls, columns: Sequence[str], rows: Sequence[tuple], start: int
+    ) -> "ResultSet":
+        """
+        Builds a ResultSet where equal strings in columns from index start onwards are
+        one shared object. Joined parent columns repeat on every child row, so this
+        roughly halves the memory of wide joined results. Only strings are shared: a
+        memo keyed by value would merge 1 and 1.0 across columns.
+        """
+        memo = {}
+        shared = memo.setdefault
+        return cls(
+            columns,
+            [
+                row[:start] + tuple([shared(v, v) if type(v) is str else v for v in row[start:]])
+                for row in rows
+            ],
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[tuple]:
+        return iter(self.rows)
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+    def __repr__(self) -> str:
+        return f"ResultSet(columns={self.columns}, rows={len(self.rows)})"
+
+    def reversed(self) -> "ResultSet":
+        return ResultSet(self.columns, self.rows[::-1])
+
+    def column(self, name: str) -> list:
+        """Returns all values of one column."""
+        i = self.columns.index(name)
+        return [row[i] for row in self.rows]
+
+    def as_dicts(self) -> list[dict]:
+        return [dict(zip(self.columns, row)) for row in self.rows]
@@ -0,0 +1,319 @@
+"""
+In-memory time-dependent route graph of the Flights table for connection search.
+Each airport keeps its departures sorted by time in flat arrays, so finding the next
+flights out of an airport is a bisect. A FlightChanges log, kept by triggers on
+Flights, lets the graph apply only the flights that changed since it was built.
+The log is optional (DB.LOG_FLIGHT_CHANGES or enable_change_log); without it the
+graph is rebuilt after any write made through the models.
+"""
+
+import sqlite3
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.base.cache import query_cache
+from app.base.connection import db_connection
+from app.base.logger import logger
+
+EPOCH = datetime(1970, 1, 1)
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# flights whose change can move a leg in the graph
+GRAPH_COLUMNS = ("flight_id", "departure_time", "arrival_time", "status", "departure_id", "destination_id")
+
+LEG_QUERY = (
+    "SELECT departure_id, CAST(strftime('%s', departure_time) AS INTEGER), "
+    "CAST(strftime('%s', arrival_time) AS INTEGER), destination_id, flight_id FROM Flights "
+    "WHERE status IS NOT 'Cancelled' AND departure_id IS NOT NULL AND destination_id IS NOT NULL "
+    "AND strftime('%s', departure_time) IS NOT NULL AND strftime('%s', arrival_time) IS NOT NULL"
+)
+
+
+def create_change_log(connection: sqlite3.Connection) -> None:
+    """
+    Creates FlightChanges and its triggers. It holds one row per changed flight_id with
+    the sequence number of its latest change, so it never grows past the flights ever stored.
+    """
+    replace = "INSERT OR REPLACE INTO FlightChanges (flight_id) VALUES ({row}.flight_id); "
+    statements = [
+        "CREATE TABLE IF NOT EXISTS FlightChanges "
+        "(seq INTEGER PRIMARY KEY AUTOINCREMENT, flight_id INTEGER NOT NULL UNIQUE)",
+        "CREATE TRIGGER IF NOT EXISTS FlightChanges_insert AFTER INSERT ON Flights "
+        f"BEGIN {replace.format(row='NEW')}END",
+        "CREATE TRIGGER IF NOT EXISTS FlightChanges_delete AFTER DELETE ON Flights "
+        f"BEGIN {replace.format(row='OLD')}END",
+        f"CREATE TRIGGER IF NOT EXISTS FlightChanges_update AFTER UPDATE OF {', '.join(GRAPH_COLUMNS)} "
+        f"ON Flights BEGIN {replace.format(row='OLD')}{replace.format(row='NEW')}END",
+    ]
+    for statement in statements:
+        logger.info("running sql %s", statement)
+        connection.execute(statement)
+    connection.commit()
+
+
+def has_change_log(connection: sqlite3.Connection) -> bool:
+    return connection.execute(
+        "SELECT 1 FROM sqlite_schema WHERE type='table' AND name='FlightChanges'"
+    ).fetchone() is not None
+
+
+def enable_change_log() -> None:
+    with db_connection() as connection:
+        create_change_log(connection)
+
+
+def disable_change_log() -> None:
+    """Drops FlightChanges and its triggers, graphs rebuild on writes from then on."""
+    with db_connection() as connection:
+        for event in ("insert", "delete", "update"):
+            connection.execute(f"DROP TRIGGER IF EXISTS FlightChanges_{event}")
+        connection.execute("DROP TABLE IF EXISTS FlightChanges")
+        connection.commit()
+
+
+def _to_seconds(value: str) -> int:
+    return int((datetime.fromisoformat(value) - EPOCH).total_seconds())
+
+
+def _to_time(seconds: int) -> str:
+    return (EPOCH + timedelta(seconds=seconds)).strftime(TIME_FORMAT)
+
+
+class RouteGraph:
+    """
+    Airports are numbered and each one has parallel arrays of its departures sorted by
+    departure time: departure and arrival (epoch seconds), destination and flight_id.
+    Cancelled flights are left out. With auto_refresh the searches first apply the
+    FlightChanges since the last build or refresh, see refresh.
+    """
+
+    def __init__(self, auto_refresh: bool = True, rebuild_ratio: float = 0.1):
+        self.auto_refresh = auto_refresh
+        self.rebuild_ratio = rebuild_ratio
+        self._reset()
+
+    def _reset(self) -> None:
+        self.built = False
+        self._codes: list[str] = []
+        self._index: dict[str, int] = {}
+        self._departures: list[array] = []
+        self._arrivals: list[array] = []
+        self._destinations: list[array] = []
+        self._flight_ids: list[array] = []
+        # (origin airport number, departure) by flight_id, for the flights in the graph
+        self._origin: dict[int, tuple[int, int]] = {}
+        self._legs = 0
+        self._seq = 0
+        # without a change log, the query cache version the graph was built at
+        self._logged = False
+        self._version = 0
+
+    def __len__(self) -> int:
+        return self._legs
+
+    def _airport(self, code: str) -> int:
+        i = self._index.get(code)
+        if i is None:
+            i = self._index[code] = len(self._codes)
+            self._codes.append(code)
+            self._departures.append(array("q"))
+            self._arrivals.append(array("q"))
+            self._destinations.append(array("i"))
+            self._flight_ids.append(array("q"))
+        return i
+
+    def build(self) -> "RouteGraph":
+        """Loads every leg in one pass over the (departure_id, departure_time) index."""
+        self._reset()
+        with db_connection() as connection:
+            # one read transaction, so the change log position matches the legs read
+            self._version = query_cache.version()
+            connection.execute("BEGIN")
+            try:
+                self._logged = has_change_log(connection)
+                if self._logged:
+                    self._seq = connection.execute(
+                        "SELECT COALESCE(MAX(seq), 0) FROM FlightChanges"
+                    ).fetchone()[0]
+                rows = connection.execute(f"{LEG_QUERY} ORDER BY departure_id, departure_time")
+                origin = None
+                for code, departure, arrival, destination, flight_id in rows:
+                    if code != origin:
+                        origin, o = code, self._airport(code)
+                    self._departures[o].append(departure)
+                    self._arrivals[o].append(arrival)
+                    self._destinations[o].append(self._airport(destination))
+                    self._flight_ids[o].append(flight_id)
+                    self._origin[flight_id] = (o, departure)
+                    self._legs += 1
+            finally:
+                connection.rollback()
+
+        self.built = True
+        logger.info("route graph built: %d airports, %d legs", len(self._codes), self._legs)
+        return self
+
+    def refresh(self) -> int:
+        """
+        Applies the flights changed since the last build or refresh and returns how many.
+        Rebuilds instead when more than rebuild_ratio of the legs changed, or without a
+        change log when anything was written through the models, returning the legs read.
+        """
+        if not self.built:
+            self.build()
+            return 0
+        if not self._logged:
+            if query_cache.version() == self._version:
+                return 0
+            return len(self.build())
+
+        with db_connection() as connection:
+            connection.execute("BEGIN")
+            try:
+                changes = connection.execute(
+                    "SELECT seq, flight_id FROM FlightChanges WHERE seq > ? ORDER BY seq", (self._seq,)
+                ).fetchall()
+                if not changes:
+                    return 0
+                if len(changes) > max(1000, self._legs * self.rebuild_ratio):
+                    connection.rollback()
+                    self.build()
+                    return len(changes)
+
+                flight_ids = [c[1] for c in changes]
+                rows = []
+                for i in range(0, len(flight_ids), 500):
+                    chunk = flight_ids[i : i + 500]
+                    rows += connection.execute(
+                        f"{LEG_QUERY} AND flight_id IN ({', '.join(['?'] * len(chunk))})", chunk
+                    ).fetchall()
+            finally:
+                connection.rollback()
+
+        self._seq = changes[-1][0]
+        for flight_id in flight_ids:
+            self._remove(flight_id)
+        for code, departure, arrival, destination, flight_id in rows:
+            self._add(self._airport(code), departure, arrival, self._airport(destination), flight_id)
+
+        logger.info("route graph refreshed: %d flights changed", len(flight_ids))
+        return len(flight_ids)
+
+    def _remove(self, flight_id: int) -> None:
+        origin = self._origin.pop(flight_id, None)
+        if origin is None:
+            return
+        o, departure = origin
+        # the departures are sorted, so only the flights leaving at the same time are scanned
+        i = bisect_left(self._departures[o], departure)
+        while self._flight_ids[o][i] != flight_id:
+            i += 1
+        for column in (self._departures, self._arrivals, self._destinations, self._flight_ids):
+            del column[o][i]
+        self._legs -= 1
+
+    def _add(self, o: int, departure: int, arrival: int, destination: int, flight_id: int) -> None:
+        i = bisect_right(self._departures[o], departure)
+        self._departures[o].insert(i, departure)
+        self._arrivals[o].insert(i, arrival)
+        self._destinations[o].insert(i, destination)
+        self._flight_ids[o].insert(i, flight_id)
+        self._origin[flight_id] = (o, departure)
+        self._legs += 1
+
+    def connections(
+        self,
+        origin: str,
+        destination: str,
+        depart_after: str,
+        max_legs: int = 3,
+        min_connect: int = 45,
+        max_hours: Optional[float] = 48,
+    ) -> list[list[dict]]:
+        """
+        Returns the Pareto optimal journeys from origin to destination leaving at or after
+        depart_after: the fewest legs journey first, then every journey with more legs that
+        arrives earlier, so the last one is the earliest arrival. Connections need at least
+        min_connect minutes and journeys must arrive within max_hours of depart_after
+        (None for no limit), which bounds how far ahead each airport's departures are
+        scanned. Each journey is a list of leg dicts.
+
+        Searches in rounds, round k finding the earliest arrival at every airport with k legs,
+        and only rescans the airports whose arrival improved in the previous round.
+        """
+        if self.auto_refresh or not self.built:
+            self.refresh()
+        if origin not in self._index or destination not in self._index or origin == destination:
+            return []
+
+        start, target = self._index[origin], self._index[destination]
+        t0 = _to_seconds(depart_after)
+        connect = min_connect * 60
+        horizon = float("inf") if max_hours is None else t0 + max_hours * 3600
+
+        best = {start: t0}
+        # rounds[k][airport] = (arrival, departure airport, position of the leg)
+        rounds = [{start: (t0, None, None)}]
+        marked = [start]
+        journeys = []
+        for k in range(1, max_legs + 1):
+            labels = {}
+            target_best = best.get(target, horizon)
+            for a in marked:
+                arrived = rounds[k - 1][a][0]
+                ready = arrived if k == 1 else arrived + connect
+                latest = target_best
+                departures, arrivals, destinations = (
+                    self._departures[a],
+                    self._arrivals[a],
+                    self._destinations[a],
+                )
+                for i in range(bisect_left(departures, ready), len(departures)):
+                    if departures[i] > latest:
+                        break
+                    arrival, to = arrivals[i], destinations[i]
+                    if arrival < best.get(to, horizon) and arrival <= target_best:
+                        best[to] = arrival
+                        labels[to] = (arrival, a, i)
+                        if to == target:
+                            target_best = latest = arrival
+
+            rounds.append(labels)
+            if target in labels:
+                journeys.append(self._journey(rounds, k, target))
+            marked = [a for a in labels if a != target]
+            if not marked:
+                break
+        return journeys
+
+    def _journey(self, rounds: list[dict], k: int, airport: int) -> list[dict]:
+        legs = []
+        for r in range(k, 0, -1):
+            _, a, i = rounds[r][airport]
+            legs.append(
+                {
+                    "flight_id": self._flight_ids[a][i],
+                    "departure_id": self._codes[a],
+                    "destination_id": self._codes[airport],
+                    "departure_time": _to_time(self._departures[a][i]),
+                    "arrival_time": _to_time(self._arrivals[a][i]),
+                }
+            )
+            airport = a
+        return legs[::-1]
+
+    def earliest_arrival(self, origin: str, destination: str, depart_after: str, **kwargs) -> list[dict]:
+        """The journey arriving first, or [] if there is none. Takes the connections options."""
+        journeys = self.connections(origin, destination, depart_after, **kwargs)
+        return journeys[-1] if journeys else []
+
+    def fewest_legs(self, origin: str, destination: str, depart_after: str, **kwargs) -> list[dict]:
+        """The journey with the fewest legs (earliest arriving among those), or []."""
+        journeys = self.connections(origin, destination, depart_after, **kwargs)
+        return journeys[0] if journeys else []
+
+
+# shared graph, built on its first search
+route_graph = RouteGraph()
@@ -0,0 +1,198 @@
+"""
+Materialized summaries of the Flights table: flights per route, aircraft utilisation
+and pilot hours. SQLite triggers on Flights keep them current on every write path,
+including insert_many and ON DELETE/UPDATE cascades from the parent tables, so reads
+only touch the summary rows. rebuild_summaries recomputes them from scratch.
+
+The triggers add work to every Flights write, so the tables are optional: set
+DB.MATERIALIZE_SUMMARIES before DB.intialise_all, or use enable_summaries. Without
+them the same summaries are aggregated from Flights on each read.
+"""
+
+import sqlite3
+from typing import Union
+
+from app.base.connection import db_connection
+from app.base.logger import logger
+from app.models.base_model import DB
+from app.models.results import ResultSet
+
+# block minutes of one flight, cancelled flights and missing or unparsable times don't add hours
+MINUTES = (
+    "CASE WHEN {row}.status = 'Cancelled' THEN 0 ELSE COALESCE("
+    "CAST(ROUND((julianday({row}.arrival_time) - julianday({row}.departure_time)) * 1440) AS INTEGER), 0) END"
+)
+
+# table: ({key column: type}, {summary column: per flight contribution}, Flights columns it depends on)
+SUMMARIES = {
+    "RouteSummary": (
+        {"departure_id": "TEXT", "destination_id": "TEXT"},
+        {"flights": "1"},
+        ("departure_id", "destination_id"),
+    ),
+    "AircraftUtilisation": (
+        {"aircraft_id": "TEXT"},
+        {"flights": "1", "block_minutes": MINUTES},
+        ("aircraft_id", "departure_time", "arrival_time", "status"),
+    ),
+    "PilotHours": (
+        {"pilot_id": "INTEGER"},
+        {"flights": "1", "duty_minutes": MINUTES},
+        ("pilot_id", "departure_time", "arrival_time", "status"),
+    ),
+}
+
+
+def _add_statement(table: str, row: str) -> str:
+    keys, values, _ = SUMMARIES[table]
+    amounts = [v.format(row=row) for v in values.values()]
+    not_null = " AND ".join(f"{row}.{k} IS NOT NULL" for k in keys)
+    return (
+        f"INSERT INTO {table} ({', '.join([*keys, *values])}) "
+        f"SELECT {', '.join([f'{row}.{k}' for k in keys] + amounts)} WHERE {not_null} "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+        + ", ".join(f"{v} = {v} + excluded.{v}" for v in values)
+    )
+
+
+def _remove_statements(table: str, row: str) -> list[str]:
+    keys, values, _ = SUMMARIES[table]
+    match = " AND ".join(f"{k} = {row}.{k}" for k in keys)
+    subtract = ", ".join(f"{v} = {v} - {amount.format(row=row)}" for v, amount in values.items())
+    return [
+        f"UPDATE {table} SET {subtract} WHERE {match}",
+        f"DELETE FROM {table} WHERE {match} AND flights <= 0",
+    ]
+
+
+def _create_statements(table: str) -> list[str]:
+    keys, values, depends_on = SUMMARIES[table]
+    columns = ", ".join(
+        [f"{k} {t} NOT NULL" for k, t in keys.items()] + [f"{v} INTEGER NOT NULL DEFAULT 0" for v in values]
+    )
+    create = f"CREATE TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY ({', '.join(keys)})) WITHOUT ROWID"
+
+    def trigger(event: str, statements: list[str]) -> list[str]:
+        body = "".join(f"{s}; " for s in statements)
+        name = f"{table}_{event.split()[0].lower()}"
+        # recreated every time, so databases set up by an older version get the current bodies
+        return [
+            f"DROP TRIGGER IF EXISTS {name}",
+            f"CREATE TRIGGER {name} AFTER {event} ON Flights BEGIN {body}END",
+        ]
+
+    return [
+        create,
+        *trigger("INSERT", [_add_statement(table, "NEW")]),
+        *trigger("DELETE", _remove_statements(table, "OLD")),
+        *trigger(
+            f"UPDATE OF {', '.join(depends_on)}",
+            _remove_statements(table, "OLD") + [_add_statement(table, "NEW")],
+        ),
+    ]
+
+
+def _summary_query(table: str) -> str:
+    """The summary computed from Flights, with the summary table's columns."""
+    keys, values, _ = SUMMARIES[table]
+    key_list = ", ".join(keys)
+    sums = ", ".join(f"SUM({v.format(row='Flights')}) AS {name}" for name, v in values.items())
+    not_null = " AND ".join(f"{k} IS NOT NULL" for k in keys)
+    return f"SELECT {key_list}, {sums} FROM Flights WHERE {not_null} GROUP BY {key_list}"
+
+
+def _rebuild(connection: sqlite3.Connection) -> None:
+    for table, (keys, values, _) in SUMMARIES.items():
+        connection.execute(f"DELETE FROM {table}")
+        connection.execute(
+            f"INSERT INTO {table} ({', '.join([*keys, *values])}) {_summary_query(table)}"
+        )
+
+
+def has_summaries(connection: sqlite3.Connection) -> bool:
+    existing = {
+        row[0] for row in connection.execute("SELECT name FROM sqlite_schema WHERE type='table'")
+    }
+    return existing.issuperset(SUMMARIES)
+
+
+def create_summaries(connection: sqlite3.Connection) -> None:
+    """Creates the summary tables and their triggers, filling any new table from Flights."""
+    filled = has_summaries(connection)
+    for table in SUMMARIES:
+        for statement in _create_statements(table):
+            logger.info("running sql %s", statement)
+            connection.execute(statement)
+
+    if not filled:
+        _rebuild(connection)
+    connection.commit()
+
+
+def enable_summaries() -> None:
+    with db_connection() as connection:
+        create_summaries(connection)
+
+
+def disable_summaries() -> None:
+    """Drops the summary tables and their triggers, the summaries are aggregated on read again."""
+    with db_connection() as connection:
+        for table in SUMMARIES:
+            logger.info("dropping %s", table)
+            # dropping a table drops its triggers, but these are on Flights
+            for event in ("insert", "delete", "update"):
+                connection.execute(f"DROP TRIGGER IF EXISTS {table}_{event}")
+            connection.execute(f"DROP TABLE IF EXISTS {table}")
+        connection.commit()
+
+
+def rebuild_summaries() -> None:
+    """Recomputes every summary table from Flights in one transaction."""
+    with db_connection() as connection:
+        if not has_summaries(connection):
+            raise ValueError("The summary tables aren't enabled, see enable_summaries")
+        try:
+            connection.execute("BEGIN")
+            logger.info("rebuilding summary tables %s", list(SUMMARIES))
+            _rebuild(connection)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    DB._invalidate(DB.__SUBCLASSES__["Flights"])
+
+
+def _read(table: str, key_values: dict, order_by: str, rows: str) -> Union[list[dict], ResultSet]:
+    conditions = [{"column": k, "operator": "=", "value": v} for k, v in key_values.items() if v is not None]
+    columns = {k: (k, object) for k in key_values}
+    where_clause, values = DB._build_condition_clause(conditions, columns)
+    with db_connection() as connection:
+        source = table if has_summaries(connection) else f"({_summary_query(table)})"
+    query = f"SELECT * FROM {source}"
+    if where_clause:
+        query += f" WHERE {where_clause}"
+    query += f" ORDER BY {order_by}"
+    # the summaries only change when Flights does, so cache them under Flights
+    return DB._fetch_rows("SELECT", query, values, table, ["Flights"], rows)
+
+
+def route_summary(
+    departure_id: str = None, destination_id: str = None, rows: str = "dict"
+) -> Union[list[dict], ResultSet]:
+    """Flights per route, optionally for one departure and/or destination airport."""
+    return _read(
+        "RouteSummary",
+        {"departure_id": departure_id, "destination_id": destination_id},
+        "flights DESC, departure_id, destination_id",
+        rows,
+    )
+
+
+def aircraft_utilisation(aircraft_id: str = None, rows: str = "dict") -> Union[list[dict], ResultSet]:
+    """Flights and block minutes per aircraft."""
+    return _read("AircraftUtilisation", {"aircraft_id": aircraft_id}, "block_minutes DESC, aircraft_id", rows)
+
+
+def pilot_hours(pilot_id: int = None, rows: str = "dict") -> Union[list[dict], ResultSet]:
+    """Flights and duty minutes per pilot."""
+    return _read("PilotHours", {"pilot_id": pilot_id}, "duty_minutes DESC, pilot_id", rows)
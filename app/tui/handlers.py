@@ -1,21 +1,35 @@
+from datetime import datetime
 from time import sleep
-from app.base.exceptions import DuplicatePrimaryKeyError, ForeignKeyConstraintError
+from app.base.connection import db_connection
+from app.base.exceptions import DuplicatePrimaryKeyError, ForeignKeyConstraintError, ScheduleConflictError
+from app.base.profiler import profiler, configure_profiler
 from app.tui.utils import dict_to_table
 from app.models.base_model import DB
+from app.models import summaries
+from app.models.routes import route_graph
 from app.initiate_db import initiate
 
+PAGE_SIZE = 20
+
 
 def _get_conditions(table: type[DB]) -> list[dict]:
-    conditions = []
+    """Asks for filters. AND binds tighter than OR, so a AND b OR c is (a AND b) OR c."""
+    groups = [[]]
     while True:
         col = _get_column(table, "FILTER")
-        operator = _get_operator()
+        operator = _get_operator(table, col)
         value = _get_value(table, col, operator)
-        conditions.append({"column": col, "operator": operator, "value": value})
-        if input("> Add another filter? [y]/[n]: ") != "y":
+        groups[-1].append({"column": col, "operator": operator, "value": value})
+
+        choice = input("> Add another filter? [a] AND / [o] OR / [n] No: ").strip().lower()
+        if choice == "o":
+            groups.append([])
+        elif choice != "a":
             break
 
-    return conditions
+    if len(groups) == 1:
+        return groups[0]
+    return [{"or": [{"and": group} for group in groups]}]
 
 
 def _get_column(table: type[DB], condition: str) -> str:
@@ -37,17 +51,29 @@ def _get_column(table: type[DB], condition: str) -> str:
 
 
 def _get_value(table: type[DB], column: str, operator: str = None):
-    field_type = table.get_class_field_type(table, column)
+    # unwrapped type, so Optional[int] columns read as int
+    field_type = table.get_meta(table).condition_columns[column][1]
+    if operator in ("IS NULL", "IS NOT NULL"):
+        return None
+
+    prompt = f"> {column} ({field_type.__name__}) {operator} "
+    if operator in ("IN", "NOT IN", "BETWEEN"):
+        prompt += "(low, high) " if operator == "BETWEEN" else "(values separated by commas) "
+
     while True:
+        value = input(prompt)
         try:
-            value = input(f"> {column} ({field_type.__name__}) {operator} ")
-            return field_type(value)
-        except (ValueError, TypeError):
-            print("ERROR: Invalid type")
+            # only checks the value here, the query coerces it to the column type
+            table._build_condition_clause(
+                [{"column": column, "operator": operator, "value": value}]
+            )
+            return value
+        except (ValueError, TypeError) as e:
+            print(f"ERROR: Invalid value: {e}")
 
 
-def _get_operator() -> str:
-    operators = ["=", "!=", "<", ">", "IN"]
+def _get_operator(table: type[DB], column: str) -> str:
+    operators = DB.operators_for(table.get_meta(table).condition_columns[column][1])
 
     print("\nSelect an operator: ")
     for i, op in enumerate(operators):
@@ -64,9 +90,34 @@ def _get_operator() -> str:
             print("ERROR: Invalid option")
 
 
+def view_table(table: type[DB], details: bool = False) -> None:
+    """Browses the table one page at a time using keyset pagination on the primary key."""
+    find = table.find_all_with_details if details else table.find
+    page = find(limit=PAGE_SIZE)
+    dict_to_table(page)
+
+    while page:
+        choice = input("> [n] Next page / [p] Previous page / [b] Back: ").strip().lower()
+        if choice == "b":
+            return
+        if choice == "n":
+            new_page = find(limit=PAGE_SIZE, after=page[-1])
+        elif choice == "p":
+            new_page = find(limit=PAGE_SIZE, before=page[0])
+        else:
+            print("ERROR: Invalid option")
+            continue
+
+        if new_page:
+            page = new_page
+            dict_to_table(page)
+        else:
+            print("No more pages")
+
+
 def search_values(table: type[DB]) -> None:
     conditions = _get_conditions(table)
-    dict_to_table(table.find(conditions))
+    dict_to_table(table.iter_find(conditions), page_size=PAGE_SIZE)
 
 
 def add_values(table: type[DB]) -> None:
@@ -96,6 +147,9 @@ def add_values(table: type[DB]) -> None:
         except DuplicatePrimaryKeyError:
             print(f"\nERROR: {table.primary_key} already in use.")
             break
+        except ScheduleConflictError as e:
+            print(f"\nERROR: {e}")
+            break
         except Exception as e:
             print(f"\nERROR: Values not added - unexpected error: {e}")
             break
@@ -164,9 +218,36 @@ def delete_values(table: type[DB]) -> None:
             break
 
 def group_by(table: type[DB]) -> None:
-    group_on = _get_column(table, "GROUP by")
+    group_on, buckets = [], {}
+    while True:
+        column = _get_column(table, "GROUP by")
+        group_on.append(column)
+        if table.__dataclass_fields__[column].metadata.get("datetime"):
+            bucket = _get_option("time bucket", ["none"] + list(DB.TIME_BUCKETS))
+            if bucket != "none":
+                buckets[column] = bucket
+        if input("> Group by another column too? [y]/[n]: ").strip().lower() != "y":
+            break
+
     agg_on = _get_column(table, "AGGREGATE by")
-    dict_to_table(table.group_by(group_on, agg_on))
+    function = _get_option("aggregate", DB.AGGREGATES)
+    dict_to_table(table.group_by(group_on, [(function, agg_on)], buckets=buckets))
+
+
+def _get_option(name: str, options: list[str]) -> str:
+    print(f"\nSelect a {name}: ")
+    for i, option in enumerate(options):
+        print(f"[{i + 1}] {option}")
+
+    while True:
+        try:
+            choice = int(input("> ").strip())
+            if 1 <= choice <= len(options):
+                return options[choice - 1]
+            else:
+                print("ERROR: Invalid option")
+        except ValueError:
+            print("ERROR: Invalid option")
 
 def set_on_delete(tables: list[type[DB]]) -> None:
         current_setting = tables[0].ON_DELETE
@@ -211,6 +292,95 @@ def set_logging_setting(logger) -> None:
         print(f"Logging turned {options[logger.disabled]}")
 
 
+
+def show_query_profile() -> None:
+    if not profiler.enabled:
+        print("\nQuery profiling currently set to: OFF")
+        if input("> Do you want to switch query profiling ON? [y]/[n]: ").lower().strip() == "y":
+            # slow_ms=0 captures every query shape's plan once, so full scans show up
+            configure_profiler(enabled=True, slow_ms=0)
+            print("Query profiling turned ON. Use the tables, then come back here for the report")
+        return
+
+    report = [{k: v for k, v in row.items() if k != "plan"} for row in profiler.report()]
+    dict_to_table(report)
+    acquire = profiler.acquire_stats()
+    print(
+        f"\nConnection acquire: {acquire['acquires']} calls, p50 {acquire['p50_ms']} ms, "
+        f"p95 {acquire['p95_ms']} ms, p99 {acquire['p99_ms']} ms"
+    )
+
+    choice = input("> [r] Reset / [o] Turn profiling OFF / [b] Back: ").lower().strip()
+    if choice == "r":
+        profiler.reset()
+        print("Query profile reset")
+    elif choice == "o":
+        configure_profiler(enabled=False)
+        profiler.reset()
+        print("Query profiling turned OFF")
+
+
+def show_summaries() -> None:
+    views = {
+        "Flights per route": summaries.route_summary,
+        "Aircraft utilisation": summaries.aircraft_utilisation,
+        "Pilot hours": summaries.pilot_hours,
+    }
+    view = _get_option("summary", list(views))
+    dict_to_table(views[view]())
+
+
+def rebuild_summaries() -> None:
+    with db_connection() as connection:
+        enabled = summaries.has_summaries(connection)
+    if not enabled:
+        print("\nSummary tables are off, the summaries are aggregated from Flights")
+        if input("> Create them? Flights writes get slower [y]/[n]: ").lower().strip() == "y":
+            summaries.enable_summaries()
+            print("Summary tables created")
+        return
+    if input("> Recompute the summary tables from Flights? [y]/[n]: ").lower().strip() == "y":
+        summaries.rebuild_summaries()
+        print("Summary tables rebuilt")
+
+
+def find_connections() -> None:
+    origin = input("> From airport code: ").strip().upper()
+    destination = input("> To airport code: ").strip().upper()
+    while True:
+        depart_after = input("> Depart after (YYYY-MM-DD HH:MM): ").strip()
+        try:
+            datetime.fromisoformat(depart_after)
+            break
+        except ValueError:
+            print("ERROR: Invalid date")
+    max_legs = _get_number("Maximum flights", 3)
+    min_connect = _get_number("Minimum connection time in minutes", 45)
+
+    journeys = route_graph.connections(
+        origin, destination, depart_after, max_legs=max_legs, min_connect=min_connect
+    )
+    if not journeys:
+        print(f"No connections from {origin} to {destination} within 48 hours")
+        return
+    for journey in journeys:
+        print(f"\n{len(journey)} flight(s), arriving {journey[-1]['arrival_time']}")
+        dict_to_table(journey)
+
+
+def _get_number(prompt: str, default: int) -> int:
+    while True:
+        value = input(f"> {prompt} [{default}]: ").strip()
+        if not value:
+            return default
+        try:
+            if int(value) > 0:
+                return int(value)
+        except ValueError:
+            pass
+        print("ERROR: Enter a positive number")
+
+
 if __name__ == "__main__":
     from app.models.load import initiate, Aircrafts
 
@@ -0,0 +1,150 @@
+"""
+Streaming table renderer for the TUI. Column widths come from the header and a
+sample of the first rows (or are given, e.g. from a schema), so each row is
+formatted on its own and written out in chunks, instead of sizing the whole result
+up front like tabulate does. Cells wider than their column are cut with an ellipsis.
+
+On a terminal, results taller than the screen go through a pager that only pulls
+the rows it shows from the source, so a lazy source (e.g. iter_find) is only read
+as far as the user pages.
+"""
+
+import shutil
+import sys
+from dataclasses import fields, is_dataclass
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, Optional, Sequence, TextIO, Union
+
+from app.models.results import ResultSet
+
+SAMPLE_SIZE = 100
+MAX_CELL_WIDTH = 40
+CHUNK_SIZE = 500
+ELLIPSIS = "…"
+# header, rule and prompt lines around each pager screen
+PAGER_MARGIN = 5
+
+
+def _rows(data) -> tuple[list[str], Iterator[tuple], Iterator]:
+    """Returns the header, the rows as tuples and the source iterator, to close when done."""
+    if isinstance(data, ResultSet):
+        return list(data.columns), iter(data.rows), iter(())
+
+    source = iter(data)
+    first = next(source, None)
+    if first is None:
+        return [], iter(()), source
+    if is_dataclass(first):
+        header = [f.name for f in fields(first)]
+        rows = (tuple([getattr(x, n) for n in header]) for x in chain([first], source))
+    else:
+        header = list(first.keys())
+        rows = (tuple(x.values()) for x in chain([first], source))
+    return header, rows, source
+
+
+def _text(value) -> str:
+    return "" if value is None else str(value)
+
+
+def column_widths(
+    header: Sequence[str], sample: Sequence[tuple], max_width: int = MAX_CELL_WIDTH
+) -> list[int]:
+    """Widest header or sampled cell per column, capped at max_width."""
+    widths = [len(h) for h in header]
+    for row in sample:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len(_text(value)))
+    return [max(1, min(w, max_width)) for w in widths]
+
+
+def _numeric(header: Sequence[str], sample: Sequence[tuple]) -> list[bool]:
+    """Columns whose sampled values are all numbers, right aligned like tabulate does."""
+    numeric = [True] * len(header)
+    for row in sample:
+        for i, value in enumerate(row):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                numeric[i] = False
+    return numeric
+
+
+def _formatter(widths: list[int], numeric: list[bool]) -> Callable[[Sequence], str]:
+    columns = list(zip(widths, numeric))
+
+    def format_row(row: Sequence) -> str:
+        cells = []
+        for value, (width, right) in zip(row, columns):
+            text = _text(value)
+            if len(text) > width:
+                text = text[: width - 1] + ELLIPSIS
+            cells.append(text.rjust(width) if right else text.ljust(width))
+        return "  ".join(cells).rstrip()
+
+    return format_row
+
+
+def _write(out: TextIO, rows: Iterable[tuple], format_row: Callable) -> int:
+    """Writes rows CHUNK_SIZE at a time, so the output is never built as one string."""
+    rows = iter(rows)
+    written = 0
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        out.write("".join([format_row(row) + "\n" for row in chunk]))
+        written += len(chunk)
+    return written
+
+
+def render_table(
+    data: Union[Iterable[dict], ResultSet, Iterable],
+    page_size: int = None,
+    widths: Union[Sequence[int], dict[str, int]] = None,
+    max_width: int = MAX_CELL_WIDTH,
+    pager: Optional[bool] = None,
+    out: TextIO = None,
+) -> int:
+    """
+    Prints dicts, a ResultSet or model instances as a table and returns the number of
+    rows shown. page_size asks before each further page; pager (default: when out is
+    a terminal) does the same with pages of one screen. widths overrides the sampled
+    column widths, as a list or per column name.
+    """
+    out = out or sys.stdout
+    header, rows, source = _rows(data)
+    try:
+        if pager is None:
+            pager = out.isatty()
+        if page_size is None and pager:
+            page_size = max(1, shutil.get_terminal_size().lines - PAGER_MARGIN)
+
+        sample = list(islice(rows, page_size or SAMPLE_SIZE))
+        if not sample:
+            out.write("\nEMPTY TABLE\n")
+            out.flush()
+            return 0
+
+        sizes = column_widths(header, sample, max_width)
+        if isinstance(widths, dict):
+            sizes = [widths.get(h, w) for h, w in zip(header, sizes)]
+        elif widths is not None:
+            sizes = list(widths)
+        format_row = _formatter(sizes, _numeric(header, sample))
+        head = format_row(header) + "\n" + "  ".join("-" * w for w in sizes) + "\n"
+
+        if not page_size:
+            out.write("\n\n" + head)
+            shown = _write(out, chain(sample, rows), format_row)
+            out.flush()
+            return shown
+
+        page, page_number, shown = sample, 1, 0
+        while page:
+            out.write(f"\n-- Page {page_number} --\n" + head)
+            shown += _write(out, page, format_row)
+            out.flush()
+            page = list(islice(rows, page_size))
+            page_number += 1
+            if page and input("> [enter] Next page / [q] Stop: ").strip().lower() == "q":
+                break
+        return shown
+    finally:
+        if hasattr(source, "close"):
+            source.close()
@@ -1,7 +1,6 @@
 from app.models.base_model import DB
 import sys
-from app.tui.utils import dict_to_table
-from app.tui.handlers import search_values, add_values, delete_values, update_values, set_logging_setting, group_by
+from app.tui.handlers import search_values, add_values, delete_values, update_values, set_logging_setting, group_by, view_table, show_query_profile, show_summaries, rebuild_summaries, find_connections
 from app.base.logger import logger
 
 
@@ -50,6 +49,8 @@ class FlightMangement:
         submenu = {
             "1": {"name": "View/edit table", "function": self.table_menu},
             "2": {"name": "Settings", "function": self.settings_menu},
+            "3": {"name": "Summaries", "function": show_summaries},
+            "4": {"name": "Find connections", "function": find_connections},
         }
         self._show_menu("Main", submenu)
 
@@ -68,11 +69,11 @@ class FlightMangement:
         submenu = {
             "1": {
                 "name": "View table",
-                "function": lambda: dict_to_table(table.find()),
+                "function": lambda: view_table(table),
             },
             "2": {
                 "name": "View table with details",
-                "function": lambda: dict_to_table(table.find_all_with_details()),
+                "function": lambda: view_table(table, details=True),
             },
             "3": {
                 "name": "Search by",
@@ -102,6 +103,8 @@ class FlightMangement:
         submenu = {
             "1": {"name": "(In development) Set ON DELETE restrictions", "function": lambda: print("Not ready yet :(")},
             "2": {"name": "Turn dev logs on/off", "function": lambda: set_logging_setting(logger)},
+            "3": {"name": "Query profile", "function": show_query_profile},
+            "4": {"name": "Rebuild summary tables", "function": rebuild_summaries},
         }
 
         self._show_menu("Settings", submenu)
@@ -1,13 +1,10 @@
-from tabulate import tabulate
-from time import sleep
+from typing import Iterable
+from app.tui.render import render_table
 
-def dict_to_table(d: dict) -> None:
-    if d:
-        header = d[0].keys()
-        rows = [x.values() for x in d]
-        print("\n")
-        print(tabulate(rows, header))
-        sleep(0.8)
-    else:
-        print("\nEMPTY TABLE")
-        sleep(0.8)
\ No newline at end of file
+def dict_to_table(d: Iterable[dict], page_size: int = None) -> None:
+    """
+    Prints a list of dicts, a ResultSet, a list of model instances or a row iterator
+    as a table, see app.tui.render. page_size pages through the rows, only pulling the
+    next page from d when asked for.
+    """
+    render_table(d, page_size)
@@ -0,0 +1,152 @@
+"""
+Deterministic synthetic flight network. The same scale and seed always produce
+the same rows, so benchmark runs are comparable.
+"""
+
+from datetime import datetime, timedelta
+from itertools import product
+import random
+from string import ascii_uppercase
+from typing import Iterator
+
+COUNTRIES = [
+    "United States",
+    "United Kingdom",
+    "Germany",
+    "France",
+    "Spain",
+    "Turkey",
+    "Thailand",
+    "China",
+    "Indonesia",
+    "Canada",
+    "Colombia",
+    "Netherlands",
+    "Qatar",
+    "Brazil",
+    "Japan",
+]
+
+AIRLINES = [
+    "Qatar Airways",
+    "Singapore Airlines",
+    "Emirates",
+    "Lufthansa",
+    "British Airways",
+    "Delta Air Lines",
+    "Turkish Airlines",
+    "Air Canada",
+]
+
+# (aircraft_type, aircraft_category, capacity, weight)
+AIRCRAFT_TYPES = [
+    ("Boeing 737-8FZ", "Passenger", 189, 30),
+    ("Airbus A320-214", "Passenger", 180, 30),
+    ("Boeing 787-9", "Passenger", 296, 10),
+    ("Airbus A350-941", "Passenger", 325, 8),
+    ("De Havilland Canada Dash 8-100", "Passenger", 39, 8),
+    ("Boeing 777F", "Cargo", 0, 4),
+    ("Piper Cherokee Arrow B", "General aviation", 4, 2),
+]
+
+FIRST_NAMES = ["Harriette", "Warner", "Amara", "Luca", "Mei", "Omar", "Ines", "Kofi", "Sven", "Priya"]
+LAST_NAMES = ["Eppie", "Nyah", "Okafor", "Rossi", "Chen", "Haddad", "Silva", "Mensah", "Larsen", "Rao"]
+
+STATUSES = ["On Time", "On Time", "On Time", "Delayed", "Cancelled"]
+
+START = datetime(2025, 1, 1)
+
+
+class NetworkSpec:
+    """Table sizes derived from the number of flights, roughly like a real carrier network."""
+
+    def __init__(self, flights: int, seed: int = 42):
+        self.flights = flights
+        self.seed = seed
+        self.airports = min(len(ascii_uppercase) ** 3, max(20, flights // 1000))
+        self.aircrafts = max(10, flights // 2000)
+        self.pilots = self.aircrafts * 3
+
+    def airport_codes(self) -> list[str]:
+        codes = ["".join(c) for c in product(ascii_uppercase, repeat=3)]
+        random.Random(self.seed).shuffle(codes)
+        return codes[: self.airports]
+
+    def airport_weights(self) -> list[float]:
+        # Zipf-like traffic: a few hubs see most departures
+        return [1 / (rank + 1) for rank in range(self.airports)]
+
+
+def airports(spec: NetworkSpec) -> Iterator[dict]:
+    rng = random.Random(spec.seed + 1)
+    for code in spec.airport_codes():
+        yield {
+            "code": code,
+            "name": f"{code} International Airport",
+            "country": rng.choice(COUNTRIES),
+        }
+
+
+def aircrafts(spec: NetworkSpec) -> Iterator[dict]:
+    rng = random.Random(spec.seed + 2)
+    weights = [t[3] for t in AIRCRAFT_TYPES]
+    for i in range(spec.aircrafts):
+        aircraft_type, category, capacity, _ = rng.choices(AIRCRAFT_TYPES, weights)[0]
+        yield {
+            "registration": f"N{i:06d}",
+            "aircraft_type": aircraft_type,
+            "aircraft_category": category,
+            "capacity": capacity,
+        }
+
+
+def pilots(spec: NetworkSpec) -> Iterator[dict]:
+    rng = random.Random(spec.seed + 3)
+    codes = spec.airport_codes()
+    weights = spec.airport_weights()
+    for i in range(spec.pilots):
+        yield {
+            "pilot_id": i + 1,
+            "first_name": rng.choice(FIRST_NAMES),
+            "last_name": rng.choice(LAST_NAMES),
+            "base": rng.choices(codes, weights)[0],
+            "airline": rng.choice(AIRLINES),
+        }
+
+
+def flights(spec: NetworkSpec) -> Iterator[dict]:
+    """
+    Each aircraft flies a chain of legs from wherever it last landed, with a turnaround
+    between legs. Pilots are assigned to one aircraft and rotate on it, so neither
+    pilots nor aircraft are double booked. Aircraft take turns, so flights come out
+    roughly in departure order.
+    """
+    rng = random.Random(spec.seed + 4)
+    codes = spec.airport_codes()
+    weights = spec.airport_weights()
+
+    location = [rng.choices(codes, weights)[0] for _ in range(spec.aircrafts)]
+    ready_at = [START + timedelta(minutes=rng.randrange(24 * 60)) for _ in range(spec.aircrafts)]
+
+    for i in range(spec.flights):
+        aircraft = i % spec.aircrafts
+        destination = rng.choices(codes, weights)[0]
+        while destination == location[aircraft]:
+            destination = rng.choice(codes)
+
+        departure = ready_at[aircraft]
+        arrival = departure + timedelta(minutes=rng.randrange(45, 12 * 60, 5))
+        pilot = aircraft + spec.aircrafts * (i // spec.aircrafts % 3)
+
+        yield {
+            "departure_time": departure.strftime("%Y-%m-%d %H:%M:%S"),
+            "arrival_time": arrival.strftime("%Y-%m-%d %H:%M:%S"),
+            "status": rng.choice(STATUSES),
+            "pilot_id": pilot + 1,
+            "departure_id": location[aircraft],
+            "destination_id": destination,
+            "aircraft_id": f"N{aircraft:06d}",
+        }
+
+        location[aircraft] = destination
+        ready_at[aircraft] = arrival + timedelta(minutes=rng.randrange(45, 180, 5))
@@ -0,0 +1,338 @@
+"""
+Benchmarks the DB operations and TUI handler paths against a synthetic network.
+
+    python -m bench.run --flights 100000
+    python -m bench.run --flights 100000 --save-baseline bench/baseline.json
+    python -m bench.run --flights 100000 --baseline bench/baseline.json
+
+Runs against a temporary database, never database.db. Exits with status 1 if any
+operation's p50 latency regressed more than --tolerance against the baseline.
+"""
+
+import argparse
+import asyncio
+import builtins
+import contextlib
+import io
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Callable
+
+from app.base.aio import configure_async
+from app.base.connection import configure_pool, storage_profile
+from app.base.logger import logger
+from app.models import Aircrafts, Airports, Flights, Pilots
+from app.models import summaries
+from app.models.base_model import DB
+from app.models.routes import RouteGraph
+from app.tui import handlers, utils
+from bench import generate
+
+FUTURE = datetime(2035, 1, 1)
+
+
+def _percentile(values: list[float], p: float) -> float:
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure(name: str, fn: Callable, repeat: int, items: int = 1) -> dict:
+    """Runs fn repeat times. items is how many rows/records one call handles, for throughput."""
+    durations = []
+    for i in range(repeat):
+        start = perf_counter()
+        fn(i)
+        durations.append(perf_counter() - start)
+
+    durations.sort()
+    total = sum(durations)
+    return {
+        "operation": name,
+        "calls": repeat,
+        "throughput_per_s": round(repeat * items / total, 1) if total else None,
+        "p50_ms": round(_percentile(durations, 50) * 1000, 3),
+        "p95_ms": round(_percentile(durations, 95) * 1000, 3),
+        "p99_ms": round(_percentile(durations, 99) * 1000, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+@contextlib.contextmanager
+def _scripted_tui(answers: list[str]):
+    """Feeds answers to input(), swallows output and skips the display sleeps."""
+    replies = iter(answers)
+    original_input, original_sleep = builtins.input, handlers.sleep
+    builtins.input = lambda prompt="": next(replies, "b")
+    handlers.sleep = lambda seconds: None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        builtins.input = original_input
+        handlers.sleep = original_sleep
+
+
+def seed(spec: generate.NetworkSpec) -> list[dict]:
+    DB.drop_all()
+    # measures the summary and route graph reads with their trigger maintained tables
+    DB.MATERIALIZE_SUMMARIES = DB.LOG_FLIGHT_CHANGES = True
+    DB.intialise_all()
+    results = []
+    with storage_profile("bulk-load"):
+        for model, rows, count in [
+            (Airports, generate.airports, spec.airports),
+            (Aircrafts, generate.aircrafts, spec.aircrafts),
+            (Pilots, generate.pilots, spec.pilots),
+            (Flights, generate.flights, spec.flights),
+        ]:
+            results.append(
+                measure(
+                    f"{model.__name__}.insert_many",
+                    lambda _: model.insert_many(rows(spec), batch_size=5000),
+                    1,
+                    count,
+                )
+            )
+    return results
+
+
+def run_operations(spec: generate.NetworkSpec, repeat: int) -> list[dict]:
+    codes = spec.airport_codes()
+    full_scan_repeat = max(1, repeat // 20)
+    page = Flights.find(order_by="departure_time", limit=50)
+    deep_cursor = Flights.find(order_by="departure_time", limit=1, descending=True)[0]
+
+    graph = RouteGraph()
+    graph_build = measure("RouteGraph.build", lambda i: graph.build(), 1, spec.flights)
+
+    def connections(i):
+        origin, destination = codes[i % len(codes)], codes[(i * 7 + 1) % len(codes)]
+        return graph.connections(origin, destination, f"2025-01-{i % 28 + 1:02d} 06:00:00")
+
+    def point_conditions(i):
+        return [{"column": "flight_id", "operator": "=", "value": i % spec.flights + 1}]
+
+    def concurrent_lookups(i):
+        async def lookups():
+            return await asyncio.gather(*[Flights.afind(point_conditions(i * 64 + n)) for n in range(64)])
+
+        return asyncio.run(lookups())
+
+    def new_flight(i):
+        # two hours apart from 2035 on, so they never conflict with the generated schedule
+        departure = FUTURE + timedelta(hours=2 * i)
+        return Flights(
+            departure.strftime("%Y-%m-%d %H:%M:%S"),
+            (departure + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"),
+            "On Time",
+            1,
+            codes[0],
+            codes[1],
+            "N000000",
+        )
+
+    operations = [
+        ("RouteGraph.connections", connections, repeat, 1),
+        ("Flights.find (point)", lambda i: Flights.find(point_conditions(i)), repeat, 1),
+        (
+            "Flights.find (pilot_id =)",
+            lambda i: Flights.find([{"column": "pilot_id", "operator": "=", "value": i % spec.pilots + 1}]),
+            repeat,
+            1,
+        ),
+        (
+            "Flights.find (departure_time BETWEEN)",
+            lambda i: Flights.find(
+                [
+                    {
+                        "column": "departure_time",
+                        "operator": "BETWEEN",
+                        "value": ["2025-01-02 00:00:00", "2025-01-02 06:00:00"],
+                    }
+                ]
+            ),
+            repeat,
+            1,
+        ),
+        (
+            "Flights.find (keyset page)",
+            lambda i: Flights.find(order_by="departure_time", limit=50, after=page[-1]),
+            repeat,
+            50,
+        ),
+        (
+            "Flights.find (deep keyset page)",
+            lambda i: Flights.find(order_by="departure_time", limit=50, before=deep_cursor),
+            repeat,
+            50,
+        ),
+        ("Flights.afind (64 concurrent points)", concurrent_lookups, repeat, 64),
+        ("Flights.find (full)", lambda i: Flights.find(), full_scan_repeat, spec.flights),
+        (
+            "Flights.find_all_with_details (page)",
+            lambda i: Flights.find_all_with_details(limit=50, after=(i * 50,)),
+            repeat,
+            50,
+        ),
+        (
+            "Flights.find_all_with_details (full)",
+            lambda i: Flights.find_all_with_details(),
+            full_scan_repeat,
+            spec.flights,
+        ),
+        ("Flights.group_by", lambda i: Flights.group_by("departure_id", "flight_id"), full_scan_repeat, 1),
+        (
+            "Flights.group_by (route per day, joined)",
+            lambda i: Flights.group_by(
+                ["DepartureAirport.country", "destination_id", "departure_time"],
+                [("COUNT", "*"), ("SUM", "Aircrafts.capacity")],
+                buckets={"departure_time": "day"},
+            ),
+            full_scan_repeat,
+            1,
+        ),
+        (
+            "Flights.parallel_group_by (route per day, joined)",
+            lambda i: Flights.parallel_group_by(
+                ["DepartureAirport.country", "destination_id", "departure_time"],
+                [("COUNT", "*"), ("SUM", "Aircrafts.capacity")],
+                buckets={"departure_time": "day"},
+                partition_on="departure_time",
+            ),
+            full_scan_repeat,
+            1,
+        ),
+        ("summaries.route_summary (departure)", lambda i: summaries.route_summary(codes[i % len(codes)]), repeat, 1),
+        ("summaries.pilot_hours", lambda i: summaries.pilot_hours(), repeat, 1),
+        ("Aircrafts.group_by", lambda i: Aircrafts.group_by("aircraft_type", "capacity"), repeat, 1),
+        ("Flights.insert", lambda i: new_flight(i).insert(), repeat, 1),
+        (
+            "Flights.update (point)",
+            lambda i: Flights.update({"status": "Delayed"}, point_conditions(i)),
+            repeat,
+            1,
+        ),
+        (
+            "Flights.update_many (1000 rows)",
+            lambda i: Flights.update_many(
+                (n % spec.flights + 1, {"status": "Delayed", "arrival_time": str(FUTURE)})
+                for n in range(i * 1000, (i + 1) * 1000)
+            ),
+            max(1, repeat // 10),
+            1000,
+        ),
+        (
+            "Flights.delete (point)",
+            lambda i: Flights.delete(
+                [{"column": "departure_time", "operator": ">=", "value": str(FUTURE)}]
+            ),
+            1,
+            1,
+        ),
+    ]
+
+    results = [graph_build] + [measure(*op) for op in operations]
+
+    with _scripted_tui(["n", "n", "p", "b"] * repeat):
+        results.append(
+            measure("TUI view_table (3 page moves)", lambda i: handlers.view_table(Flights), max(1, repeat // 10))
+        )
+    with _scripted_tui(["n", "n", "p", "b"] * repeat):
+        results.append(
+            measure(
+                "TUI view_table details (3 page moves)",
+                lambda i: handlers.view_table(Flights, details=True),
+                max(1, repeat // 10),
+            )
+        )
+    # column 4 is pilot_id, operator 1 is =
+    with _scripted_tui(["4", "1", "1", "n", "q"] * repeat):
+        results.append(measure("TUI search_values", lambda i: handlers.search_values(Flights), max(1, repeat // 10)))
+    # group Airports by column 3 (country) only, aggregate column 1 (code) with COUNT
+    with _scripted_tui(["3", "n", "1", "1"] * repeat):
+        results.append(measure("TUI group_by", lambda i: handlers.group_by(Airports), max(1, repeat // 10)))
+
+    with _scripted_tui([]):
+        details = Flights.find_all_with_details(rows="tuple")
+        results.append(
+            measure(
+                "TUI render find_all_with_details (all rows)",
+                lambda i: utils.dict_to_table(details),
+                max(1, repeat // 10),
+                len(details),
+            )
+        )
+
+    return results
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for r in results:
+        base = baseline.get(r["operation"])
+        if base and base["p50_ms"] and r["p50_ms"] > base["p50_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{r['operation']}: p50 {r['p50_ms']} ms vs baseline {base['p50_ms']} ms"
+            )
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flights", type=int, default=10000, help="number of flights to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=200, help="calls per point operation")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown, 0.2 = 20%%")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    logger.disabled = True
+    spec = generate.NetworkSpec(args.flights, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_pool(database=os.path.join(tmp, "bench.db"))
+        try:
+            results = seed(spec) + run_operations(spec, args.repeat)
+        finally:
+            configure_async()
+            configure_pool()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        from tabulate import tabulate
+
+        print(f"\n{spec.flights} flights, {spec.airports} airports, {spec.aircrafts} aircraft, {spec.pilots} pilots")
+        print(tabulate([r.values() for r in results], results[0].keys()))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"flights": spec.flights, "results": {r["operation"]: r for r in results}}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("flights") != spec.flights:
+            print(f"WARNING: baseline was recorded with {baseline.get('flights')} flights")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
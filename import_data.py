@@ -0,0 +1,68 @@
+"""
+Imports JSON array, JSONL or CSV files into a table.
+
+    python3 import_data.py Flights feed.jsonl
+    python3 import_data.py Airports airports.csv --rejects rejects.jsonl
+"""
+
+import argparse
+import sys
+
+from app.base.connection import configure_pool
+from app.base.logger import logger
+from app.importer import FORMATS, ParentKeys, import_file
+from app.models.base_model import DB
+from app.models import Aircrafts, Airports, Pilots, Flights
+
+TABLES = {model.__name__: model for model in [Aircrafts, Airports, Pilots, Flights]}
+
+
+def show_progress(report) -> None:
+    rate = report.read / report.seconds if report.seconds else 0
+    print(
+        f"{report.table}: {report.read} read, {report.inserted} inserted, "
+        f"{report.rejected} rejected ({rate:.0f} records/s)",
+        file=sys.stderr,
+    )
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("table", choices=TABLES)
+    parser.add_argument("paths", nargs="+", help="files to import, in order")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per executemany")
+    parser.add_argument("--commit-every", type=int, default=20000, help="rows per transaction")
+    parser.add_argument("--rejects", help="append rejected records to this JSONL file")
+    parser.add_argument("--database", help="database file, default database.db")
+    parser.add_argument("--progress-every", type=int, default=100000, help="records between progress lines")
+    args = parser.parse_args(argv)
+
+    logger.disabled = True
+    if args.database:
+        configure_pool(database=args.database)
+    DB.intialise_all()
+    parents = ParentKeys()
+    rejected = 0
+    for path in args.paths:
+        report = import_file(
+            TABLES[args.table],
+            path,
+            file_format=args.format,
+            batch_size=args.batch_size,
+            commit_every=args.commit_every,
+            rejects_path=args.rejects,
+            parents=parents,
+            progress=show_progress,
+            progress_every=args.progress_every,
+        )
+        show_progress(report)
+        for kind, count in sorted(report.reasons.items()):
+            print(f"  rejected {count}: {kind}", file=sys.stderr)
+        rejected += report.rejected
+
+    return 1 if rejected else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
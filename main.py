@@ -1,4 +1,6 @@
+from app.base.logger import logger
 from app.initiate_db import initiate
+from app.models.base_model import DB
 from app.models import Aircrafts, Airports, Pilots, Flights
 from app.tui.tui import FlightMangement
 
@@ -6,6 +8,9 @@ from app.tui.tui import FlightMangement
 def main():
     tables = [Aircrafts, Airports, Pilots, Flights]
     # initiate()
+    # the TUI runs with dev logs off, the migration too
+    logger.disabled = True
+    DB.intialise_all()
     FlightMangement(tables).run()
 
 
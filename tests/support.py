@@ -0,0 +1,59 @@
+"""Shared fixture for the tests: a temporary database loaded with the sample data."""
+
+import os
+import tempfile
+import unittest
+
+from app.base.cache import query_cache
+from app.base.connection import configure_pool, db_connection
+from app.base.logger import logger
+from app.importer import iter_json_array
+from app.models import Aircrafts, Airports, Flights, Pilots
+from app.models.base_model import DB
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "data")
+
+# class attributes the tests change, restored after each one
+SETTINGS = ("ON_DELETE", "ON_UPDATE", "MATERIALIZE_SUMMARIES", "LOG_FLIGHT_CHANGES", "DENORMALIZE_DETAILS")
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Runs each test against a fresh copy of the sample data in a temporary file.
+    settings are DB class attributes to set before the tables are created.
+    """
+
+    settings: dict = {}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.tmp.name, "test.db")
+        saved = {name: getattr(DB, name) for name in SETTINGS}
+        disabled = logger.disabled
+
+        def restore():
+            for name, value in saved.items():
+                setattr(DB, name, value)
+            logger.disabled = disabled
+            configure_pool()
+            DB.clear_meta_cache()
+            query_cache.clear()
+            self.tmp.cleanup()
+
+        self.addCleanup(restore)
+        logger.disabled = True
+        configure_pool(database=self.database)
+        DB.clear_meta_cache()
+        query_cache.clear()
+        for name, value in self.settings.items():
+            setattr(DB, name, value)
+
+        DB.intialise_all()
+        for model, name in [(Aircrafts, "aircrafts"), (Airports, "airports"), (Pilots, "pilots"), (Flights, "flights")]:
+            model.insert_many(iter_json_array(os.path.join(DATA, f"{name}.json")))
+
+    def fetch(self, query: str, values=()) -> list[tuple]:
+        with db_connection() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = None
+            return cursor.execute(query, values).fetchall()
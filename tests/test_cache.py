@@ -0,0 +1,67 @@
+import unittest
+
+from app.base.cache import configure_cache, query_cache
+from app.models import Airports, Flights, Pilots
+from app.models import summaries
+from tests.support import DatabaseTestCase
+
+
+class CacheInvalidationTest(DatabaseTestCase):
+    settings = {"ON_DELETE": "CASCADE", "ON_UPDATE": "CASCADE"}
+
+    def setUp(self):
+        super().setUp()
+        configure_cache()
+        self.addCleanup(configure_cache, enabled=False)
+
+    def reads(self) -> list:
+        return [
+            Flights.find(order_by="flight_id"),
+            Flights.find([{"column": "pilot_id", "operator": "=", "value": 1}]),
+            Flights.find_all_with_details(),
+            Pilots.find_all_with_details(),
+            Flights.group_by("departure_id", "flight_id"),
+            summaries.pilot_hours(),
+        ]
+
+    def assertFresh(self):
+        cached = self.reads()
+        query_cache.clear()
+        self.assertEqual(cached, self.reads())
+
+    def test_repeated_reads_hit(self):
+        self.reads()
+        hits = query_cache.stats()["hits"]
+        reads = self.reads()
+        self.assertEqual(query_cache.stats()["hits"] - hits, len(reads))
+
+    def test_writes_invalidate(self):
+        for write in [
+            lambda: Flights(
+                "2026-01-01 10:00:00", "2026-01-01 11:00:00", "On Time", 1, "DEN", "LHR", "OK-TSU"
+            ).insert(),
+            lambda: Flights.insert_many(
+                [Flights("2026-01-02 10:00:00", "2026-01-02 11:00:00", "On Time", 1, "DEN", "LHR", "OK-TSU")]
+            ),
+            lambda: Flights.update({"status": "Delayed"}, [{"column": "pilot_id", "operator": "=", "value": 1}]),
+            lambda: Flights.update_many([(2, {"pilot_id": 1})]),
+            lambda: Flights.delete([{"column": "flight_id", "operator": "=", "value": 3}]),
+        ]:
+            self.reads()
+            write()
+            self.assertFresh()
+
+    def test_parent_writes_invalidate_children(self):
+        for write in [
+            lambda: Airports.update({"country": "Elsewhere"}, [{"column": "code", "operator": "=", "value": "DEN"}]),
+            # cascades into Flights and Pilots
+            lambda: Airports.update({"code": "XXX"}, [{"column": "code", "operator": "=", "value": "LHR"}]),
+            lambda: Pilots.delete([{"column": "pilot_id", "operator": "=", "value": 1}]),
+        ]:
+            self.reads()
+            write()
+            self.assertFresh()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+from app.models import Airports, Flights
+from app.models.base_model import DB
+from tests.support import DatabaseTestCase
+
+
+class ConditionsTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flights = Flights.find()
+
+    def assertFinds(self, conditions: list[dict], predicate):
+        expected = sorted(f["flight_id"] for f in self.flights if predicate(f))
+        self.assertEqual(sorted(f["flight_id"] for f in Flights.find(conditions)), expected)
+
+    def test_operators(self):
+        time = "2025-04-18 10:00:00"
+        for operator, value, predicate in [
+            ("=", "3", lambda f: f["pilot_id"] == 3),
+            ("!=", 3, lambda f: f["pilot_id"] != 3),
+            (">", "3", lambda f: f["pilot_id"] > 3),
+            ("<=", 3, lambda f: f["pilot_id"] <= 3),
+            ("IN", "1, 2, 5", lambda f: f["pilot_id"] in (1, 2, 5)),
+            ("NOT IN", [1, 2], lambda f: f["pilot_id"] not in (1, 2)),
+            ("BETWEEN", "2, 6", lambda f: 2 <= f["pilot_id"] <= 6),
+        ]:
+            with self.subTest(operator=operator):
+                self.assertFinds([{"column": "pilot_id", "operator": operator, "value": value}], predicate)
+        self.assertFinds(
+            [{"column": "departure_time", "operator": ">=", "value": time}], lambda f: f["departure_time"] >= time
+        )
+
+    def test_text_operators(self):
+        self.assertFinds(
+            [{"column": "departure_id", "operator": "STARTS WITH", "value": "D"}],
+            lambda f: f["departure_id"].startswith("D"),
+        )
+        self.assertFinds(
+            [{"column": "aircraft_id", "operator": "LIKE", "value": "%-%"}], lambda f: "-" in f["aircraft_id"]
+        )
+        self.assertEqual(DB.operators_for(int), [op for op in DB.OPERATORS if op not in DB.TEXT_OPERATORS])
+        with self.assertRaises(ValueError):
+            Flights.find([{"column": "pilot_id", "operator": "STARTS WITH", "value": "1"}])
+
+    def test_null_operators(self):
+        Flights.update({"arrival_time": None}, [{"column": "flight_id", "operator": "=", "value": 1}])
+        self.flights = Flights.find()
+        self.assertFinds([{"column": "arrival_time", "operator": "IS NULL"}], lambda f: f["arrival_time"] is None)
+        self.assertFinds(
+            [{"column": "arrival_time", "operator": "IS NOT NULL"}], lambda f: f["arrival_time"] is not None
+        )
+
+    def test_groups(self):
+        # pilot 1 OR (departing DEN AND pilot > 2), AND binds tighter
+        self.assertFinds(
+            [
+                {
+                    "or": [
+                        {"column": "pilot_id", "operator": "=", "value": 1},
+                        {
+                            "and": [
+                                {"column": "departure_id", "operator": "=", "value": "DEN"},
+                                {"column": "pilot_id", "operator": ">", "value": 2},
+                            ]
+                        },
+                    ]
+                }
+            ],
+            lambda f: f["pilot_id"] == 1 or (f["departure_id"] == "DEN" and f["pilot_id"] > 2),
+        )
+
+    def test_invalid_conditions(self):
+        for conditions in [
+            [{"column": "gate", "operator": "=", "value": 1}],
+            [{"column": "pilot_id", "operator": "~", "value": 1}],
+            [{"column": "pilot_id", "operator": "BETWEEN", "value": "1"}],
+            [{"column": "pilot_id", "operator": "=", "value": "one"}],
+            [{"or": []}],
+        ]:
+            with self.subTest(conditions=conditions), self.assertRaises(ValueError):
+                Flights.find(conditions)
+
+    def test_text_values_are_not_coerced(self):
+        Airports("123", "Numbered", "Nowhere").insert()
+        found = Airports.find([{"column": "code", "operator": "LIKE", "value": 12}])
+        self.assertEqual(found, [])
+        found = Airports.find([{"column": "code", "operator": "LIKE", "value": "12%"}])
+        self.assertEqual([a["code"] for a in found], ["123"])
+
+
+if __name__ == "__main__":
+    unittest.main()
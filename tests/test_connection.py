@@ -0,0 +1,96 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from app.base.connection import ConnectionPool, bind_pool, db_connection, get_storage_profile, storage_profile
+from app.base.exceptions import PoolTimeoutError
+
+
+class PoolTest(unittest.TestCase):
+    def setUp(self):
+        tmp = self.enterContext(tempfile.TemporaryDirectory())
+        self.database = os.path.join(tmp, "pool.db")
+        self.pool = ConnectionPool(2, timeout=0.05, database=self.database)
+        self.addCleanup(self.pool.close)
+
+    def test_nested_use_shares_the_connection(self):
+        with self.pool.connection() as outer:
+            with self.pool.connection() as inner:
+                self.assertIs(inner, outer)
+            self.assertEqual(self.pool.stats()["in_use"], 1)
+        self.assertEqual(self.pool.stats()["idle"], 1)
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            with self.pool.connection():
+                pass
+        self.assertEqual(self.pool.stats()["opens"], 1)
+        self.assertEqual(self.pool.stats()["hits"], 4)
+
+    def test_waits_then_times_out(self):
+        held, release = threading.Event(), threading.Event()
+
+        def hold():
+            with self.pool.connection():
+                held.set()
+                release.wait()
+
+        threads = [threading.Thread(target=hold) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            held.wait()
+            held.clear()
+        try:
+            with self.assertRaises(PoolTimeoutError):
+                with self.pool.connection():
+                    pass
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.pool.stats()["waits"], 1)
+        with self.pool.connection():
+            pass
+
+    def test_rolls_back_on_error(self):
+        with self.pool.connection() as conn:
+            conn.execute("CREATE TABLE t (x INTEGER)")
+        with self.assertRaises(RuntimeError):
+            with self.pool.connection() as conn:
+                conn.execute("INSERT INTO t VALUES (1)")
+                raise RuntimeError
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+
+    def test_profile_is_applied_on_checkout(self):
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+        self.pool.profile = "durable"
+        with self.pool.connection() as conn:
+            # FULL
+            self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 2)
+
+    def test_bound_pool(self):
+        bind_pool(self.pool)
+        self.addCleanup(bind_pool, None)
+        with db_connection() as conn:
+            database = conn.execute("PRAGMA database_list").fetchone()[2]
+        self.assertEqual(os.path.realpath(database), os.path.realpath(self.database))
+
+    def test_storage_profile_restores(self):
+        previous = get_storage_profile()
+        with storage_profile("bulk-load"):
+            self.assertEqual(get_storage_profile(), "bulk-load")
+        self.assertEqual(get_storage_profile(), previous)
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            ConnectionPool(0)
+        with self.assertRaises(ValueError):
+            ConnectionPool(1, profile="fast")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+from app.models import Aircrafts, Airports, Flights, Pilots
+from app.models import details
+from app.models.base_model import DB
+from tests.support import DatabaseTestCase
+
+
+class DetailsTest(DatabaseTestCase):
+    settings = {"ON_DELETE": "CASCADE", "ON_UPDATE": "CASCADE", "DENORMALIZE_DETAILS": True}
+
+    def assertCurrent(self):
+        """Every details table holds what the joined query gives, and the reads match."""
+        for model in details._models():
+            table, key = details.details_table(model), f"{model.__name__}_{model.primary_key}"
+            with self.subTest(table=table):
+                self.assertEqual(
+                    self.fetch(f"SELECT * FROM {table} ORDER BY {key}"),
+                    self.fetch(f"{DB.get_meta(model).details_query} ORDER BY {key}"),
+                )
+
+        filters = [{"column": "DepartureAirport_country", "operator": "STARTS WITH", "value": "U"}]
+        denormalized = [
+            Flights.find_all_with_details(),
+            Flights.find_all_with_details(filters, order_by="departure_time", limit=5),
+            Pilots.find_all_with_details(),
+        ]
+        DB.__DETAILS_TABLES__.clear()
+        try:
+            joined = [
+                Flights.find_all_with_details(),
+                Flights.find_all_with_details(filters, order_by="departure_time", limit=5),
+                Pilots.find_all_with_details(),
+            ]
+        finally:
+            DB.__DETAILS_TABLES__.update(model.__name__ for model in details._models())
+        self.assertEqual(denormalized, joined)
+
+    def first_flight(self) -> dict:
+        return Flights.find(order_by="flight_id", limit=1)[0]
+
+    def test_filled_on_create(self):
+        self.assertEqual(DB.__DETAILS_TABLES__, {"Flights", "Pilots"})
+        self.assertEqual(len(self.fetch("SELECT * FROM FlightsDetails")), len(Flights.find()))
+        self.assertCurrent()
+
+    def test_insert(self):
+        Flights("2026-01-01 10:00:00", "2026-01-01 12:30:00", "On Time", 1, "DEN", "LHR", "OK-TSU").insert()
+        Flights.insert_many(
+            [Flights("2026-01-02 10:00:00", None, "Delayed", 2, "LHR", "DEN", "OK-TSU")]
+        )
+        Airports("ZZZ", "New Airport", "Zambia").insert()
+        Pilots("New", "Pilot", "ZZZ", "Airline").insert()
+        self.assertCurrent()
+
+    def test_update(self):
+        flight = self.first_flight()
+        Flights.update(
+            {"pilot_id": 2, "departure_id": "LHR"},
+            [{"column": "flight_id", "operator": "=", "value": flight["flight_id"]}],
+        )
+        self.assertCurrent()
+        Flights.update_many([(flight["flight_id"], {"aircraft_id": None}), (-1, {"status": "Delayed"})])
+        self.assertCurrent()
+        Flights.update({"status": "Delayed"})
+        self.assertCurrent()
+
+    def test_delete(self):
+        Flights.delete([{"column": "flight_id", "operator": "=", "value": self.first_flight()["flight_id"]}])
+        self.assertCurrent()
+
+    def test_parent_updates(self):
+        flight = self.first_flight()
+        Airports.update({"country": "Elsewhere"}, [{"column": "code", "operator": "=", "value": flight["departure_id"]}])
+        self.assertCurrent()
+        Pilots.update({"last_name": "Renamed"}, [{"column": "pilot_id", "operator": "=", "value": flight["pilot_id"]}])
+        self.assertCurrent()
+        Aircrafts.update({"capacity": 1}, [{"column": "registration", "operator": "=", "value": flight["aircraft_id"]}])
+        self.assertCurrent()
+
+    def test_parent_cascades(self):
+        flight = self.first_flight()
+        # ON UPDATE CASCADE changes the key in Flights and Pilots too
+        Airports.update({"code": "XXX"}, [{"column": "code", "operator": "=", "value": flight["departure_id"]}])
+        self.assertCurrent()
+        Pilots.update({"pilot_id": 100}, [{"column": "pilot_id", "operator": "=", "value": flight["pilot_id"]}])
+        self.assertCurrent()
+        Aircrafts.delete([{"column": "registration", "operator": "=", "value": flight["aircraft_id"]}])
+        self.assertCurrent()
+        Airports.delete([{"column": "code", "operator": "=", "value": "XXX"}])
+        self.assertCurrent()
+
+    def test_disable(self):
+        details.disable_details()
+        self.assertEqual(DB.__DETAILS_TABLES__, set())
+        self.assertEqual(self.fetch("SELECT name FROM sqlite_schema WHERE name GLOB '*Details*'"), [])
+        Flights.update({"status": "Delayed"})
+        details.enable_details()
+        self.assertCurrent()
+
+
+if __name__ == "__main__":
+    unittest.main()
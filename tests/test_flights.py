@@ -0,0 +1,96 @@
+import unittest
+from dataclasses import asdict
+
+from app.base.connection import db_connection
+from app.base.exceptions import ScheduleConflictError
+from app.models import Aircrafts, Flights, Pilots
+from tests.support import DatabaseTestCase
+
+
+def flight(departure: str, arrival: str, status: str = "On Time", **changes) -> Flights:
+    values = {"pilot_id": 100, "departure_id": "DEN", "destination_id": "LHR", "aircraft_id": "T-TEST"}
+    values.update(changes)
+    return Flights(f"2026-01-01 {departure}:00", f"2026-01-01 {arrival}:00", status, **values)
+
+
+class ConflictTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        Pilots("Test", "Pilot", "DEN", "Airline", 100).insert()
+        Aircrafts("T-TEST", "Boeing 737", "Passenger", 180).insert()
+
+    def count(self) -> int:
+        return len(Flights.find([{"column": "pilot_id", "operator": "=", "value": 100}]))
+
+    def test_overlap_is_refused(self):
+        flight("08:00", "10:00").insert()
+        with self.assertRaises(ScheduleConflictError):
+            flight("09:00", "11:00").insert()
+        with self.assertRaises(ScheduleConflictError):
+            flight("07:00", "08:30", aircraft_id="OK-TSU").insert()
+        flight("10:00", "11:00").insert()
+        self.assertEqual(self.count(), 2)
+
+    def test_cancelled_flights_dont_conflict(self):
+        flight("08:00", "10:00", "Cancelled").insert()
+        flight("08:00", "10:00").insert()
+        flight("09:00", "11:00", "Cancelled").insert()
+        self.assertEqual(self.count(), 3)
+
+    def test_long_flight_behind_a_stored_overlap(self):
+        # the bulk path doesn't check, so the stored schedule already overlaps
+        Flights.insert_many([flight("08:00", "20:00"), flight("09:00", "10:00")])
+        conflicts = flight("11:00", "12:00").find_conflicts()
+        self.assertEqual([c["departure_time"] for c in conflicts], ["2026-01-01 08:00:00"])
+        with self.assertRaises(ScheduleConflictError):
+            flight("11:00", "12:00").insert()
+
+    def airline(self) -> str:
+        return Pilots.find([{"column": "pilot_id", "operator": "=", "value": 100}])[0]["airline"]
+
+    def test_conflict_keeps_the_callers_transaction(self):
+        flight("08:00", "10:00").insert()
+        with db_connection() as connection:
+            connection.execute("BEGIN")
+            connection.execute("UPDATE Pilots SET airline = 'Changed' WHERE pilot_id = 100")
+            flight("12:00", "13:00").insert()
+            with self.assertRaises(ScheduleConflictError):
+                flight("09:00", "11:00").insert()
+            self.assertTrue(connection.in_transaction)
+            connection.commit()
+        self.assertEqual(self.airline(), "Changed")
+        self.assertEqual(self.count(), 2)
+
+    def test_insert_leaves_the_callers_transaction_open(self):
+        with db_connection() as connection:
+            connection.execute("BEGIN")
+            connection.execute("UPDATE Pilots SET airline = 'Changed' WHERE pilot_id = 100")
+            flight("12:00", "13:00").insert()
+            self.assertTrue(connection.in_transaction)
+            connection.rollback()
+        self.assertEqual(self.airline(), "Airline")
+        self.assertEqual(self.count(), 0)
+
+    def test_schedule_conflicts_of_given_flights(self):
+        given = [
+            {**asdict(flight("08:00", "10:00")), "flight_id": 1},
+            asdict(flight("09:00", "11:00")),
+            asdict(flight("09:30", "09:45", "Cancelled")),
+            {**asdict(flight("09:30", "09:45", pilot_id=1, aircraft_id="OK-TSU")), "flight_id": 0},
+            asdict(flight("09:40", "09:50", pilot_id=1, aircraft_id="OK-TSU")),
+        ]
+        report = Flights.schedule_conflicts(given)
+        pairs = sorted((c["resource"], c["positions"], c["flight_ids"]) for c in report)
+        self.assertEqual(
+            pairs,
+            [
+                ("aircraft_id", (0, 1), (1, None)),
+                ("aircraft_id", (3, 4), (0, None)),
+                ("pilot_id", (0, 1), (1, None)),
+                ("pilot_id", (3, 4), (0, None)),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
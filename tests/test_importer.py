@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+import unittest
+
+from app.importer import ParentKeys, import_file, iter_json_array
+from app.models import Airports, Flights
+from tests.support import DatabaseTestCase
+
+
+class JsonArrayTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "items.json")
+
+    def read(self, text: str, read_size: int) -> list:
+        with open(self.path, "w") as f:
+            f.write(text)
+        return list(iter_json_array(self.path, read_size))
+
+    def test_items(self):
+        for text, items in [
+            ("[]", []),
+            (" [ ]\n", []),
+            ('[{"a": 1}]', [{"a": 1}]),
+            ('\n[ {"a": "x,]"} ,\n {"b": [1, 2]} ]\n', [{"a": "x,]"}, {"b": [1, 2]}]),
+        ]:
+            for read_size in (1, 3, 1 << 16):
+                with self.subTest(text=text, read_size=read_size):
+                    self.assertEqual(self.read(text, read_size), items)
+
+    def test_malformed(self):
+        for text in [
+            '[,,{"a":1},,{"a":2},]',
+            '[{"a": 1},]',
+            '[,{"a": 1}]',
+            '[{"a": 1},,{"a": 2}]',
+            '[{"a": 1} {"a": 2}]',
+            '[{"a": 1}',
+            '{"a": 1}',
+            "",
+        ]:
+            for read_size in (1, 3, 1 << 16):
+                with self.subTest(text=text, read_size=read_size), self.assertRaises(ValueError):
+                    self.read(text, read_size)
+
+
+class ImportTest(DatabaseTestCase):
+    def write(self, name: str, lines: list[str]) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    def test_rejects_are_counted_and_written(self):
+        flight = {
+            "departure_time": "2026-01-01T10:00:00",
+            "arrival_time": "2026-01-01 12:00:00",
+            "status": "On Time",
+            "pilot_id": "1",
+            "departure_id": "DEN",
+            "destination_id": "LHR",
+            "aircraft_id": "OK-TSU",
+        }
+        records = [
+            flight,
+            {**flight, "departure_time": "tomorrow"},
+            {**flight, "pilot_id": 999},
+            {**flight, "pilot_id": None},
+            {**flight, "gate": "A1"},
+            [1, 2],
+            {**flight, "flight_id": 1},
+        ]
+        path = self.write("flights.jsonl", [json.dumps(r) for r in records])
+        rejects = os.path.join(self.tmp.name, "rejects.jsonl")
+        before = len(Flights.find())
+
+        report = import_file(Flights, path, rejects_path=rejects)
+
+        self.assertEqual((report.read, report.inserted, report.rejected), (7, 1, 6))
+        self.assertEqual(
+            report.reasons,
+            {
+                "bad departure_time": 1,
+                "unknown pilot_id": 1,
+                "missing pilot_id": 1,
+                "unknown columns": 1,
+                "not an object": 1,
+                "constraint_primarykey": 1,
+            },
+        )
+        with open(rejects) as f:
+            self.assertEqual(len(f.readlines()), 6)
+        self.assertEqual(len(Flights.find()), before + 1)
+        stored = Flights.find([{"column": "departure_time", "operator": "=", "value": "2026-01-01 10:00:00"}])
+        self.assertEqual([(f["pilot_id"], f["arrival_time"]) for f in stored], [(1, "2026-01-01 12:00:00")])
+
+    def test_parents_imported_first_are_known(self):
+        airports = self.write("airports.csv", ["code,name,country", "ZZZ,New Airport,Zambia"])
+        flights = self.write(
+            "flights.json",
+            [
+                json.dumps(
+                    [
+                        {
+                            "departure_time": "2026-01-01 10:00:00",
+                            "arrival_time": "2026-01-01 12:00:00",
+                            "status": "On Time",
+                            "pilot_id": 1,
+                            "departure_id": "ZZZ",
+                            "destination_id": "DEN",
+                            "aircraft_id": "OK-TSU",
+                        }
+                    ]
+                )
+            ],
+        )
+        parents = ParentKeys()
+        self.assertEqual(import_file(Airports, airports, parents=parents).inserted, 1)
+        report = import_file(Flights, flights, parents=parents)
+        self.assertEqual((report.inserted, report.rejected), (1, 0))
+
+    def test_malformed_array_aborts(self):
+        path = self.write("flights.json", ['[{"status": "On Time"},]'])
+        with self.assertRaises(ValueError):
+            import_file(Flights, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from app.base.connection import db_connection
+from app.models import Flights
+from app.models import parallel
+from tests.support import DatabaseTestCase
+
+
+class ParallelTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        with db_connection() as connection:
+            # the latest departure in another ISO form, past the rendered upper bounds
+            connection.execute(
+                "UPDATE Flights SET departure_time = replace(departure_time, ' ', 'T') || '.5' "
+                "WHERE flight_id = (SELECT flight_id FROM Flights ORDER BY departure_time DESC LIMIT 1)"
+            )
+            connection.execute("UPDATE Flights SET pilot_id = NULL WHERE flight_id = 1")
+            connection.commit()
+
+    def test_group_by_matches(self):
+        for kwargs in [
+            {"group_on": "departure_id", "agg_on": "flight_id"},
+            {
+                "group_on": ["DepartureAirport.country", "departure_time"],
+                "agg_on": [("COUNT", "*"), ("AVG", "Aircrafts.capacity"), ("MAX", "pilot_id")],
+                "buckets": {"departure_time": "day"},
+            },
+        ]:
+            for partition_on in (None, "departure_time", "pilot_id"):
+                with self.subTest(kwargs=kwargs, partition_on=partition_on):
+                    self.assertEqual(
+                        parallel.group_by(Flights, **kwargs, partition_on=partition_on, workers=3),
+                        Flights.group_by(**kwargs),
+                    )
+
+    def test_find_all_with_details_matches(self):
+        for order_by in (None, "departure_time", "status"):
+            for partition_on in (None, "departure_time", "pilot_id"):
+                with self.subTest(order_by=order_by, partition_on=partition_on):
+                    self.assertEqual(
+                        list(
+                            parallel.find_all_with_details(
+                                Flights, order_by=order_by, partition_on=partition_on, workers=3, rows="tuple"
+                            )
+                        ),
+                        list(Flights.find_all_with_details(order_by=order_by, rows="tuple")),
+                    )
+
+    def test_every_row_in_one_partition(self):
+        for column in ("departure_time", "flight_id", "pilot_id"):
+            counts = [len(Flights.find(part)) for part in parallel.partitions(Flights, 4, column)]
+            with self.subTest(column=column):
+                self.assertEqual(sum(counts), len(Flights.find()))
+
+
+if __name__ == "__main__":
+    unittest.main()
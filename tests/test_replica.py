@@ -0,0 +1,139 @@
+import os
+import shutil
+import sqlite3
+import unittest
+
+from app.base.exceptions import ForeignKeyConstraintError
+from app.base.connection import db_connection
+from app.base.replica import MemoryReplica, decode_entry, disable_replica, enable_replica, encode_entry
+from app.models import Airports, Flights, Pilots
+from tests.support import DatabaseTestCase
+
+
+class JournalReplayTest(DatabaseTestCase):
+    settings = {"ON_DELETE": "CASCADE", "ON_UPDATE": "CASCADE"}
+
+    def setUp(self):
+        super().setUp()
+        # no snapshot thread, so everything after enable_replica is only in the journal
+        self.replica = enable_replica(durability="journal", snapshot_interval=None)
+        self.addCleanup(disable_replica)
+
+    def write(self):
+        Flights("2026-01-01 10:00:00", "2026-01-01 12:30:00", "On Time", 1, "DEN", "LHR", "OK-TSU").insert()
+        Flights.insert_many(
+            [Flights(f"2026-02-{day:02d} 10:00:00", None, "Delayed", 2, "LHR", "DEN", "OK-TSU") for day in range(1, 20)]
+        )
+        with self.assertRaises(ForeignKeyConstraintError):
+            Flights.insert_many([Flights("2026-03-01 10:00:00", None, "Delayed", 999, "LHR", "DEN", "OK-TSU")])
+        Flights.update({"status": "Cancelled"}, [{"column": "pilot_id", "operator": "=", "value": 2}])
+        Flights.update_many([(1, {"arrival_time": None}), (2, {"departure_id": "BKK"})])
+        Flights.delete([{"column": "flight_id", "operator": "=", "value": 3}])
+        Airports.update({"code": "XXX"}, [{"column": "code", "operator": "=", "value": "DEN"}])
+        Pilots.delete([{"column": "pilot_id", "operator": "=", "value": 4}])
+
+    def crash(self, name: str = "crashed") -> tuple[str, str]:
+        """Copies the file and journal as a crash would leave them, without a last snapshot."""
+        database = os.path.join(self.tmp.name, f"{name}.db")
+        journal = f"{database}-replica-journal"
+        with self.replica.lock:
+            shutil.copy(self.replica.database, database)
+            shutil.copy(self.replica.journal_path, journal)
+        return database, journal
+
+    def recover(self, database: str) -> list[str]:
+        recovered = MemoryReplica(database, snapshot_interval=None).open()
+        try:
+            return list(recovered._memory.iterdump())
+        finally:
+            recovered.close()
+
+    def live(self) -> list[str]:
+        with self.replica.lock:
+            return list(self.replica._memory.iterdump())
+
+    def test_replay_after_crash(self):
+        before = self.live()
+        self.write()
+        expected = self.live()
+        self.assertNotEqual(expected, before)
+
+        database, _ = self.crash()
+        self.assertEqual(self.recover(database), expected)
+        # the recovery's snapshot has the writes, and a second start doesn't apply them again
+        self.assertEqual(self.recover(database), expected)
+
+    def test_partly_written_entry_is_ignored(self):
+        self.write()
+        expected = self.live()
+        Flights.update({"status": "Delayed"})
+
+        database, journal = self.crash()
+        with open(journal, "ab") as f:
+            f.truncate(f.tell() - 1)
+        self.assertEqual(self.recover(database), expected)
+
+    def test_journal_older_than_the_file_is_ignored(self):
+        # inserts, which would add the rows twice if replayed on the newer file
+        Flights.insert_many(
+            [Flights(f"2026-04-{day:02d} 10:00:00", None, "On Time", 5, "LHR", "BKK", "OK-TSU") for day in range(1, 6)]
+        )
+        _, old_journal = self.crash("old")
+        self.replica.snapshot()
+        expected = self.live()
+
+        database, journal = self.crash()
+        shutil.copy(old_journal, journal)
+        self.assertEqual(self.recover(database), expected)
+
+    def test_unreadable_entry_is_ignored(self):
+        self.write()
+        expected = self.live()
+
+        database, journal = self.crash()
+        # e.g. a pickle left by an older version, never loaded
+        data = b"\x80\x04K\x01."
+        with open(journal, "ab") as f:
+            f.write(len(data).to_bytes(4, "big") + data)
+        self.assertEqual(self.recover(database), expected)
+
+    def test_entries_round_trip(self):
+        entry = [("INSERT INTO t VALUES (?, ?, ?)", (b"\x00\xff", 1.5, None), False), ("DELETE FROM t", [], False)]
+        self.assertEqual(decode_entry(encode_entry(entry)), [(sql, list(p), m) for sql, p, m in entry])
+
+
+class WriteThroughTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.replica = enable_replica(durability="write-through")
+        self.addCleanup(disable_replica)
+
+    def on_disk(self) -> list[str]:
+        disk = sqlite3.connect(self.database)
+        try:
+            return list(disk.iterdump())
+        finally:
+            disk.close()
+
+    def test_commits_reach_the_file(self):
+        Pilots("New", "Pilot", "DEN", "Airline", 500).insert()
+        with self.replica.lock:
+            self.assertEqual(self.on_disk(), list(self.replica._memory.iterdump()))
+
+    def test_diverged_file_is_replaced(self):
+        disk = sqlite3.connect(self.database)
+        disk.execute("INSERT INTO Pilots VALUES (500, 'Other', 'Pilot', 'LHR', 'Airline')")
+        disk.commit()
+        disk.close()
+
+        # the replayed insert hits the row only the file has
+        Pilots("New", "Pilot", "DEN", "Airline", 500).insert()
+        with self.replica.lock:
+            self.assertEqual(self.on_disk(), list(self.replica._memory.iterdump()))
+        with db_connection() as connection:
+            row = connection.execute("SELECT first_name FROM Pilots WHERE pilot_id = 500").fetchone()
+        self.assertEqual(row[0], "New")
+
+
+if __name__ == "__main__":
+    unittest.main()
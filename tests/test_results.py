@@ -0,0 +1,20 @@
+import unittest
+
+from app.models.results import ResultSet
+
+
+class SharedValuesTest(unittest.TestCase):
+    def test_equal_strings_are_shared(self):
+        rows = [(1, "".join(["Den", "ver"])), (2, "".join(["Denv", "er"]))]
+        result = ResultSet.with_shared_values(["id", "name"], rows, 1)
+        self.assertEqual(result.column("name"), ["Denver", "Denver"])
+        self.assertIs(result[0][1], result[1][1])
+
+    def test_types_are_kept(self):
+        rows = [(1, 1, 1.0, True), (2, 1.0, 1, 1)]
+        result = ResultSet.with_shared_values(["id", "a", "b", "c"], rows, 1)
+        self.assertEqual([[type(v) for v in row] for row in result], [[type(v) for v in row] for row in rows])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from app.models import Flights
+from app.models.base_model import DB
+from app.models.routes import RouteGraph, TIME_FORMAT, disable_change_log, enable_change_log
+from tests.support import DatabaseTestCase
+
+AIRPORTS = ["DEN", "BOG", "CGK", "IST", "MCO", "PKX"]
+START = datetime(2026, 1, 1)
+
+
+def network(count: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    flights = []
+    for i in range(count):
+        departure = START + timedelta(minutes=rng.randrange(0, 36 * 60, 5))
+        origin, destination = rng.sample(AIRPORTS, 2)
+        flights.append(
+            {
+                "departure_time": departure.strftime(TIME_FORMAT),
+                "arrival_time": (departure + timedelta(minutes=rng.randrange(30, 300, 5))).strftime(TIME_FORMAT),
+                "status": "Cancelled" if i % 10 == 0 else "On Time",
+                "pilot_id": 1,
+                "departure_id": origin,
+                "destination_id": destination,
+                "aircraft_id": "OK-TSU",
+            }
+        )
+    return flights
+
+
+def pareto(flights: list[dict], origin: str, destination: str, depart_after: str, max_legs: int, min_connect: int):
+    """(legs, arrival) of the fewest legs journey and of every later one arriving earlier, by brute force."""
+    legs = [f for f in flights if f["status"] != "Cancelled"]
+    connect = timedelta(minutes=min_connect)
+    earliest = {}
+
+    def walk(airport: str, ready: datetime, k: int):
+        for f in legs:
+            departure = datetime.fromisoformat(f["departure_time"])
+            if f["departure_id"] != airport or departure < ready:
+                continue
+            arrival = datetime.fromisoformat(f["arrival_time"])
+            if f["destination_id"] == destination:
+                earliest[k] = min(earliest.get(k, arrival), arrival)
+            elif k < max_legs:
+                walk(f["destination_id"], arrival + connect, k + 1)
+
+    walk(origin, datetime.fromisoformat(depart_after), 1)
+    front, best = [], None
+    for k in sorted(earliest):
+        if best is None or earliest[k] < best:
+            best = earliest[k]
+            front.append((k, best.strftime(TIME_FORMAT)))
+    return front
+
+
+class RouteGraphTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        Flights.delete()
+        self.flights = network(60, seed=7)
+        Flights.insert_many(self.flights)
+
+    def assertMatchesBruteForce(self, graph: RouteGraph, flights: list[dict]):
+        for origin in AIRPORTS:
+            for destination in AIRPORTS:
+                if origin == destination:
+                    continue
+                for depart_after in ("2026-01-01 00:00:00", "2026-01-01 09:30:00"):
+                    journeys = graph.connections(origin, destination, depart_after, max_legs=3, max_hours=None)
+                    found = [(len(j), j[-1]["arrival_time"]) for j in journeys]
+                    with self.subTest(origin=origin, destination=destination, depart_after=depart_after):
+                        self.assertEqual(found, pareto(flights, origin, destination, depart_after, 3, 45))
+                        for journey in journeys:
+                            self.assertEqual(journey[0]["departure_id"], origin)
+                            self.assertEqual(journey[-1]["destination_id"], destination)
+                            for leg, following in zip(journey, journey[1:]):
+                                self.assertEqual(leg["destination_id"], following["departure_id"])
+                                self.assertLessEqual(
+                                    datetime.fromisoformat(leg["arrival_time"]) + timedelta(minutes=45),
+                                    datetime.fromisoformat(following["departure_time"]),
+                                )
+
+    def stored(self) -> list[dict]:
+        return [{k: v for k, v in f.items() if k != "flight_id"} for f in Flights.find()]
+
+    def change(self):
+        Flights.insert_many(network(10, seed=8))
+        Flights.update({"status": "Cancelled"}, [{"column": "departure_id", "operator": "=", "value": "DEN"}])
+        Flights.update_many([(2, {"arrival_time": "2026-01-01 23:00:00"}), (3, {"destination_id": "IST"})])
+        Flights.delete([{"column": "destination_id", "operator": "=", "value": "PKX"}])
+
+    def test_search(self):
+        self.assertMatchesBruteForce(RouteGraph(), self.flights)
+
+    def test_refresh_with_change_log(self):
+        enable_change_log()
+        graph = RouteGraph()
+        graph.build()
+        self.change()
+        self.assertMatchesBruteForce(graph, self.stored())
+
+    def test_refresh_without_change_log(self):
+        disable_change_log()
+        graph = RouteGraph()
+        graph.build()
+        self.change()
+        self.assertMatchesBruteForce(graph, self.stored())
+
+    def test_drop_all_with_change_log(self):
+        enable_change_log()
+        DB.drop_all()
+        DB.intialise_all()
+        self.assertEqual(Flights.find(), [])
+
+    def test_no_route(self):
+        graph = RouteGraph()
+        self.assertEqual(graph.connections("DEN", "XXX", "2026-01-01 00:00:00"), [])
+        self.assertEqual(graph.connections("DEN", "DEN", "2026-01-01 00:00:00"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from app.base.connection import db_connection
+from app.models import Aircrafts, Airports, Flights, Pilots
+from app.models import summaries
+from app.models.summaries import SUMMARIES, _summary_query
+from tests.support import DatabaseTestCase
+
+
+class SummariesTest(DatabaseTestCase):
+    settings = {"ON_DELETE": "CASCADE", "ON_UPDATE": "CASCADE", "MATERIALIZE_SUMMARIES": True}
+
+    def assertCurrent(self):
+        """Every summary table holds what recomputing it from Flights gives."""
+        for table, (keys, _, _) in SUMMARIES.items():
+            order = ", ".join(keys)
+            with self.subTest(table=table):
+                self.assertEqual(
+                    self.fetch(f"SELECT * FROM {table} ORDER BY {order}"),
+                    self.fetch(f"SELECT * FROM ({_summary_query(table)}) ORDER BY {order}"),
+                )
+
+    def first_flight(self) -> dict:
+        return Flights.find(order_by="flight_id", limit=1)[0]
+
+    def test_filled_on_create(self):
+        self.assertTrue(self.fetch("SELECT * FROM RouteSummary"))
+        self.assertCurrent()
+
+    def test_insert(self):
+        Flights("2026-01-01 10:00:00", "2026-01-01 12:30:00", "On Time", 1, "DEN", "LHR", "OK-TSU").insert(
+            check_conflicts=False
+        )
+        Flights.insert_many(
+            [
+                Flights("2026-01-02 10:00:00", "2026-01-02 11:00:00", "Cancelled", 2, "LHR", "DEN", "OK-TSU"),
+                Flights("2026-01-03 10:00:00", None, "Delayed", 2, "LHR", "DEN", "OK-TSU"),
+                Flights("not a time", "2026-01-03 11:00:00", "On Time", 3, "DEN", "BKK", "OK-TSU"),
+            ]
+        )
+        self.assertCurrent()
+
+    def test_update(self):
+        flight = self.first_flight()
+        Flights.update(
+            {"arrival_time": "2025-04-18 10:00:00", "pilot_id": 2},
+            [{"column": "flight_id", "operator": "=", "value": flight["flight_id"]}],
+        )
+        self.assertCurrent()
+        Flights.update({"status": "Cancelled"}, [{"column": "departure_id", "operator": "=", "value": "DEN"}])
+        self.assertCurrent()
+        Flights.update_many(
+            [(flight["flight_id"], {"destination_id": "DEN", "status": "On Time"}), (-1, {"status": "Delayed"})]
+        )
+        self.assertCurrent()
+
+    def test_delete(self):
+        Flights.delete([{"column": "flight_id", "operator": "=", "value": self.first_flight()["flight_id"]}])
+        self.assertCurrent()
+        Flights.delete()
+        self.assertEqual(self.fetch("SELECT * FROM PilotHours"), [])
+        self.assertCurrent()
+
+    def test_parent_cascades(self):
+        flight = self.first_flight()
+        Airports.update({"code": "XXX"}, [{"column": "code", "operator": "=", "value": flight["departure_id"]}])
+        self.assertCurrent()
+        Pilots.update({"pilot_id": 100}, [{"column": "pilot_id", "operator": "=", "value": flight["pilot_id"]}])
+        self.assertCurrent()
+        Aircrafts.delete([{"column": "registration", "operator": "=", "value": flight["aircraft_id"]}])
+        self.assertCurrent()
+        Airports.delete([{"column": "code", "operator": "=", "value": "XXX"}])
+        self.assertCurrent()
+
+    def test_reads_match_without_tables(self):
+        Flights.update({"status": "Cancelled"}, [{"column": "pilot_id", "operator": "=", "value": 1}])
+        materialized = [summaries.route_summary(), summaries.aircraft_utilisation(), summaries.pilot_hours()]
+        summaries.disable_summaries()
+        self.assertEqual(
+            [summaries.route_summary(), summaries.aircraft_utilisation(), summaries.pilot_hours()], materialized
+        )
+
+    def test_rebuild(self):
+        with db_connection() as connection:
+            connection.execute("DELETE FROM AircraftUtilisation")
+            connection.commit()
+        summaries.rebuild_summaries()
+        self.assertCurrent()
+        summaries.disable_summaries()
+        with self.assertRaises(ValueError):
+            summaries.rebuild_summaries()
+
+
+if __name__ == "__main__":
+    unittest.main()
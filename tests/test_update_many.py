@@ -0,0 +1,55 @@
+import contextlib
+import io
+import unittest
+
+from app.base.exceptions import ForeignKeyConstraintError
+from app.base.profiler import profiler
+from app.models import Flights
+from tests.support import DatabaseTestCase
+
+
+class UpdateManyTest(DatabaseTestCase):
+    def statuses(self) -> dict:
+        return {f["flight_id"]: f["status"] for f in Flights.find()}
+
+    def test_results_per_pair(self):
+        results = Flights.update_many(
+            [(1, {"status": "Delayed"}), (999, {"status": "Delayed"}), (2, {"status": "Cancelled", "pilot_id": 3})],
+            batch_size=2,
+        )
+        self.assertEqual(results, [1, 0, 1])
+        stored = {f["flight_id"]: f for f in Flights.find()}
+        self.assertEqual(stored[1]["status"], "Delayed")
+        self.assertEqual((stored[2]["status"], stored[2]["pilot_id"]), ("Cancelled", 3))
+
+    def test_constraint_error_rolls_everything_back(self):
+        before = self.statuses()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            with self.assertRaisesRegex(ForeignKeyConstraintError, "row 2"):
+                Flights.update_many(
+                    [(1, {"status": "Delayed"}), (2, {"status": "Delayed"}), (3, {"pilot_id": 999})],
+                    batch_size=2,
+                )
+        self.assertEqual(self.statuses(), before)
+        self.assertEqual(output.getvalue(), "")
+
+    def test_invalid_changes(self):
+        for update in [(1, {}), (1, {"gate": "A1"}), (1, {"flight_id": 2})]:
+            with self.subTest(update=update), self.assertRaises(ValueError):
+                Flights.update_many([update])
+
+    def test_existence_check_is_profiled(self):
+        profiler.reset()
+        profiler.enabled = True
+        try:
+            Flights.update_many([(1, {"status": "Delayed"})])
+        finally:
+            profiler.enabled = False
+        queries = [r["query"] for r in profiler.report()]
+        profiler.reset()
+        self.assertTrue(any(q.startswith("SELECT flight_id FROM Flights WHERE flight_id IN") for q in queries), queries)
+
+
+if __name__ == "__main__":
+    unittest.main()